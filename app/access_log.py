@@ -0,0 +1,208 @@
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import time
+from contextvars import ContextVar
+from datetime import UTC, datetime
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.config import (
+    ACCESS_LOG_ENABLED,
+    ACCESS_LOG_SAMPLE_RATE,
+    ACCESS_LOG_SLOW_MS,
+    LOG_LEVEL,
+    LOG_QUEUE_SIZE,
+)
+
+logger = logging.getLogger("gateway")
+access_logger = logging.getLogger("gateway.access")
+
+# Wpis bieżącego zapytania; dependency i proxy() dopisują do niego swoje pola
+current_entry: ContextVar[dict | None] = ContextVar("access_log_entry", default=None)
+
+
+def note(**fields) -> None:
+    """Adds fields to the access log entry of the request being handled."""
+    entry = current_entry.get()
+    if entry is not None:
+        entry.update(fields)
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; access entries are logged as they are."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = getattr(record, "access", None)
+        if entry is None:
+            entry = {
+                "ts": datetime.fromtimestamp(record.created, UTC).isoformat(),
+                "level": record.levelname,
+                "logger": record.name,
+                "message": record.getMessage(),
+            }
+            if record.exc_info:
+                entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands records to the listener thread without blocking or formatting on the
+    event loop. When the queue is full (stdout cannot keep up) records are
+    dropped and counted instead of stalling requests.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Formatowanie odbywa się dopiero w wątku listenera
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_handler: DroppingQueueHandler | None = None
+_listener: logging.handlers.QueueListener | None = None
+
+
+def start_logging() -> None:
+    """Routes the gateway loggers through a queue flushed by a background thread."""
+    global _handler, _listener
+    if _listener is not None:
+        return
+    log_queue: queue.Queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonFormatter())
+    _handler = DroppingQueueHandler(log_queue)
+    _listener = logging.handlers.QueueListener(log_queue, output)
+    _listener.start()
+
+    logger.addHandler(_handler)
+    logger.setLevel(LOG_LEVEL)
+    logger.propagate = False
+    # Logi dostępowe nie zależą od poziomu logów aplikacji
+    access_logger.setLevel(logging.INFO)
+
+
+def stop_logging() -> None:
+    """Flushes queued records on shutdown."""
+    global _handler, _listener
+    if _listener is None:
+        return
+    logger.removeHandler(_handler)
+    _listener.stop()
+    _handler = None
+    _listener = None
+
+
+def dropped_records() -> int:
+    return _handler.dropped if _handler is not None else 0
+
+
+def should_log(status_code: int, duration_ms: float) -> bool:
+    """Errors and slow requests are always logged, the rest is sampled."""
+    if status_code >= 400 or duration_ms >= ACCESS_LOG_SLOW_MS:
+        return True
+    return ACCESS_LOG_SAMPLE_RATE >= 1 or random.random() < ACCESS_LOG_SAMPLE_RATE
+
+
+class AccessLogMiddleware:
+    """
+    Raw ASGI middleware writing one JSON line per request: method, path,
+    status, duration and body sizes, plus whatever the handlers added through
+    `note()` (auth time, role, upstream instance, status and phase timings).
+    WebSocket connections get one line when they end, with message counts
+    instead of body sizes.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "websocket" and ACCESS_LOG_ENABLED:
+            await self.websocket(scope, receive, send)
+            return
+        if scope["type"] != "http" or not ACCESS_LOG_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        entry = {"status": 500, "request_bytes": 0, "response_bytes": 0}
+        token = current_entry.set(entry)
+
+        async def receive_counting() -> Message:
+            message = await receive()
+            if message["type"] == "http.request":
+                entry["request_bytes"] += len(message.get("body", b""))
+            return message
+
+        async def send_counting(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                entry["status"] = message["status"]
+            elif message["type"] == "http.response.body":
+                entry["response_bytes"] += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive_counting, send_counting)
+        finally:
+            current_entry.reset(token)
+            self.write(scope, scope["method"], started, entry)
+
+    async def websocket(self, scope: Scope, receive: Receive, send: Send) -> None:
+        started = time.perf_counter()
+        entry = {"status": 500, "messages_received": 0, "messages_sent": 0}
+        token = current_entry.set(entry)
+
+        async def receive_counting() -> Message:
+            message = await receive()
+            if message["type"] == "websocket.receive":
+                entry["messages_received"] += 1
+            return message
+
+        async def send_counting(message: Message) -> None:
+            if message["type"] == "websocket.send":
+                entry["messages_sent"] += 1
+            elif message["type"] == "websocket.accept":
+                entry["status"] = 101
+            elif message["type"] == "websocket.http.response.start":
+                entry["status"] = message["status"]
+            elif message["type"] == "websocket.close" and entry["status"] == 500:
+                # Zamknięcie przed accept serwer odsyła jako 403
+                entry["status"] = 403
+            await send(message)
+
+        try:
+            await self.app(scope, receive_counting, send_counting)
+        finally:
+            current_entry.reset(token)
+            self.write(scope, "WEBSOCKET", started, entry)
+
+    @staticmethod
+    def write(scope: Scope, method: str, started: float, entry: dict) -> None:
+        duration_ms = (time.perf_counter() - started) * 1000
+        if should_log(entry["status"], duration_ms):
+            client = scope.get("client")
+            access_logger.info(
+                "access",
+                extra={
+                    "access": {
+                        "ts": datetime.now(UTC).isoformat(),
+                        "method": method,
+                        "path": scope["path"],
+                        "client": client[0] if client else None,
+                        "duration_ms": round(duration_ms, 3),
+                        **entry,
+                    }
+                },
+            )
@@ -0,0 +1,138 @@
+import time
+from collections import deque
+
+from app.config import (
+    BREAKER_ENABLED,
+    BREAKER_FAILURE_RATE,
+    BREAKER_HALF_OPEN_CALLS,
+    BREAKER_MIN_CALLS,
+    BREAKER_OPEN_DURATION,
+    BREAKER_SLOW_CALL_DURATION,
+    BREAKER_SLOW_CALL_RATE,
+    BREAKER_WINDOW_SIZE,
+)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of making a call while the breaker is open."""
+
+    def __init__(self, name: str):
+        super().__init__(f"Circuit breaker for {name} is open")
+        self.name = name
+
+
+class CircuitBreaker:
+    """
+    Count-based circuit breaker. Trips open when, over the last `window_size`
+    calls, the failure rate or the rate of calls slower than `slow_call_duration`
+    reaches its threshold. While open every call fails fast; after
+    `open_duration` a few probe calls are let through (half-open) and decide
+    whether to close again or re-open.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_rate: float = BREAKER_FAILURE_RATE,
+        slow_call_duration: float = BREAKER_SLOW_CALL_DURATION,
+        slow_call_rate: float = BREAKER_SLOW_CALL_RATE,
+        window_size: int = BREAKER_WINDOW_SIZE,
+        min_calls: int = BREAKER_MIN_CALLS,
+        open_duration: float = BREAKER_OPEN_DURATION,
+        half_open_calls: int = BREAKER_HALF_OPEN_CALLS,
+        enabled: bool = BREAKER_ENABLED,
+    ):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.slow_call_duration = slow_call_duration
+        self.slow_call_rate = slow_call_rate
+        self.min_calls = min_calls
+        self.open_duration = open_duration
+        self.half_open_calls = half_open_calls
+        self.enabled = enabled
+        self.state = CLOSED
+        self._window: deque[tuple[bool, bool]] = deque(maxlen=window_size)
+        self._opened_at = 0.0
+        self._probes = 0
+        self.rejected = 0
+        self.times_opened = 0
+
+    def _refresh(self, now: float) -> None:
+        if self.state == OPEN and now - self._opened_at >= self.open_duration:
+            self.state = HALF_OPEN
+            self._probes = 0
+
+    def permits(self, now: float | None = None) -> bool:
+        """Whether a call would currently be let through (does not reserve it)."""
+        if not self.enabled:
+            return True
+        self._refresh(time.monotonic() if now is None else now)
+        if self.state == OPEN:
+            return False
+        if self.state == HALF_OPEN:
+            return self._probes < self.half_open_calls
+        return True
+
+    def before_call(self) -> None:
+        """
+        Reserves a call slot.
+        \nRaises:
+            CircuitOpenError: If the breaker is open or out of half-open probes.
+        """
+        if not self.permits():
+            self.rejected += 1
+            raise CircuitOpenError(self.name)
+        if self.state == HALF_OPEN:
+            self._probes += 1
+
+    def on_result(self, duration: float, ok: bool) -> None:
+        if not self.enabled:
+            return
+        slow = duration >= self.slow_call_duration
+        if self.state == HALF_OPEN:
+            self._probes = max(self._probes - 1, 0)
+            if ok and not slow:
+                self._close()
+            else:
+                self._open()
+            return
+        if self.state == OPEN:
+            return
+
+        self._window.append((not ok, slow))
+        calls = len(self._window)
+        if calls < self.min_calls:
+            return
+        failures = sum(1 for failed, _ in self._window if failed)
+        slow_calls = sum(1 for _, was_slow in self._window if was_slow)
+        if (
+            failures / calls >= self.failure_rate
+            or slow_calls / calls >= self.slow_call_rate
+        ):
+            self._open()
+
+    def on_cancel(self) -> None:
+        """Gives back a reserved slot for a call whose outcome was never reported."""
+        if self.state == HALF_OPEN:
+            self._probes = max(self._probes - 1, 0)
+
+    def _open(self) -> None:
+        self.state = OPEN
+        self._opened_at = time.monotonic()
+        self.times_opened += 1
+        self._window.clear()
+
+    def _close(self) -> None:
+        self.state = CLOSED
+        self._window.clear()
+
+    def stats(self) -> dict[str, int | str]:
+        return {
+            "state": self.state,
+            "rejected": self.rejected,
+            "times_opened": self.times_opened,
+        }
@@ -15,6 +15,255 @@ BACKEND_URL = os.getenv("BACKEND_URL")
 ORIGINS = os.getenv("ORIGIN").split(",") if os.getenv("ORIGIN") else ["*"]
 ALGORITHM = "HS256"
 
+# Jak długo przeglądarka trzyma odpowiedź na preflight CORS (sekundy) i ile
+# odpowiedzi na preflight brama pamięta u siebie (0 = bez cache)
+CORS_MAX_AGE = int(os.getenv("CORS_MAX_AGE", "600"))
+CORS_PREFLIGHT_CACHE_SIZE = int(os.getenv("CORS_PREFLIGHT_CACHE_SIZE", "1024"))
 
-# Lista backendów dla prostego load balancingu
-SERVICE_INSTANCES = ["http://localhost:8001", "http://localhost:8002"]
+# Ścieżki, na których działa SessionMiddleware (stan logowania przez Google)
+SESSION_PATH_PREFIXES = tuple(
+    prefix.strip()
+    for prefix in os.getenv(
+        "SESSION_PATH_PREFIXES", "/auth/google,/auth/callback/google"
+    ).split(",")
+    if prefix.strip()
+)
+
+
+# Lista instancji backendu do load balancingu, domyślnie tylko BACKEND_URL
+SERVICE_INSTANCES = (
+    os.getenv("SERVICE_INSTANCES").split(",")
+    if os.getenv("SERVICE_INSTANCES")
+    else [BACKEND_URL]
+)
+
+# Tabela tras /api do nazwanych klastrów (plik TOML, pusty = wszystko do SERVICE_INSTANCES),
+# sprawdzana co tyle sekund i podmieniana po zmianie (0 = bez przeładowania)
+ROUTES_FILE = os.getenv("ROUTES_FILE", "")
+ROUTES_RELOAD_INTERVAL = float(os.getenv("ROUTES_RELOAD_INTERVAL", "5"))
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in {"1", "true", "yes", "on"}
+
+
+# Współdzielony klient HTTP do backendu (jeden na workera)
+UPSTREAM_TIMEOUT = float(os.getenv("UPSTREAM_TIMEOUT", "10.0"))
+UPSTREAM_CONNECT_TIMEOUT = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", "5.0"))
+UPSTREAM_POOL_TIMEOUT = float(os.getenv("UPSTREAM_POOL_TIMEOUT", "5.0"))
+UPSTREAM_MAX_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "200"))
+UPSTREAM_MAX_CONNECTIONS_PER_HOST = int(
+    os.getenv("UPSTREAM_MAX_CONNECTIONS_PER_HOST", "100")
+)
+UPSTREAM_MAX_KEEPALIVE_CONNECTIONS = int(
+    os.getenv("UPSTREAM_MAX_KEEPALIVE_CONNECTIONS", "50")
+)
+UPSTREAM_KEEPALIVE_EXPIRY = float(os.getenv("UPSTREAM_KEEPALIVE_EXPIRY", "30.0"))
+UPSTREAM_HTTP2 = _env_bool("UPSTREAM_HTTP2", False)
+UPSTREAM_WARMUP_CONNECTIONS = int(os.getenv("UPSTREAM_WARMUP_CONNECTIONS", "0"))
+
+# Tryb strumieniowy proxy i limity rozmiaru ciała (0 = bez limitu)
+PROXY_STREAMING = _env_bool("PROXY_STREAMING", False)
+PROXY_MAX_REQUEST_BODY_SIZE = int(os.getenv("PROXY_MAX_REQUEST_BODY_SIZE", "0"))
+PROXY_MAX_RESPONSE_BODY_SIZE = int(os.getenv("PROXY_MAX_RESPONSE_BODY_SIZE", "0"))
+
+# Obsługa /api bezpośrednio na ASGI, z pominięciem routingu i dependency FastAPI
+PROXY_FAST_PATH = _env_bool("PROXY_FAST_PATH", False)
+
+# Kompresja odpowiedzi w bramie, kodowania w kolejności preferencji (pusta lista = wyłączona)
+PROXY_COMPRESSION_ENCODINGS = [
+    name.strip().lower()
+    for name in os.getenv("PROXY_COMPRESSION_ENCODINGS", "").split(",")
+    if name.strip()
+]
+PROXY_COMPRESSION_MIN_SIZE = int(os.getenv("PROXY_COMPRESSION_MIN_SIZE", "1024"))
+# Prefiksy typów MIME, które opłaca się kompresować
+PROXY_COMPRESSION_TYPES = tuple(
+    prefix.strip().lower()
+    for prefix in os.getenv(
+        "PROXY_COMPRESSION_TYPES",
+        "text/,application/json,application/javascript,application/xml,"
+        "application/problem+json,image/svg+xml",
+    ).split(",")
+    if prefix.strip()
+)
+# Większe ciała kompresujemy w wątku, żeby nie blokować pętli zdarzeń
+PROXY_COMPRESSION_THREAD_SIZE = int(os.getenv("PROXY_COMPRESSION_THREAD_SIZE", "65536"))
+
+# Proxy WebSocketów pod /api: limit połączeń na workera i czas bezczynności (0 = bez limitu)
+PROXY_WS_MAX_CONNECTIONS = int(os.getenv("PROXY_WS_MAX_CONNECTIONS", "10000"))
+PROXY_WS_IDLE_TIMEOUT = float(os.getenv("PROXY_WS_IDLE_TIMEOUT", "300"))
+PROXY_WS_CONNECT_TIMEOUT = float(os.getenv("PROXY_WS_CONNECT_TIMEOUT", "10"))
+# Pingi do backendu (0 = wyłączone) i limity buforów na połączenie
+PROXY_WS_PING_INTERVAL = float(os.getenv("PROXY_WS_PING_INTERVAL", "20"))
+PROXY_WS_MAX_MESSAGE_SIZE = int(os.getenv("PROXY_WS_MAX_MESSAGE_SIZE", "1048576"))
+PROXY_WS_MAX_QUEUE = int(os.getenv("PROXY_WS_MAX_QUEUE", "16"))
+
+# Kanały gRPC do user service (współdzielone przez cały worker)
+USER_SERVICE_CHANNELS = int(os.getenv("USER_SERVICE_CHANNELS", "1"))
+USER_SERVICE_TIMEOUT = float(os.getenv("USER_SERVICE_TIMEOUT", "2.0"))
+USER_SERVICE_KEEPALIVE_TIME_MS = int(
+    os.getenv("USER_SERVICE_KEEPALIVE_TIME_MS", "30000")
+)
+USER_SERVICE_KEEPALIVE_TIMEOUT_MS = int(
+    os.getenv("USER_SERVICE_KEEPALIVE_TIMEOUT_MS", "10000")
+)
+# Przy zamykaniu workera trwające wywołania mają tyle sekund na zakończenie
+USER_SERVICE_CLOSE_GRACE = float(os.getenv("USER_SERVICE_CLOSE_GRACE", "5"))
+
+# Metadane OpenID i JWKS Google pobierane w tle przy starcie i odświeżane co tyle
+# sekund (0 = pobrane raz); bez prefetchu authlib pobiera je przy pierwszym logowaniu
+OIDC_PREFETCH = _env_bool("OIDC_PREFETCH", True)
+OIDC_REFRESH_INTERVAL = float(os.getenv("OIDC_REFRESH_INTERVAL", "3600"))
+
+# Łączenie wyszukiwań użytkowników w BatchGetUsersByEmail (rozmiar 0 lub 1 = wyłączone)
+USER_LOOKUP_BATCH_SIZE = int(os.getenv("USER_LOOKUP_BATCH_SIZE", "0"))
+USER_LOOKUP_BATCH_DELAY = float(os.getenv("USER_LOOKUP_BATCH_DELAY", "0.002"))
+
+# Cache użytkowników przed GetUserByEmail (rozmiar 0 = wyłączony)
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "60.0"))
+USER_CACHE_STALE_TTL = float(os.getenv("USER_CACHE_STALE_TTL", "0.0"))
+
+# Poprzednie klucze JWT akceptowane przy weryfikacji (rotacja), oddzielone przecinkami
+PREVIOUS_SECRET_KEYS = [
+    key for key in os.getenv("PREVIOUS_SECRET_KEYS", "").split(",") if key
+]
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+
+# Tryb claims-only: UserDep bierze email i rolę z podpisanego tokenu bez pytania user
+# service; odwołani użytkownicy (usunięci, ze zmienioną rolą) są sprawdzani jak dotąd
+AUTH_CLAIMS_ONLY = _env_bool("AUTH_CLAIMS_ONLY", False)
+# Plik odwołań wspólny dla workerów (domyślnie w /dev/shm), odczytywany co
+# AUTH_REVOCATION_REFRESH sekund; wpisy wygasają po czasie życia access tokenu
+AUTH_REVOCATION_PATH = os.getenv("AUTH_REVOCATION_PATH", "")
+AUTH_REVOCATION_REFRESH = float(os.getenv("AUTH_REVOCATION_REFRESH", "5"))
+AUTH_REVOCATION_TTL = float(os.getenv("AUTH_REVOCATION_TTL", "604800"))
+AUTH_REVOCATION_CAPACITY = int(os.getenv("AUTH_REVOCATION_CAPACITY", "100000"))
+
+# Strategia load balancingu: round_robin, least_outstanding, p2c_ewma, consistent_hash
+LB_STRATEGY = os.getenv("LB_STRATEGY", "round_robin")
+LB_EWMA_DECAY = float(os.getenv("LB_EWMA_DECAY", "10.0"))
+# Aktywne health checki (pusta ścieżka = wyłączone)
+HEALTH_CHECK_PATH = os.getenv("HEALTH_CHECK_PATH", "")
+HEALTH_CHECK_INTERVAL = float(os.getenv("HEALTH_CHECK_INTERVAL", "5.0"))
+HEALTH_CHECK_TIMEOUT = float(os.getenv("HEALTH_CHECK_TIMEOUT", "1.0"))
+# Pasywne wykrywanie wadliwych instancji
+OUTLIER_CONSECUTIVE_FAILURES = int(os.getenv("OUTLIER_CONSECUTIVE_FAILURES", "5"))
+OUTLIER_EJECTION_TIME = float(os.getenv("OUTLIER_EJECTION_TIME", "30.0"))
+
+# Circuit breaker dla instancji backendu i user service
+BREAKER_ENABLED = _env_bool("BREAKER_ENABLED", True)
+BREAKER_FAILURE_RATE = float(os.getenv("BREAKER_FAILURE_RATE", "0.5"))
+BREAKER_SLOW_CALL_DURATION = float(os.getenv("BREAKER_SLOW_CALL_DURATION", "5.0"))
+BREAKER_SLOW_CALL_RATE = float(os.getenv("BREAKER_SLOW_CALL_RATE", "0.8"))
+BREAKER_WINDOW_SIZE = int(os.getenv("BREAKER_WINDOW_SIZE", "20"))
+BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", "10"))
+BREAKER_OPEN_DURATION = float(os.getenv("BREAKER_OPEN_DURATION", "30.0"))
+BREAKER_HALF_OPEN_CALLS = int(os.getenv("BREAKER_HALF_OPEN_CALLS", "1"))
+
+# Adaptacyjny limit równoległych zapytań na instancję backendu (aimd lub gradient),
+# z ograniczoną kolejką; po jej zapełnieniu lub przekroczeniu czasu oczekiwania 503
+CONCURRENCY_LIMIT_ENABLED = _env_bool("CONCURRENCY_LIMIT_ENABLED", False)
+CONCURRENCY_LIMIT_ALGORITHM = os.getenv("CONCURRENCY_LIMIT_ALGORITHM", "gradient")
+CONCURRENCY_LIMIT_INITIAL = int(os.getenv("CONCURRENCY_LIMIT_INITIAL", "20"))
+CONCURRENCY_LIMIT_MIN = int(os.getenv("CONCURRENCY_LIMIT_MIN", "4"))
+CONCURRENCY_LIMIT_MAX = int(os.getenv("CONCURRENCY_LIMIT_MAX", "200"))
+# aimd: wywołanie wolniejsze niż tyle sekund obniża limit; gradient: dopuszczalny wzrost opóźnień
+CONCURRENCY_LIMIT_SLOW_CALL = float(os.getenv("CONCURRENCY_LIMIT_SLOW_CALL", "1.0"))
+CONCURRENCY_LIMIT_TOLERANCE = float(os.getenv("CONCURRENCY_LIMIT_TOLERANCE", "1.5"))
+CONCURRENCY_LIMIT_QUEUE_SIZE = int(os.getenv("CONCURRENCY_LIMIT_QUEUE_SIZE", "50"))
+CONCURRENCY_LIMIT_QUEUE_TIMEOUT = float(
+    os.getenv("CONCURRENCY_LIMIT_QUEUE_TIMEOUT", "0.5")
+)
+# Priorytety ról przy zrzucaniu ruchu (rola:priorytet, pozostałe role mają 0); każdy
+# poziom poniżej najwyższego dostaje o taki ułamek limitu mniej
+CONCURRENCY_PRIORITIES = {
+    role.strip(): int(priority)
+    for role, _, priority in (
+        item.partition(":")
+        for item in os.getenv(
+            "CONCURRENCY_PRIORITIES", "admin:3,premium:2,user:1"
+        ).split(",")
+        if item.strip()
+    )
+}
+CONCURRENCY_LIMIT_RESERVE = float(os.getenv("CONCURRENCY_LIMIT_RESERVE", "0.1"))
+
+# Ponowienia idempotentnych zapytań do backendu i user service (0 = bez ponowień)
+RETRY_ATTEMPTS = int(os.getenv("RETRY_ATTEMPTS", "0"))
+RETRY_BACKOFF = float(os.getenv("RETRY_BACKOFF", "0.025"))
+# Budżet ponowień: ułamek zapytań z ostatniego okna (w sekundach) plus stała liczba na sekundę
+RETRY_BUDGET_RATIO = float(os.getenv("RETRY_BUDGET_RATIO", "0.1"))
+RETRY_BUDGET_MIN_PER_SECOND = float(os.getenv("RETRY_BUDGET_MIN_PER_SECOND", "5"))
+RETRY_BUDGET_WINDOW = int(os.getenv("RETRY_BUDGET_WINDOW", "10"))
+# Hedging: druga próba, gdy odpowiedź nie przyszła w obserwowanym kwantylu czasu
+HEDGE_ENABLED = _env_bool("HEDGE_ENABLED", False)
+HEDGE_QUANTILE = float(os.getenv("HEDGE_QUANTILE", "0.95"))
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "0.005"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "100"))
+
+# Cache odpowiedzi GET z backendu (budżet 0 = wyłączony); duże ciała opcjonalnie na dysk
+PROXY_CACHE_MAX_BYTES = int(os.getenv("PROXY_CACHE_MAX_BYTES", "0"))
+PROXY_CACHE_MAX_ENTRY_BYTES = int(os.getenv("PROXY_CACHE_MAX_ENTRY_BYTES", "1048576"))
+PROXY_CACHE_SPILL_DIR = os.getenv("PROXY_CACHE_SPILL_DIR", "")
+PROXY_CACHE_SPILL_MAX_BYTES = int(
+    os.getenv("PROXY_CACHE_SPILL_MAX_BYTES", "1073741824")
+)
+
+# Sklejanie identycznych równoległych GET-ów w jedno zapytanie do backendu (brak prefiksów = wyłączone)
+PROXY_COLLAPSE_PREFIXES = tuple(
+    prefix.strip()
+    for prefix in os.getenv("PROXY_COLLAPSE_PREFIXES", "").split(",")
+    if prefix.strip()
+)
+# Nagłówki zapytania, od których zależy odpowiedź (poza metodą, ścieżką, query i rolą)
+PROXY_COLLAPSE_VARY_HEADERS = tuple(
+    name.strip().lower()
+    for name in os.getenv(
+        "PROXY_COLLAPSE_VARY_HEADERS", "accept,accept-encoding,accept-language"
+    ).split(",")
+    if name.strip()
+)
+
+# Limity zapytań (GCRA) wspólne dla workerów: zapytania/s i burst, rate 0 = wyłączony
+RATE_LIMIT_USER_RATE = float(os.getenv("RATE_LIMIT_USER_RATE", "0"))
+RATE_LIMIT_USER_BURST = int(os.getenv("RATE_LIMIT_USER_BURST", "20"))
+RATE_LIMIT_ROLE_RATE = float(os.getenv("RATE_LIMIT_ROLE_RATE", "0"))
+RATE_LIMIT_ROLE_BURST = int(os.getenv("RATE_LIMIT_ROLE_BURST", "200"))
+# Plik w pamięci współdzielonej (domyślnie /dev/shm) i liczba kubełków po 8 kluczy
+RATE_LIMIT_PATH = os.getenv("RATE_LIMIT_PATH", "")
+RATE_LIMIT_BUCKETS = int(os.getenv("RATE_LIMIT_BUCKETS", "8192"))
+
+# Serwer produkcyjny (python -m app.server): liczba workerów (0 = według limitu CPU),
+# osobne gniazdo SO_REUSEPORT na workera, kolejka połączeń i keep-alive (dłuższy niż
+# idle timeout load balancera)
+SERVER_HOST = os.getenv("SERVER_HOST", "0.0.0.0")
+SERVER_PORT = int(os.getenv("SERVER_PORT", "8000"))
+SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", "0"))
+SERVER_REUSE_PORT = _env_bool("SERVER_REUSE_PORT", True)
+SERVER_BACKLOG = int(os.getenv("SERVER_BACKLOG", "2048"))
+SERVER_KEEPALIVE_TIMEOUT = int(os.getenv("SERVER_KEEPALIVE_TIMEOUT", "75"))
+# Po SIGTERM: tyle sekund dalszej obsługi (wyrejestrowanie z load balancera), potem tyle
+# na dokończenie trwających zapytań
+SERVER_DRAIN_DELAY = float(os.getenv("SERVER_DRAIN_DELAY", "0"))
+SERVER_GRACEFUL_TIMEOUT = int(os.getenv("SERVER_GRACEFUL_TIMEOUT", "30"))
+# Kontekst deflate to setki KB na połączenie WebSocket
+SERVER_WS_PER_MESSAGE_DEFLATE = _env_bool("SERVER_WS_PER_MESSAGE_DEFLATE", False)
+
+# Metryki Prometheusa; snapshoty workerów są łączone przy odczycie /metrics
+METRICS_ENABLED = _env_bool("METRICS_ENABLED", True)
+METRICS_PATH = os.getenv("METRICS_PATH", "/metrics")
+METRICS_DIR = os.getenv("METRICS_DIR", "")
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "1.0"))
+
+# Logi dostępowe jako JSON, zapisywane z kolejki przez osobny wątek
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+ACCESS_LOG_ENABLED = _env_bool("ACCESS_LOG_ENABLED", True)
+# Część logowanych odpowiedzi 2xx/3xx; błędy i wolne zapytania logujemy zawsze
+ACCESS_LOG_SAMPLE_RATE = float(os.getenv("ACCESS_LOG_SAMPLE_RATE", "1.0"))
+ACCESS_LOG_SLOW_MS = float(os.getenv("ACCESS_LOG_SLOW_MS", "1000"))
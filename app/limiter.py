@@ -0,0 +1,261 @@
+import asyncio
+import math
+from collections import deque
+
+from app.config import (
+    CONCURRENCY_LIMIT_ALGORITHM,
+    CONCURRENCY_LIMIT_ENABLED,
+    CONCURRENCY_LIMIT_INITIAL,
+    CONCURRENCY_LIMIT_MAX,
+    CONCURRENCY_LIMIT_MIN,
+    CONCURRENCY_LIMIT_QUEUE_SIZE,
+    CONCURRENCY_LIMIT_QUEUE_TIMEOUT,
+    CONCURRENCY_LIMIT_RESERVE,
+    CONCURRENCY_LIMIT_SLOW_CALL,
+    CONCURRENCY_LIMIT_TOLERANCE,
+    CONCURRENCY_PRIORITIES,
+)
+
+# Po błędzie lub przekroczeniu progu limit maleje o 10%
+BACKOFF = 0.9
+
+TOP_PRIORITY = max(CONCURRENCY_PRIORITIES.values(), default=0)
+
+
+def role_priority(role: str) -> int:
+    """Shedding priority of a role; roles not in CONCURRENCY_PRIORITIES get 0."""
+    return CONCURRENCY_PRIORITIES.get(role, 0)
+
+
+class OverloadedError(Exception):
+    """Raised instead of making a call when the concurrency limiter sheds it."""
+
+    def __init__(self, name: str, reason: str):
+        super().__init__(f"Concurrency limit for {name} reached ({reason})")
+        self.name = name
+        self.reason = reason
+
+
+class AIMD:
+    """
+    Additive increase, multiplicative decrease: about one more slot per
+    `limit` successful calls while at least half the limit is in use, and a
+    cut by BACKOFF on an error or a call slower than `slow_call`.
+    """
+
+    def __init__(self, slow_call: float = CONCURRENCY_LIMIT_SLOW_CALL):
+        self.slow_call = slow_call
+
+    def update(self, limit: float, latency: float, in_flight: int, ok: bool) -> float:
+        if not ok or latency > self.slow_call:
+            return limit * BACKOFF
+        if in_flight * 2 >= limit:
+            return limit + 1 / limit
+        return limit
+
+
+class Gradient:
+    """
+    Compares recent latency with the long-term baseline, once per window of
+    about `limit` calls: while latency stays within `tolerance` x baseline
+    the limit grows by about sqrt(limit), and it shrinks in proportion once
+    queueing at the backend shows up as higher latency. Errors cut it by
+    BACKOFF right away.
+    """
+
+    def __init__(
+        self,
+        tolerance: float = CONCURRENCY_LIMIT_TOLERANCE,
+        smoothing: float = 0.2,
+        long_window: int = 600,
+    ):
+        self.tolerance = tolerance
+        self.smoothing = smoothing
+        self._long_decay = 2 / (long_window + 1)
+        self.long_latency = 0.0
+        self._total = 0.0
+        self._samples = 0
+
+    def update(self, limit: float, latency: float, in_flight: int, ok: bool) -> float:
+        if not ok:
+            return limit * BACKOFF
+        self._total += latency
+        self._samples += 1
+        if self._samples < limit:
+            return limit
+        short_latency = self._total / self._samples
+        self._total = 0.0
+        self._samples = 0
+        if not self.long_latency:
+            self.long_latency = short_latency
+            return limit
+        # Linia bazowa to średnia z setek okien, więc przeciążenie szybko jej nie podnosi
+        self.long_latency += (short_latency - self.long_latency) * self._long_decay
+        # Po długim przeciążeniu linia bazowa urosła; pozwalamy jej szybciej wrócić
+        if self.long_latency > short_latency * 2:
+            self.long_latency *= 0.95
+
+        gradient = max(
+            0.5, min(1.0, self.tolerance * self.long_latency / short_latency)
+        )
+        # Przy małym ruchu brak sygnału z opóźnień, więc limitu nie podnosimy
+        if gradient >= 1.0 and in_flight * 2 < limit:
+            return limit
+        target = limit * gradient + math.sqrt(limit)
+        return limit * (1 - self.smoothing) + target * self.smoothing
+
+
+ALGORITHMS = {
+    "aimd": AIMD,
+    "gradient": Gradient,
+}
+
+
+class ConcurrencyLimiter:
+    """
+    Adaptive cap on calls in flight to one upstream. The limit follows the
+    observed latency and errors (see ALGORITHMS) between `min_limit` and
+    `max_limit`. Calls over the limit wait in a bounded queue served in
+    priority order, for at most `queue_timeout` seconds.
+
+    Lower priorities get less of the limit: each level below the top one
+    gives up another `reserve` fraction, so under overload the lowest tiers
+    queue first. When the queue is full a call takes the place of the newest
+    waiter of a lower priority, or is rejected at once if there is none.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        algorithm: str = CONCURRENCY_LIMIT_ALGORITHM,
+        initial_limit: int = CONCURRENCY_LIMIT_INITIAL,
+        min_limit: int = CONCURRENCY_LIMIT_MIN,
+        max_limit: int = CONCURRENCY_LIMIT_MAX,
+        queue_size: int = CONCURRENCY_LIMIT_QUEUE_SIZE,
+        queue_timeout: float = CONCURRENCY_LIMIT_QUEUE_TIMEOUT,
+        reserve: float = CONCURRENCY_LIMIT_RESERVE,
+        enabled: bool = CONCURRENCY_LIMIT_ENABLED,
+    ):
+        if algorithm not in ALGORITHMS:
+            raise ValueError(f"Unknown concurrency limit algorithm: {algorithm}")
+        self.name = name
+        self.min_limit = max(min_limit, 1)
+        self.max_limit = max(max_limit, self.min_limit)
+        self.limit = float(min(max(initial_limit, self.min_limit), self.max_limit))
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.reserve = reserve
+        self.enabled = enabled
+        self.in_flight = 0
+        self.shed: dict[int, int] = {}
+        self._algorithm = ALGORITHMS[algorithm]()
+        self._queues: dict[int, deque[asyncio.Future]] = {}
+        self._queued = 0
+
+    def _threshold(self, priority: int) -> float:
+        levels_below_top = max(TOP_PRIORITY - priority, 0)
+        return max(self.limit * (1 - self.reserve * levels_below_top), 1.0)
+
+    def _reject(self, priority: int, reason: str) -> OverloadedError:
+        self.shed[priority] = self.shed.get(priority, 0) + 1
+        return OverloadedError(self.name, reason)
+
+    async def acquire(self, priority: int = 0, wait: bool = True) -> None:
+        """
+        Takes a slot, queueing for one if needed (unless `wait` is false).
+        Every successful acquire must be followed by release().
+        \nRaises:
+            OverloadedError: If the call is shed: the queue is full, the wait
+                timed out or a higher priority call took its place.
+        """
+        if not self.enabled:
+            return
+        if self.in_flight < self._threshold(priority) and not self._waiting_from(
+            priority
+        ):
+            self.in_flight += 1
+            return
+        if not wait:
+            raise self._reject(priority, "no free slot")
+        if self._queued >= self.queue_size and not self._evict_below(priority):
+            raise self._reject(priority, "queue full")
+
+        future = asyncio.get_running_loop().create_future()
+        queue = self._queues.setdefault(priority, deque())
+        queue.append(future)
+        self._queued += 1
+        try:
+            async with asyncio.timeout(self.queue_timeout):
+                await future
+        except (TimeoutError, asyncio.CancelledError) as exc:
+            if not future.done() or future.cancelled():
+                self._discard(priority, future)
+            elif future.exception() is None:
+                # Slot przyznany tuż przed przerwaniem oczekiwania oddajemy dalej
+                self.release()
+            elif isinstance(exc, TimeoutError):
+                raise future.exception() from None
+            if isinstance(exc, TimeoutError):
+                raise self._reject(priority, "queue timeout") from None
+            raise
+
+    def release(self) -> None:
+        if not self.enabled:
+            return
+        self.in_flight -= 1
+        self._grant()
+
+    def on_result(self, latency: float, ok: bool) -> None:
+        if not self.enabled:
+            return
+        limit = self._algorithm.update(self.limit, latency, self.in_flight, ok)
+        self.limit = min(max(limit, self.min_limit), self.max_limit)
+        if self._queued:
+            self._grant()
+
+    def _waiting_from(self, priority: int) -> bool:
+        # Nie wyprzedzamy czekających o tym samym lub wyższym priorytecie
+        return self._queued > 0 and any(
+            queue for level, queue in self._queues.items() if level >= priority
+        )
+
+    def _grant(self) -> None:
+        while self._queued:
+            priority = max(level for level, queue in self._queues.items() if queue)
+            if self.in_flight >= self._threshold(priority):
+                return
+            future = self._queues[priority].popleft()
+            self._queued -= 1
+            # Anulowany czekający jeszcze nie zdążył usunąć się z kolejki
+            if future.done():
+                continue
+            self.in_flight += 1
+            future.set_result(None)
+
+    def _evict_below(self, priority: int) -> bool:
+        while True:
+            levels = [level for level, queue in self._queues.items() if queue]
+            lowest = min(levels, default=priority)
+            if lowest >= priority:
+                return False
+            # Najnowszy czeka najkrócej, więc traci najmniej
+            future = self._queues[lowest].pop()
+            self._queued -= 1
+            if not future.done():
+                future.set_exception(self._reject(lowest, "preempted"))
+                return True
+
+    def _discard(self, priority: int, future: asyncio.Future) -> None:
+        try:
+            self._queues[priority].remove(future)
+        except ValueError:
+            return
+        self._queued -= 1
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "queued": self._queued,
+            "shed": dict(self.shed),
+        }
@@ -1,15 +1,105 @@
-import httpx
-from fastapi import FastAPI, status
-from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, Response
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, WebSocket, status
+from fastapi.responses import PlainTextResponse
+from starlette.middleware import Middleware
 from starlette.middleware.sessions import SessionMiddleware
 from starlette.requests import Request
 
-from app.config import BACKEND_URL, ORIGINS, SECRET_KEY
+from app.access_log import (
+    AccessLogMiddleware,
+    dropped_records,
+    start_logging,
+    stop_logging,
+)
+from app.breaker import CLOSED
+from app.config import (
+    CORS_MAX_AGE,
+    METRICS_ENABLED,
+    METRICS_PATH,
+    OIDC_PREFETCH,
+    ORIGINS,
+    PROXY_COMPRESSION_ENCODINGS,
+    PROXY_FAST_PATH,
+    SECRET_KEY,
+    SESSION_PATH_PREFIXES,
+)
+from app.metrics import (
+    BREAKER_OPEN,
+    CACHE_ENTRIES,
+    CACHE_EVENTS,
+    CONCURRENCY_LIMIT,
+    CONCURRENCY_QUEUED,
+    LOAD_SHED,
+    LOG_RECORDS_DROPPED,
+    UPSTREAM_COLLAPSED,
+    UPSTREAM_CONNECTIONS,
+    UPSTREAM_HOST_SLOTS,
+    UPSTREAM_OUTSTANDING,
+    UPSTREAM_RETRIES,
+    WEBSOCKET_CLOSED,
+    WEBSOCKET_CONNECTIONS,
+    MetricsMiddleware,
+    registry,
+)
+from app.middleware import CORSMiddleware, PathMiddleware
+from app.proxy import client as upstream
+from app.proxy.asgi import ApiFastPath
+from app.proxy.cache import response_cache
+from app.proxy.compression import CompressionMiddleware
+from app.proxy.handler import proxy_request, request_collapser, retry_policy
+from app.proxy.routes import api_routes
+from app.proxy.websocket import websocket_proxy
+from app.ratelimit import rate_limiter
+from app.routers.auth import channel as user_service
+from app.routers.auth.cache import user_cache
+from app.routers.auth.oidc import google_oauth
+from app.routers.auth.revocation import revocations
 from app.routers.auth.router import router as auth_router
 from app.routers.auth.services import UserDep
+from app.routers.auth.tokens import token_cache
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    start_logging()
+    client = await upstream.open_client(
+        [instance.url for instance in api_routes.instances()]
+    )
+    api_routes.start(client)
+    await user_service.open_channels()
+    rate_limiter.open()
+    revocations.start()
+    if OIDC_PREFETCH:
+        google_oauth.start()
+    if METRICS_ENABLED:
+        registry.start()
+    try:
+        yield
+    finally:
+        await registry.stop()
+        await google_oauth.stop()
+        await revocations.stop()
+        await user_service.close_channels()
+        await api_routes.stop()
+        await upstream.close_client()
+        response_cache.clear()
+        rate_limiter.close()
+        stop_logging()
+
+
+app = FastAPI(lifespan=lifespan)
+
+# Sesje są potrzebne tylko przy logowaniu przez Google, reszta tras nie parsuje ciasteczka
+app.add_middleware(
+    PathMiddleware,
+    prefixes=SESSION_PATH_PREFIXES,
+    middleware=[Middleware(SessionMiddleware, secret_key=SECRET_KEY)],
+)
 
-app = FastAPI()
+# Szybka ścieżka /api omija routing FastAPI, ale nie CORS
+if PROXY_FAST_PATH:
+    app.add_middleware(ApiFastPath)
 
 app.add_middleware(
     CORSMiddleware,
@@ -17,82 +107,96 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    max_age=CORS_MAX_AGE,
 )
 
-app.add_middleware(SessionMiddleware, secret_key=SECRET_KEY)
+if PROXY_COMPRESSION_ENCODINGS:
+    app.add_middleware(CompressionMiddleware)
+
+# Dodane jako ostatnie, więc obejmują też czas pozostałych middleware
+app.add_middleware(AccessLogMiddleware)
+app.add_middleware(MetricsMiddleware)
 
 app.include_router(auth_router)
 
 
+@registry.collector
+def collect_runtime_metrics() -> None:
+    for instance in api_routes.instances():
+        UPSTREAM_OUTSTANDING.set(instance.url, value=instance.outstanding)
+        BREAKER_OPEN.set(instance.url, value=instance.breaker.state != CLOSED)
+        limiter = instance.limiter.stats()
+        CONCURRENCY_LIMIT.set(instance.url, value=limiter["limit"])
+        CONCURRENCY_QUEUED.set(instance.url, value=limiter["queued"])
+        for priority, count in limiter["shed"].items():
+            LOAD_SHED.set(instance.url, str(priority), value=count)
+    BREAKER_OPEN.set("user_service", value=user_service.breaker.state != CLOSED)
+
+    LOG_RECORDS_DROPPED.set(value=dropped_records())
+
+    for target, policy in (
+        ("backend", retry_policy),
+        ("user_service", user_service.retry_policy),
+    ):
+        for kind, count in policy.stats().items():
+            UPSTREAM_RETRIES.set(target, kind, value=count)
+
+    collapsed = request_collapser.stats()
+    UPSTREAM_COLLAPSED.set("call", value=collapsed["calls"])
+    UPSTREAM_COLLAPSED.set("joined", value=collapsed["coalesced"])
+
+    connections = websocket_proxy.stats()
+    WEBSOCKET_CONNECTIONS.set(value=connections.pop("open"))
+    for reason, count in connections.items():
+        WEBSOCKET_CLOSED.set(reason, value=count)
+
+    pool = upstream.pool_stats()
+    UPSTREAM_CONNECTIONS.set("active", value=pool["connections"] - pool["idle"])
+    UPSTREAM_CONNECTIONS.set("idle", value=pool["idle"])
+    for host, in_use in pool["in_use_per_host"].items():
+        UPSTREAM_HOST_SLOTS.set(host, value=in_use)
+
+    for name, cache in (
+        ("user", user_cache),
+        ("token", token_cache),
+        ("response", response_cache),
+    ):
+        stats = cache.stats()
+        CACHE_EVENTS.set(name, "hit", value=stats["hits"])
+        CACHE_EVENTS.set(name, "miss", value=stats["misses"])
+        stale = stats.get("stale", stats.get("stale_hits"))
+        if stale is not None:
+            CACHE_EVENTS.set(name, "stale", value=stale)
+        CACHE_ENTRIES.set(name, value=stats.get("entries", stats.get("size", 0)))
+
+
+if METRICS_ENABLED:
+
+    @app.get(METRICS_PATH, include_in_schema=False)
+    async def metrics():
+        return PlainTextResponse(
+            registry.render(), media_type="text/plain; version=0.0.4"
+        )
+
+
 @app.get("/test", status_code=status.HTTP_200_OK)
 async def test():
     return "test"
 
 
-# def pick_service():
-#     return random.choice(SERVICE_INSTANCES)
-
-
 @app.api_route(
     "/api/{path:path}",
-    methods=["GET", "POST", "PUT", "DELETE", "PATCH"],
+    methods=["GET", "HEAD", "POST", "PUT", "DELETE", "PATCH"],
     operation_id="proxy_all_methods",
 )
 async def proxy(path: str, request: Request, user: UserDep):
-    url = f"{BACKEND_URL}/{path}"
-    print(url)
-    try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            # Kopiowanie nagłówków, usuwamy te niepotrzebne
-            excluded_headers = {
-                "host",
-                "content-length",
-                "connection",
-                "accept-encoding",
-            }
-            headers = {
-                key: value
-                for key, value in request.headers.items()
-                if key.lower() not in excluded_headers
-            }
-            headers["Role"] = user.role
-
-            body = await request.body()
-
-            backend_response = await client.request(
-                method=request.method,
-                url=url,
-                headers=headers,
-                content=body,
-                params=request.query_params,
-            )
-
-        # Tworzymy odpowiedź przekazując status, nagłówki i treść
-        return Response(
-            content=backend_response.content,
-            status_code=backend_response.status_code,
-            headers={
-                key: value
-                for key, value in backend_response.headers.items()
-                if key.lower()
-                not in {"content-encoding", "transfer-encoding", "connection"}
-            },
-            media_type=backend_response.headers.get("content-type"),
-        )
+    return await proxy_request(path, request, user)
 
-    except httpx.RequestError as exc:
-        print(exc)
-        return JSONResponse(
-            status_code=status.HTTP_502_BAD_GATEWAY,
-            content={"error": "Bad Gateway", "details": str(exc)},
-        )
 
-    except Exception as exc:
-        print(exc)
-        return JSONResponse(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            content={"error": "Internal Server Error", "details": str(exc)},
-        )
+# UserDep (OAuth2PasswordBearer) działa tylko dla Request, więc token sprawdza proxy
+@app.websocket("/api/{path:path}")
+async def proxy_websocket(path: str, websocket: WebSocket):
+    await websocket_proxy.handle(path, websocket)
 
 
 # if __name__ == "__main__":
@@ -0,0 +1,489 @@
+import asyncio
+import bisect
+import json
+import math
+import os
+import tempfile
+import time
+from collections.abc import Callable
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.access_log import logger
+from app.config import (
+    ACCESS_LOG_ENABLED,
+    METRICS_DIR,
+    METRICS_ENABLED,
+    METRICS_FLUSH_INTERVAL,
+)
+
+# Czas startu nadzorcy (app.server); workery dziedziczą go przez środowisko
+RUN_STARTED_ENV = "GATEWAY_STARTED_AT"
+
+DEFAULT_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.values: dict[tuple, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def set(self, *labels: str, value: float) -> None:
+        """For collectors mirroring a total that is already counted elsewhere."""
+        self.values[labels] = value
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labels: str, amount: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) - amount
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # Na etykiety: liczniki kubełków (nieskumulowane), +Inf, suma
+        self.values: dict[tuple, list[float]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        counts = self.values.get(labels)
+        if counts is None:
+            counts = self.values[labels] = [0] * (len(self.buckets) + 2)
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+
+class Registry:
+    """
+    Metrics of one worker. Each worker periodically writes a snapshot to
+    `directory`; a scrape on any worker merges the snapshots of all of them.
+    Counters and histograms of workers that have exited are kept, gauges only
+    count live workers. Snapshots written before the server started (see
+    run_started) are left over from a previous run and removed on start.
+    """
+
+    def __init__(self, directory: str = METRICS_DIR):
+        self.directory = directory or default_directory()
+        self.metrics: list[Counter | Histogram] = []
+        self.collectors: list[Callable[[], None]] = []
+        self._flush_task: asyncio.Task | None = None
+
+    def counter(self, name: str, documentation: str, labelnames=()) -> Counter:
+        return self._add(Counter(name, documentation, tuple(labelnames)))
+
+    def gauge(self, name: str, documentation: str, labelnames=()) -> Gauge:
+        return self._add(Gauge(name, documentation, tuple(labelnames)))
+
+    def histogram(
+        self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._add(Histogram(name, documentation, tuple(labelnames), buckets))
+
+    def _add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def collector(self, fn: Callable[[], None]) -> Callable[[], None]:
+        """Registers a function that refreshes gauges right before a snapshot."""
+        self.collectors.append(fn)
+        return fn
+
+    def snapshot(self) -> dict:
+        for collect in self.collectors:
+            collect()
+        return {
+            metric.name: [
+                [list(labels), value] for labels, value in metric.values.items()
+            ]
+            for metric in self.metrics
+        }
+
+    def _path(self, pid: int) -> str:
+        return os.path.join(self.directory, f"{pid}.json")
+
+    def write(self) -> None:
+        path = self._path(os.getpid())
+        temporary = f"{path}.tmp"
+        with open(temporary, "w") as file:
+            json.dump(self.snapshot(), file)
+        os.replace(temporary, path)
+
+    def _read_all(self) -> list[tuple[bool, dict]]:
+        snapshots = []
+        own = os.getpid()
+        names = os.listdir(self.directory) if os.path.isdir(self.directory) else []
+        for name in names:
+            pid = name.removesuffix(".json")
+            if not name.endswith(".json") or not pid.isdigit() or int(pid) == own:
+                continue
+            pid = int(pid)
+            try:
+                with open(os.path.join(self.directory, name)) as file:
+                    snapshots.append((_alive(pid), json.load(file)))
+            except (OSError, ValueError):
+                continue
+        snapshots.append((True, self.snapshot()))
+        return snapshots
+
+    def render(self) -> str:
+        """Renders the merged metrics of all workers in the Prometheus text format."""
+        merged: dict[str, dict[tuple, float | list[float]]] = {}
+        for alive, snapshot in self._read_all():
+            for metric in self.metrics:
+                if metric.kind == "gauge" and not alive:
+                    continue
+                values = merged.setdefault(metric.name, {})
+                for labels, value in snapshot.get(metric.name, ()):
+                    labels = tuple(labels)
+                    if isinstance(value, list):
+                        current = values.get(labels)
+                        values[labels] = (
+                            [a + b for a, b in zip(current, value)]
+                            if current
+                            else list(value)
+                        )
+                    else:
+                        values[labels] = values.get(labels, 0) + value
+
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for labels, value in sorted(merged.get(metric.name, {}).items()):
+                pairs = list(zip(metric.labelnames, labels))
+                if metric.kind != "histogram":
+                    lines.append(f"{metric.name}{_labels(pairs)} {_number(value)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip((*metric.buckets, math.inf), value):
+                    cumulative += count
+                    le = pairs + [("le", _number(bound))]
+                    lines.append(f"{metric.name}_bucket{_labels(le)} {cumulative}")
+                lines.append(f"{metric.name}_sum{_labels(pairs)} {_number(value[-1])}")
+                lines.append(f"{metric.name}_count{_labels(pairs)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(METRICS_FLUSH_INTERVAL)
+            try:
+                self.write()
+            except (OSError, TypeError, ValueError) as exc:
+                # Bez tego zadanie kończy się po cichu, a metryki workera zamarzają
+                logger.warning("Could not write metrics snapshot: %r", exc)
+
+    def _remove_stale(self) -> None:
+        started = run_started()
+        for name in os.listdir(self.directory):
+            pid = name.removesuffix(".json").removesuffix(".json.tmp")
+            if not pid.isdigit() or _alive(int(pid)):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                # Snapshot workera zrestartowanego w tym uruchomieniu zostaje
+                if name.endswith(".tmp") or os.stat(path).st_mtime < started:
+                    os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+    def start(self) -> None:
+        if self._flush_task is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self._remove_stale()
+        self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self) -> None:
+        if self._flush_task is not None:
+            task, self._flush_task = self._flush_task, None
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+            self.write()
+
+
+def default_directory() -> str:
+    directory = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(directory, "api-gateway-metrics")
+
+
+_IMPORTED_AT = time.time()
+
+
+def run_started() -> float:
+    """
+    When the server started: set by the app.server supervisor for all its
+    workers, otherwise when this process started.
+    """
+    try:
+        return float(os.environ[RUN_STARTED_ENV])
+    except (KeyError, ValueError):
+        return _IMPORTED_AT
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(pairs: list[tuple[str, str]]) -> str:
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+registry = Registry()
+
+REQUESTS = registry.counter(
+    "gateway_requests_total",
+    "HTTP requests handled by the gateway.",
+    ("route", "method", "status"),
+)
+REQUEST_DURATION = registry.histogram(
+    "gateway_request_duration_seconds",
+    "Time from receiving a request to sending the last response byte.",
+    ("route", "method"),
+)
+REQUEST_BYTES = registry.counter(
+    "gateway_request_bytes_total", "Request body bytes received.", ("route",)
+)
+RESPONSE_BYTES = registry.counter(
+    "gateway_response_bytes_total", "Response body bytes sent.", ("route",)
+)
+IN_FLIGHT = registry.gauge(
+    "gateway_requests_in_flight", "Requests currently being handled.", ("method",)
+)
+AUTH_DURATION = registry.histogram(
+    "gateway_auth_duration_seconds",
+    "Time spent authenticating a request (token check and user lookup).",
+    ("outcome",),
+)
+USER_SERVICE_DURATION = registry.histogram(
+    "gateway_user_service_duration_seconds",
+    "User service gRPC call latency.",
+    ("method", "code"),
+)
+UPSTREAM_PHASE = registry.histogram(
+    "gateway_upstream_phase_seconds",
+    "Backend request phases: connect (new connections only), ttfb and transfer.",
+    ("instance", "phase"),
+)
+
+UPSTREAM_OUTSTANDING = registry.gauge(
+    "gateway_upstream_outstanding_requests",
+    "Requests in flight per backend instance.",
+    ("instance",),
+)
+UPSTREAM_CONNECTIONS = registry.gauge(
+    "gateway_upstream_pool_connections",
+    "Pooled backend connections by state.",
+    ("state",),
+)
+UPSTREAM_HOST_SLOTS = registry.gauge(
+    "gateway_upstream_host_slots_in_use",
+    "Per-host connection slots in use, out of UPSTREAM_MAX_CONNECTIONS_PER_HOST.",
+    ("host",),
+)
+BREAKER_OPEN = registry.gauge(
+    "gateway_circuit_breaker_open",
+    "Workers whose circuit breaker for the target is open or half-open.",
+    ("target",),
+)
+CONCURRENCY_LIMIT = registry.gauge(
+    "gateway_concurrency_limit",
+    "Adaptive concurrency limit per backend instance, summed over workers.",
+    ("instance",),
+)
+CONCURRENCY_QUEUED = registry.gauge(
+    "gateway_concurrency_queued_requests",
+    "Requests waiting for a concurrency limiter slot.",
+    ("instance",),
+)
+LOAD_SHED = registry.counter(
+    "gateway_load_shed_total",
+    "Requests rejected with 503 by the concurrency limiter, by role priority.",
+    ("instance", "priority"),
+)
+CACHE_EVENTS = registry.counter(
+    "gateway_cache_events_total", "Cache lookups by outcome.", ("cache", "event")
+)
+CACHE_ENTRIES = registry.gauge(
+    "gateway_cache_entries", "Entries held by each cache.", ("cache",)
+)
+USER_LOOKUP_BATCH = registry.histogram(
+    "gateway_user_lookup_batch_size",
+    "Emails per BatchGetUsersByEmail call.",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256),
+)
+UPSTREAM_RETRIES = registry.counter(
+    "gateway_upstream_retries_total",
+    "Extra attempts by kind (retry, hedge) and attempts denied by the retry budget.",
+    ("target", "kind"),
+)
+UPSTREAM_COLLAPSED = registry.counter(
+    "gateway_upstream_collapsed_total",
+    "Collapsible GETs by outcome: sent to the backend (call) or joined an identical in-flight one (joined).",
+    ("outcome",),
+)
+WEBSOCKET_CONNECTIONS = registry.gauge(
+    "gateway_websocket_connections", "Open proxied WebSocket connections."
+)
+WEBSOCKET_CLOSED = registry.counter(
+    "gateway_websocket_closed_total",
+    "Proxied WebSocket connections by how they ended: closed by the client, the backend, the idle timeout, a relay error, or rejected at the handshake.",
+    ("reason",),
+)
+LOG_RECORDS_DROPPED = registry.counter(
+    "gateway_log_records_dropped_total",
+    "Log records dropped because the log queue was full.",
+)
+
+
+class UpstreamTimer:
+    """
+    httpx trace hook splitting a backend request into connect (only when a new
+    connection is opened), time to first byte (request sent to response
+    headers) and body transfer. The phases are also kept in `phases` for the
+    access log.
+    """
+
+    __slots__ = ("_connect_started", "_headers", "_sent", "instance", "phases")
+
+    def __init__(self, instance: str):
+        self.instance = instance
+        self.phases: dict[str, float] = {}
+        self._connect_started = 0.0
+        self._sent = 0.0
+        self._headers = 0.0
+
+    def _observe(self, phase: str, seconds: float) -> None:
+        self.phases[phase] = seconds
+        if METRICS_ENABLED:
+            UPSTREAM_PHASE.observe(seconds, self.instance, phase)
+
+    async def __call__(self, event: str, info: dict) -> None:
+        if event == "connection.connect_tcp.started":
+            self._connect_started = time.perf_counter()
+        elif event.endswith(".send_request_headers.started"):
+            self._sent = time.perf_counter()
+            # Połączenie (TCP i ewentualnie TLS) jest już gotowe
+            if self._connect_started:
+                self._observe("connect", self._sent - self._connect_started)
+        elif event.endswith(".receive_response_headers.complete"):
+            self._headers = time.perf_counter()
+            self._observe("ttfb", self._headers - self._sent)
+
+    @property
+    def extensions(self) -> dict:
+        return {"trace": self} if METRICS_ENABLED or ACCESS_LOG_ENABLED else {}
+
+    def finish(self) -> None:
+        """Records the transfer phase once the body has been read or relayed."""
+        if self._headers:
+            self._observe("transfer", time.perf_counter() - self._headers)
+
+    def as_fields(self) -> dict[str, float]:
+        return {
+            f"upstream_{phase}_ms": round(seconds * 1000, 3)
+            for phase, seconds in self.phases.items()
+        }
+
+
+class MetricsMiddleware:
+    """
+    Raw ASGI middleware recording per-route latency, status codes, body sizes
+    and in-flight requests. The route label is the matched path template, so
+    `/api/{path:path}` stays one series however many backend paths there are.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        started = time.perf_counter()
+        status_code = 500
+        received = 0
+        sent = 0
+
+        async def receive_counting() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+            return message
+
+        async def send_counting(message: Message) -> None:
+            nonlocal status_code, sent
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            elif message["type"] == "http.response.body":
+                sent += len(message.get("body", b""))
+            await send(message)
+
+        IN_FLIGHT.inc(method)
+        try:
+            await self.app(scope, receive_counting, send_counting)
+        finally:
+            IN_FLIGHT.dec(method)
+            route = scope.get("route")
+            label = getattr(route, "path", None) or "unmatched"
+            REQUESTS.inc(label, method, str(status_code))
+            REQUEST_DURATION.observe(time.perf_counter() - started, label, method)
+            REQUEST_BYTES.inc(label, amount=received)
+            RESPONSE_BYTES.inc(label, amount=sent)
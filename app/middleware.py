@@ -0,0 +1,77 @@
+import copy
+from collections.abc import Iterable, Sequence
+
+from starlette.datastructures import Headers
+from starlette.middleware import Middleware, cors
+from starlette.responses import Response
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.config import CORS_PREFLIGHT_CACHE_SIZE
+
+
+class PathMiddleware:
+    """
+    Runs a middleware stack only for requests whose path starts with one of
+    `prefixes`. Everything else goes straight to the wrapped app, so routes
+    that do not use the stack pay only for the prefix check.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        prefixes: Iterable[str],
+        middleware: Sequence[Middleware],
+    ):
+        self.app = app
+        self.prefixes = tuple(prefixes)
+        stack = app
+        for cls, args, kwargs in reversed(middleware):
+            stack = cls(stack, *args, **kwargs)
+        self.stack = stack
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] in ("http", "websocket") and self.prefixes:
+            path = scope["path"]
+            root_path = scope.get("root_path", "")
+            if root_path and path.startswith(root_path):
+                path = path[len(root_path) :]
+            if path.startswith(self.prefixes):
+                await self.stack(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+
+class CORSMiddleware(cors.CORSMiddleware):
+    """
+    Starlette's CORS middleware with preflight responses cached per origin,
+    method and requested headers, so repeated preflights skip the checks and
+    header building. Browsers keep them for `max_age` seconds on their side.
+    """
+
+    def __init__(
+        self, app: ASGIApp, cache_size: int = CORS_PREFLIGHT_CACHE_SIZE, **options
+    ):
+        super().__init__(app, **options)
+        self.cache_size = cache_size
+        self._preflights: dict[tuple, Response] = {}
+
+    def preflight_response(self, request_headers: Headers) -> Response:
+        key = (
+            request_headers["origin"],
+            request_headers["access-control-request-method"],
+            request_headers.get("access-control-request-headers"),
+            request_headers.get("access-control-request-private-network"),
+        )
+        cached = self._preflights.get(key)
+        if cached is None:
+            cached = super().preflight_response(request_headers)
+            if self.cache_size <= 0:
+                return cached
+            # Przy ORIGINS=* origin pochodzi od klienta, więc cache musi mieć limit
+            if len(self._preflights) >= self.cache_size:
+                del self._preflights[next(iter(self._preflights))]
+            self._preflights[key] = cached
+        # Kopia nagłówków: kolejne middleware mogą je modyfikować w miejscu
+        response = copy.copy(cached)
+        response.raw_headers = list(cached.raw_headers)
+        return response
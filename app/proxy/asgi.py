@@ -0,0 +1,93 @@
+from types import SimpleNamespace
+
+from fastapi import HTTPException, status
+from fastapi.responses import JSONResponse, Response
+from fastapi.security.utils import get_authorization_scheme_param
+from starlette.requests import Request
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.routers.auth.services import get_current_user
+
+from .handler import proxy_request
+
+API_PREFIX = "/api/"
+API_METHODS = frozenset({"GET", "HEAD", "POST", "PUT", "DELETE", "PATCH"})
+
+# Ta sama etykieta trasy co przy routingu FastAPI (metryki, logi)
+API_ROUTE = SimpleNamespace(path="/api/{path:path}")
+
+_ALLOW = {"Allow": ", ".join(sorted(API_METHODS))}
+_NOT_AUTHENTICATED = HTTPException(
+    status_code=status.HTTP_401_UNAUTHORIZED,
+    detail="Not authenticated",
+    headers={"WWW-Authenticate": "Bearer"},
+)
+
+
+def _route_path(scope: Scope) -> str:
+    path = scope["path"]
+    root_path = scope.get("root_path", "")
+    if root_path and path.startswith(root_path):
+        return path[len(root_path) :]
+    return path
+
+
+def bearer_token(scope: Scope) -> str:
+    """
+    Same rules as OAuth2PasswordBearer: the Authorization header must use the
+    Bearer scheme.
+    \nRaises:
+        HTTPException: If the header is missing or uses another scheme.
+    """
+    for key, value in scope["headers"]:
+        if key == b"authorization":
+            authorization = value.decode("latin-1")
+            break
+    else:
+        raise _NOT_AUTHENTICATED
+    scheme, token = get_authorization_scheme_param(authorization)
+    if not authorization or scheme.lower() != "bearer":
+        raise _NOT_AUTHENTICATED
+    return token
+
+
+class ApiFastPath:
+    """
+    Serves /api/{path} straight from the ASGI scope instead of going through
+    FastAPI routing and dependency resolution. Token checks, rate limits and
+    forwarding are the same code the /api route runs, so responses (including
+    401/405/429/503 bodies) are identical.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        path = _route_path(scope)
+        if not path.startswith(API_PREFIX):
+            await self.app(scope, receive, send)
+            return
+
+        scope["route"] = API_ROUTE
+        response = await self.handle(path[len(API_PREFIX) :], scope, receive)
+        await response(scope, receive, send)
+
+    async def handle(self, path: str, scope: Scope, receive: Receive) -> Response:
+        if scope["method"] not in API_METHODS:
+            return JSONResponse(
+                status_code=status.HTTP_405_METHOD_NOT_ALLOWED,
+                content={"detail": "Method Not Allowed"},
+                headers=_ALLOW,
+            )
+        try:
+            user = await get_current_user(bearer_token(scope))
+        except HTTPException as e:
+            return JSONResponse(
+                status_code=e.status_code,
+                content={"detail": e.detail},
+                headers=e.headers,
+            )
+        return await proxy_request(path, Request(scope, receive), user)
@@ -0,0 +1,283 @@
+import asyncio
+import bisect
+import hashlib
+import itertools
+import math
+import random
+import time
+
+import httpx
+
+from app.breaker import CircuitBreaker, CircuitOpenError
+from app.config import (
+    HEALTH_CHECK_INTERVAL,
+    HEALTH_CHECK_PATH,
+    HEALTH_CHECK_TIMEOUT,
+    LB_EWMA_DECAY,
+    LB_STRATEGY,
+    OUTLIER_CONSECUTIVE_FAILURES,
+    OUTLIER_EJECTION_TIME,
+    SERVICE_INSTANCES,
+)
+from app.limiter import ConcurrencyLimiter
+
+
+class Instance:
+    """A backend instance with the load and health state used for picking."""
+
+    def __init__(self, url: str):
+        self.url = url.rstrip("/")
+        self.outstanding = 0
+        self.ewma = 0.0
+        self._ewma_at = time.monotonic()
+        self.healthy = True
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.breaker = CircuitBreaker(self.url)
+        self.limiter = ConcurrencyLimiter(self.url)
+
+    def __repr__(self) -> str:
+        return f"Instance({self.url!r})"
+
+    def available(self, now: float) -> bool:
+        return self.healthy and self.ejected_until <= now
+
+    def observe_latency(self, latency: float, decay: float = LB_EWMA_DECAY) -> None:
+        # EWMA zanikające w czasie: stare pomiary tracą wagę także bez nowego ruchu
+        now = time.monotonic()
+        weight = math.exp(-(now - self._ewma_at) / decay) if decay > 0 else 0.0
+        self._ewma_at = now
+        self.ewma = self.ewma * weight + latency * (1 - weight)
+
+    def cost(self) -> float:
+        return self.ewma * (self.outstanding + 1)
+
+
+class RoundRobin:
+    def __init__(self, instances: list[Instance]):
+        self._counter = itertools.count()
+
+    def pick(self, candidates: list[Instance], key: str | None) -> Instance:
+        return candidates[next(self._counter) % len(candidates)]
+
+
+class LeastOutstanding:
+    def __init__(self, instances: list[Instance]):
+        self._counter = itertools.count()
+
+    def pick(self, candidates: list[Instance], key: str | None) -> Instance:
+        # Remisy rozstrzygamy rotacyjnie, żeby przy małym ruchu nie wybierać zawsze pierwszej
+        start = next(self._counter) % len(candidates)
+        rotated = candidates[start:] + candidates[:start]
+        return min(rotated, key=lambda instance: instance.outstanding)
+
+
+class PowerOfTwoChoices:
+    """Samples two instances and takes the one with the lower EWMA latency x load."""
+
+    def __init__(self, instances: list[Instance]):
+        pass
+
+    def pick(self, candidates: list[Instance], key: str | None) -> Instance:
+        if len(candidates) == 1:
+            return candidates[0]
+        first, second = random.sample(candidates, 2)
+        return first if first.cost() <= second.cost() else second
+
+
+class ConsistentHash:
+    """
+    Hash ring with virtual nodes, so requests for the same key (user email) keep
+    landing on the same instance and only ~1/N of keys move when one drops out.
+    """
+
+    def __init__(self, instances: list[Instance], replicas: int = 100):
+        ring = sorted(
+            (self._hash(f"{instance.url}#{replica}"), instance)
+            for instance in instances
+            for replica in range(replicas)
+        )
+        self._points = [point for point, _ in ring]
+        self._instances = [instance for _, instance in ring]
+
+    @staticmethod
+    def _hash(value: str) -> int:
+        return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest())
+
+    def pick(self, candidates: list[Instance], key: str | None) -> Instance:
+        if key is None:
+            return random.choice(candidates)
+        allowed = set(candidates)
+        start = bisect.bisect(self._points, self._hash(key))
+        for offset in range(len(self._instances)):
+            instance = self._instances[(start + offset) % len(self._instances)]
+            if instance in allowed:
+                return instance
+        return candidates[0]
+
+
+STRATEGIES = {
+    "round_robin": RoundRobin,
+    "least_outstanding": LeastOutstanding,
+    "p2c_ewma": PowerOfTwoChoices,
+    "consistent_hash": ConsistentHash,
+}
+
+
+class UpstreamPool:
+    """
+    Backend instances behind one gateway. Instances failing active health checks
+    or returning too many consecutive errors are taken out of rotation; if none
+    are left, all of them are used again rather than failing every request.
+    """
+
+    def __init__(
+        self,
+        urls: list[str],
+        strategy: str = "round_robin",
+        max_failures: int = OUTLIER_CONSECUTIVE_FAILURES,
+        ejection_time: float = OUTLIER_EJECTION_TIME,
+    ):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown load balancing strategy: {strategy}")
+        self.instances = [Instance(url) for url in urls if url]
+        self._strategy = STRATEGIES[strategy](self.instances)
+        self._max_failures = max_failures
+        self._ejection_time = ejection_time
+        self._health_task: asyncio.Task | None = None
+
+    def pick(
+        self, key: str | None = None, exclude: set[Instance] | None = None
+    ) -> Instance:
+        """
+        Picks an instance among those that are healthy, not ejected and whose
+        circuit breaker lets calls through. Instances in `exclude` (tried
+        already by a retry) are skipped unless nothing else is left.
+        \nRaises:
+            CircuitOpenError: If the breaker of every instance is open.
+        """
+        if not self.instances:
+            raise RuntimeError("No upstream instances configured")
+        now = time.monotonic()
+        permitted = [
+            instance for instance in self.instances if instance.breaker.permits(now)
+        ]
+        if not permitted:
+            raise CircuitOpenError("all upstream instances")
+        candidates = [
+            instance for instance in permitted if instance.available(now)
+        ] or permitted
+        if exclude:
+            candidates = [
+                instance for instance in candidates if instance not in exclude
+            ] or candidates
+        return self._strategy.pick(candidates, key)
+
+    def lease(
+        self, key: str | None = None, exclude: set[Instance] | None = None
+    ) -> "Lease":
+        """Picks an instance and counts a request as outstanding on it."""
+        instance = self.pick(key, exclude)
+        instance.breaker.before_call()
+        return Lease(self, instance)
+
+    async def acquire(
+        self,
+        key: str | None = None,
+        exclude: set[Instance] | None = None,
+        priority: int = 0,
+        wait: bool = True,
+    ) -> "Lease":
+        """
+        lease() that first takes a slot from the picked instance's concurrency
+        limiter, waiting for one in its queue if `wait` is set.
+        \nRaises:
+            CircuitOpenError: If the breaker of every instance is open.
+            OverloadedError: If the limiter sheds the request.
+        """
+        instance = self.pick(key, exclude)
+        await instance.limiter.acquire(priority, wait)
+        try:
+            instance.breaker.before_call()
+        except CircuitOpenError:
+            instance.limiter.release()
+            raise
+        return Lease(self, instance, limited=True)
+
+    def _record(self, instance: Instance, latency: float, ok: bool) -> None:
+        instance.breaker.on_result(latency, ok)
+        instance.observe_latency(latency)
+        if ok:
+            instance.consecutive_failures = 0
+            return
+        instance.consecutive_failures += 1
+        if instance.consecutive_failures >= self._max_failures:
+            instance.ejected_until = time.monotonic() + self._ejection_time
+            instance.consecutive_failures = 0
+
+    async def _check(self, client: httpx.AsyncClient, instance: Instance) -> None:
+        try:
+            response = await client.get(
+                f"{instance.url}{HEALTH_CHECK_PATH}", timeout=HEALTH_CHECK_TIMEOUT
+            )
+            instance.healthy = response.status_code < 400
+        except httpx.HTTPError:
+            instance.healthy = False
+
+    async def _health_loop(self, client: httpx.AsyncClient) -> None:
+        while True:
+            await asyncio.gather(
+                *(self._check(client, instance) for instance in self.instances)
+            )
+            await asyncio.sleep(HEALTH_CHECK_INTERVAL)
+
+    def start_health_checks(self, client: httpx.AsyncClient) -> None:
+        if HEALTH_CHECK_PATH and self._health_task is None:
+            self._health_task = asyncio.create_task(self._health_loop(client))
+
+    async def stop_health_checks(self) -> None:
+        if self._health_task is not None:
+            task, self._health_task = self._health_task, None
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+
+class Lease:
+    """
+    One request in flight on an instance. The outcome (latency up to the
+    response headers, success or failure) and the end of the request are
+    reported separately, since a streamed body can outlive its headers by far.
+    A `limited` lease also holds a concurrency limiter slot until released.
+    """
+
+    def __init__(self, pool: UpstreamPool, instance: Instance, limited: bool = False):
+        self.instance = instance
+        self._pool = pool
+        self._limited = limited
+        self._started = time.monotonic()
+        self._recorded = False
+        self._released = False
+        instance.outstanding += 1
+
+    def record(self, ok: bool) -> None:
+        if not self._recorded:
+            self._recorded = True
+            latency = time.monotonic() - self._started
+            self._pool._record(self.instance, latency, ok)
+            if self._limited:
+                self.instance.limiter.on_result(latency, ok)
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self.instance.outstanding -= 1
+            if not self._recorded:
+                self.instance.breaker.on_cancel()
+            if self._limited:
+                self.instance.limiter.release()
+
+
+upstream_pool = UpstreamPool(SERVICE_INSTANCES, LB_STRATEGY)
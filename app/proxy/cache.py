@@ -0,0 +1,425 @@
+import asyncio
+import hashlib
+import os
+import time
+import uuid
+from collections import OrderedDict
+from collections.abc import Mapping
+from email.utils import parsedate_to_datetime
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+from app.access_log import logger
+from app.config import (
+    PROXY_CACHE_MAX_BYTES,
+    PROXY_CACHE_MAX_ENTRY_BYTES,
+    PROXY_CACHE_SPILL_DIR,
+    PROXY_CACHE_SPILL_MAX_BYTES,
+)
+
+CACHEABLE_METHODS = frozenset({"GET", "HEAD"})
+CACHEABLE_STATUSES = frozenset({200, 203, 300, 301, 404, 410})
+
+# Nagłówki warunkowe klienta; przy rewalidacji zastępują je walidatory wpisu
+CONDITIONAL_REQUEST_HEADERS = frozenset({"if-none-match", "if-modified-since"})
+
+# Nagłówki z odpowiedzi 304, które nadpisują zapisane w cache
+REFRESHED_HEADERS = frozenset(
+    {"cache-control", "date", "etag", "expires", "last-modified"}
+)
+
+
+def _lower(headers: Mapping[str, str]) -> dict[str, str]:
+    return {key.lower(): value for key, value in headers.items()}
+
+
+def parse_cache_control(value: str | None) -> dict[str, str | None]:
+    directives: dict[str, str | None] = {}
+    if not value:
+        return directives
+    for part in value.split(","):
+        name, _, argument = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = argument.strip('"') or None
+    return directives
+
+
+def _seconds(value: str | None) -> int | None:
+    return int(value) if value is not None and value.isdigit() else None
+
+
+def _http_date(value: str | None) -> float | None:
+    if not value:
+        return None
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def freshness_lifetime(headers: Mapping[str, str]) -> float | None:
+    """Explicit freshness for a shared cache: s-maxage, then max-age, then Expires."""
+    directives = parse_cache_control(headers.get("cache-control"))
+    for name in ("s-maxage", "max-age"):
+        seconds = _seconds(directives.get(name))
+        if seconds is not None:
+            return seconds
+    expires = _http_date(headers.get("expires"))
+    if expires is not None:
+        date = _http_date(headers.get("date")) or time.time()
+        return max(expires - date, 0)
+    return None
+
+
+def is_storable(
+    status_code: int,
+    response_headers: Mapping[str, str],
+    request_headers: Mapping[str, str],
+) -> bool:
+    if status_code not in CACHEABLE_STATUSES:
+        return False
+    request_headers = _lower(request_headers)
+    response_headers = _lower(response_headers)
+    request_directives = parse_cache_control(request_headers.get("cache-control"))
+    directives = parse_cache_control(response_headers.get("cache-control"))
+    if "no-store" in request_directives or "no-store" in directives:
+        return False
+    # Bramka to cache współdzielony: odpowiedzi prywatne i dla zalogowanych tylko jawnie
+    if "private" in directives:
+        return False
+    if "authorization" in request_headers and not (
+        "public" in directives
+        or "s-maxage" in directives
+        or "must-revalidate" in directives
+    ):
+        return False
+    vary = response_headers.get("vary", "").strip().lower()
+    if vary == "*":
+        return False
+    # Skompresowane ciało bez Vary: Accept-Encoding trafiłoby do klientów, którzy go nie zdekodują
+    if "content-encoding" in response_headers and "accept-encoding" not in vary:
+        return False
+    return (
+        freshness_lifetime(response_headers) is not None
+        or "etag" in response_headers
+        or "last-modified" in response_headers
+    )
+
+
+def _vary_names(headers: Mapping[str, str]) -> tuple[str, ...]:
+    names = (name.strip().lower() for name in headers.get("vary", "").split(","))
+    return tuple(sorted({name for name in names if name}))
+
+
+class CachedResponse:
+    def __init__(
+        self,
+        status_code: int,
+        headers: dict[str, str],
+        size: int,
+    ):
+        self.status_code = status_code
+        self.headers = headers
+        self.size = size
+        self.body: bytes | None = None
+        self.path: str | None = None
+        self.variant_key: tuple[str, tuple] | None = None
+        self.refresh(headers)
+
+    def refresh(self, headers: Mapping[str, str]) -> None:
+        self.stored_at = time.time()
+        self.lifetime = freshness_lifetime(headers) or 0
+        directives = parse_cache_control(headers.get("cache-control"))
+        self.no_cache = "no-cache" in directives
+
+    @property
+    def etag(self) -> str | None:
+        return self.headers.get("etag")
+
+    @property
+    def last_modified(self) -> str | None:
+        return self.headers.get("last-modified")
+
+    def age(self) -> float:
+        return time.time() - self.stored_at
+
+    def is_fresh(self) -> bool:
+        return not self.no_cache and self.age() < self.lifetime
+
+    def usable_for(self, request_headers: Mapping[str, str]) -> bool:
+        """Whether the entry may be served without asking the backend."""
+        directives = parse_cache_control(_lower(request_headers).get("cache-control"))
+        return self.is_fresh() and "no-cache" not in directives
+
+
+def _variant_key(
+    key: str, names: tuple[str, ...], request_headers: Mapping[str, str]
+) -> tuple[str, tuple]:
+    return key, tuple((name, request_headers.get(name)) for name in names)
+
+
+class ResponseCache:
+    """
+    Shared cache of backend GET responses with an LRU memory budget. Bodies over
+    `max_entry_bytes` are spilled to `spill_dir` (if set) under their own budget.
+    Variants are selected by the request headers named in `Vary` - as seen by
+    the backend, so including the injected `Role`.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = PROXY_CACHE_MAX_BYTES,
+        max_entry_bytes: int = PROXY_CACHE_MAX_ENTRY_BYTES,
+        spill_dir: str = PROXY_CACHE_SPILL_DIR,
+        spill_max_bytes: int = PROXY_CACHE_SPILL_MAX_BYTES,
+    ):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.spill_dir = spill_dir
+        self.spill_max_bytes = spill_max_bytes
+        self._entries: OrderedDict[tuple[str, tuple], CachedResponse] = OrderedDict()
+        # Dla każdego URL: nazwy nagłówków z Vary i klucze zapisanych wariantów
+        self._variants: dict[str, tuple[tuple[str, ...], set]] = {}
+        self.memory_bytes = 0
+        self.disk_bytes = 0
+        self.hits = 0
+        self.stale = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.not_modified = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def lookup(
+        self, key: str, request_headers: Mapping[str, str]
+    ) -> CachedResponse | None:
+        """Returns the stored variant for the request, fresh or not, if any."""
+        entry = None
+        request_headers = _lower(request_headers)
+        variants = self._variants.get(key)
+        if variants is not None:
+            variant_key = _variant_key(key, variants[0], request_headers)
+            entry = self._entries.get(variant_key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(variant_key)
+        if entry.usable_for(request_headers):
+            self.hits += 1
+        else:
+            self.stale += 1
+        return entry
+
+    async def store(
+        self,
+        key: str,
+        request_headers: Mapping[str, str],
+        status_code: int,
+        response_headers: Mapping[str, str],
+        body: bytes,
+    ) -> None:
+        size = len(body)
+        spill = size > self.max_entry_bytes
+        if spill and (not self.spill_dir or size > self.spill_max_bytes):
+            return
+
+        request_headers = _lower(request_headers)
+        response_headers = _lower(response_headers)
+        names = _vary_names(response_headers)
+        entry = CachedResponse(status_code, response_headers, size)
+        if spill:
+            entry.path = os.path.join(self.spill_dir, uuid.uuid4().hex)
+            try:
+                await asyncio.to_thread(_write_file, entry.path, body)
+            except OSError as exc:
+                # Brak miejsca na dysku nie może zepsuć odpowiedzi, którą backend już dał
+                logger.warning("Could not spill cached response to disk: %r", exc)
+                _unlink(entry.path)
+                return
+            self.disk_bytes += size
+        else:
+            entry.body = body
+            self.memory_bytes += size
+
+        # Stary wpis usuwamy najpierw: _remove kasuje też pusty zbiór wariantów URL-a
+        variant_key = entry.variant_key = _variant_key(key, names, request_headers)
+        self._remove(variant_key)
+        variants = self._variants.get(key)
+        if variants is not None and variants[0] != names:
+            # Backend zmienił Vary - stare warianty nie pasują już do żadnego klucza
+            for old_key in list(variants[1]):
+                self._remove(old_key)
+            variants = None
+        if variants is None:
+            variants = self._variants[key] = (names, set())
+        self._entries[variant_key] = entry
+        variants[1].add(variant_key)
+        self._evict()
+
+    def freshen(self, entry: CachedResponse, headers: Mapping[str, str]) -> bool:
+        """
+        Applies a backend 304 to a revalidated entry: the stored body is still
+        valid. A 304 whose ETag differs from the entry's does not describe the
+        stored body, so the entry is dropped instead and False returned.
+        """
+        headers = _lower(headers)
+        etag = headers.get("etag")
+        if etag is not None and etag != entry.etag:
+            if self._entries.get(entry.variant_key) is entry:
+                self._remove(entry.variant_key)
+            return False
+        entry.headers.update(
+            {
+                name: value
+                for name, value in headers.items()
+                if name in REFRESHED_HEADERS
+            }
+        )
+        entry.refresh(entry.headers)
+        self.revalidated += 1
+        return True
+
+    async def read_body(self, entry: CachedResponse) -> bytes | None:
+        """
+        The entry's body, or None if its spilled file is gone (removed by a
+        concurrent store or eviction) or unreadable; the entry is dropped then.
+        """
+        if entry.body is not None:
+            return entry.body
+        try:
+            return await asyncio.to_thread(_read_file, entry.path)
+        except OSError as exc:
+            logger.warning("Could not read cached response from disk: %r", exc)
+            if self._entries.get(entry.variant_key) is entry:
+                self._remove(entry.variant_key)
+            return None
+
+    def _remove(self, variant_key: tuple[str, tuple]) -> None:
+        entry = self._entries.pop(variant_key, None)
+        if entry is None:
+            return
+        variants = self._variants.get(variant_key[0])
+        if variants is not None:
+            variants[1].discard(variant_key)
+            if not variants[1]:
+                del self._variants[variant_key[0]]
+        if entry.path is not None:
+            self.disk_bytes -= entry.size
+            _unlink(entry.path)
+        else:
+            self.memory_bytes -= entry.size
+
+    def _evict(self) -> None:
+        while self._entries and (
+            self.memory_bytes > self.max_bytes or self.disk_bytes > self.spill_max_bytes
+        ):
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def clear(self) -> None:
+        for variant_key in list(self._entries):
+            self._remove(variant_key)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "memory_bytes": self.memory_bytes,
+            "disk_bytes": self.disk_bytes,
+            "hits": self.hits,
+            "stale": self.stale,
+            "misses": self.misses,
+            "revalidated": self.revalidated,
+            "not_modified": self.not_modified,
+            "evictions": self.evictions,
+        }
+
+
+def _write_file(path: str, body: bytes) -> None:
+    with open(path, "wb") as file:
+        file.write(body)
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as file:
+        return file.read()
+
+
+def _unlink(path: str) -> None:
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+def cache_key(cluster: str, path: str, query: str) -> str:
+    # Klucz opisuje zasób backendu: ta sama ścieżka może prowadzić do różnych klastrów
+    return hashlib.sha256(f"{cluster}:{path}?{query}".encode()).hexdigest()
+
+
+def conditional_headers(
+    entry: CachedResponse, request_headers: Mapping[str, str]
+) -> dict[str, str]:
+    """
+    The request headers for revalidating a stale entry with the backend: the
+    client's own validators are replaced with the entry's, so a 304 always
+    refers to the stored body.
+    """
+    headers = {
+        name: value
+        for name, value in request_headers.items()
+        if name.lower() not in CONDITIONAL_REQUEST_HEADERS
+    }
+    if entry.etag:
+        headers["If-None-Match"] = entry.etag
+    if entry.last_modified:
+        headers["If-Modified-Since"] = entry.last_modified
+    return headers
+
+
+def _weak(etag: str) -> str:
+    return etag.removeprefix("W/")
+
+
+def client_has_current(entry: CachedResponse, request: Request) -> bool:
+    """Whether the client's own conditional headers allow answering 304."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if entry.etag is None:
+            return False
+        tags = {_weak(tag.strip()) for tag in if_none_match.split(",")}
+        return "*" in tags or _weak(entry.etag) in tags
+
+    since = _http_date(request.headers.get("if-modified-since"))
+    modified = _http_date(entry.last_modified)
+    return since is not None and modified is not None and modified <= since
+
+
+async def respond(
+    cache: ResponseCache, entry: CachedResponse, request: Request
+) -> Response | None:
+    """
+    Serves a cached entry, answering 304 when the client's copy is current.
+    Returns None if the body can no longer be read, which callers treat as a miss.
+    """
+    headers = dict(entry.headers)
+    headers["age"] = str(int(entry.age()))
+    if entry.status_code == 200 and client_has_current(entry, request):
+        cache.not_modified += 1
+        headers.pop("content-length", None)
+        return Response(status_code=304, headers=headers)
+    body = await cache.read_body(entry)
+    if body is None:
+        return None
+    return Response(
+        content=body,
+        status_code=entry.status_code,
+        headers=headers,
+        media_type=entry.headers.get("content-type"),
+    )
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,162 @@
+import asyncio
+
+import httpx
+
+from app.config import (
+    SERVICE_INSTANCES,
+    UPSTREAM_CONNECT_TIMEOUT,
+    UPSTREAM_HTTP2,
+    UPSTREAM_KEEPALIVE_EXPIRY,
+    UPSTREAM_MAX_CONNECTIONS,
+    UPSTREAM_MAX_CONNECTIONS_PER_HOST,
+    UPSTREAM_MAX_KEEPALIVE_CONNECTIONS,
+    UPSTREAM_POOL_TIMEOUT,
+    UPSTREAM_TIMEOUT,
+    UPSTREAM_WARMUP_CONNECTIONS,
+)
+
+_client: httpx.AsyncClient | None = None
+
+
+class _ReleasingStream(httpx.AsyncByteStream):
+    """Response body wrapper that frees the per-host slot once the body is closed."""
+
+    def __init__(self, stream: httpx.AsyncByteStream, semaphore: asyncio.Semaphore):
+        self._stream = stream
+        self._semaphore = semaphore
+        self._released = False
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            if not self._released:
+                self._released = True
+                self._semaphore.release()
+
+
+class PerHostLimitTransport(httpx.AsyncBaseTransport):
+    """
+    Caps concurrent requests per upstream host on top of the pool-wide limit,
+    so a single slow instance cannot take every connection in the pool.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, max_per_host: int):
+        self._transport = transport
+        self._max_per_host = max_per_host
+        self._semaphores: dict[tuple[str, str, int | None], asyncio.Semaphore] = {}
+
+    def _semaphore_for(self, url: httpx.URL) -> asyncio.Semaphore:
+        key = (url.scheme, url.host, url.port)
+        semaphore = self._semaphores.get(key)
+        if semaphore is None:
+            semaphore = self._semaphores[key] = asyncio.Semaphore(self._max_per_host)
+        return semaphore
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        semaphore = self._semaphore_for(request.url)
+        pool_timeout = request.extensions.get("timeout", {}).get("pool")
+        try:
+            async with asyncio.timeout(pool_timeout):
+                await semaphore.acquire()
+        except TimeoutError:
+            raise httpx.PoolTimeout(
+                "Timed out waiting for a per-host connection slot", request=request
+            )
+
+        try:
+            response = await self._transport.handle_async_request(request)
+        except BaseException:
+            semaphore.release()
+            raise
+        response.stream = _ReleasingStream(response.stream, semaphore)
+        return response
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+    def stats(self) -> dict:
+        """Pool utilisation: open and idle connections, busy slots per host."""
+        pool = getattr(self._transport, "_pool", None)
+        connections = list(getattr(pool, "connections", ()))
+        return {
+            "connections": len(connections),
+            "idle": sum(1 for connection in connections if connection.is_idle()),
+            "in_use_per_host": {
+                f"{scheme}://{host}:{port}": self._max_per_host - semaphore._value
+                for (scheme, host, port), semaphore in self._semaphores.items()
+            },
+        }
+
+
+def create_client() -> httpx.AsyncClient:
+    """Builds the pooled upstream client from the settings in `app.config`."""
+    limits = httpx.Limits(
+        max_connections=UPSTREAM_MAX_CONNECTIONS,
+        max_keepalive_connections=UPSTREAM_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=UPSTREAM_KEEPALIVE_EXPIRY,
+    )
+    transport = PerHostLimitTransport(
+        httpx.AsyncHTTPTransport(limits=limits, http2=UPSTREAM_HTTP2),
+        max_per_host=UPSTREAM_MAX_CONNECTIONS_PER_HOST,
+    )
+    timeout = httpx.Timeout(
+        UPSTREAM_TIMEOUT,
+        connect=UPSTREAM_CONNECT_TIMEOUT,
+        pool=UPSTREAM_POOL_TIMEOUT,
+    )
+    # Bez Accept-Encoding od klienta backend ma odpowiadać bez kompresji
+    # (httpx domyślnie wysyła "gzip, deflate", a ciała nie dekodujemy)
+    return httpx.AsyncClient(
+        transport=transport,
+        timeout=timeout,
+        headers={"accept-encoding": "identity"},
+    )
+
+
+async def _warm_up(
+    client: httpx.AsyncClient, urls: list[str], connections: int
+) -> None:
+    # Równoległe żądania wymuszają otwarcie osobnych połączeń, które zostają w puli
+    if connections <= 0:
+        return
+    await asyncio.gather(
+        *(client.head(url) for url in urls if url for _ in range(connections)),
+        return_exceptions=True,
+    )
+
+
+async def open_client(urls: list[str] = SERVICE_INSTANCES) -> httpx.AsyncClient:
+    """
+    Creates the worker-wide client on startup and pre-opens warm-up connections
+    to every backend instance in `urls`.
+    """
+    global _client
+    if _client is None:
+        _client = create_client()
+        await _warm_up(_client, urls, UPSTREAM_WARMUP_CONNECTIONS)
+    return _client
+
+
+async def close_client() -> None:
+    """Closes pooled connections on shutdown."""
+    global _client
+    if _client is not None:
+        client, _client = _client, None
+        await client.aclose()
+
+
+def pool_stats() -> dict:
+    if _client is None:
+        return {"connections": 0, "idle": 0, "in_use_per_host": {}}
+    return _client._transport.stats()
+
+
+def get_client() -> httpx.AsyncClient:
+    if _client is None:
+        raise RuntimeError("Upstream HTTP client is not running")
+    return _client
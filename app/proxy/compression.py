@@ -0,0 +1,197 @@
+import asyncio
+import gzip
+from collections.abc import Callable
+
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.access_log import logger
+from app.config import (
+    PROXY_COMPRESSION_ENCODINGS,
+    PROXY_COMPRESSION_MIN_SIZE,
+    PROXY_COMPRESSION_THREAD_SIZE,
+    PROXY_COMPRESSION_TYPES,
+)
+
+from .cache import parse_cache_control
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# Poziomy dobrane pod odpowiedzi dynamiczne: szybkość ważniejsza od stopnia kompresji
+def _gzip(body: bytes) -> bytes:
+    return gzip.compress(body, compresslevel=6, mtime=0)
+
+
+def _brotli(body: bytes) -> bytes:
+    return brotli.compress(body, quality=4)
+
+
+def _zstd(body: bytes) -> bytes:
+    # Kompresor nie jest bezpieczny wątkowo, więc każde wywołanie ma własny
+    return zstandard.ZstdCompressor(level=3).compress(body)
+
+
+CODECS: dict[str, Callable[[bytes], bytes]] = {"gzip": _gzip}
+if brotli is not None:
+    CODECS["br"] = _brotli
+if zstandard is not None:
+    CODECS["zstd"] = _zstd
+
+
+def available_encodings(configured: list[str]) -> tuple[str, ...]:
+    """Configured encodings in preference order, minus those whose library is missing."""
+    missing = [name for name in configured if name not in CODECS]
+    if missing:
+        logger.warning("Compression disabled for %s: library not installed", missing)
+    return tuple(name for name in configured if name in CODECS)
+
+
+def accepted_encodings(accept_encoding: str) -> dict[str, float]:
+    """Parses Accept-Encoding into {coding: q}; codings with q=0 are kept as refused."""
+    accepted = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding] = q
+    return accepted
+
+
+def negotiate(accept_encoding: str, encodings: tuple[str, ...]) -> str | None:
+    """
+    Picks the encoding with the highest q among `encodings`; ties go to the
+    order of `encodings` (the server's preference).
+    """
+    if not accept_encoding:
+        return None
+    accepted = accepted_encodings(accept_encoding)
+    wildcard = accepted.get("*", 0.0)
+    best, best_q = None, 0.0
+    for name in encodings:
+        q = accepted.get(name, wildcard)
+        if q > best_q:
+            best, best_q = name, q
+    return best
+
+
+def compressible_type(content_type: str | None) -> bool:
+    if not content_type:
+        return False
+    media_type = content_type.partition(";")[0].strip().lower()
+    return any(media_type.startswith(prefix) for prefix in PROXY_COMPRESSION_TYPES)
+
+
+def _weaken(etag: str) -> str:
+    # Skompresowana reprezentacja nie jest bajtowo równa oryginałowi (RFC 9110 8.8.3)
+    return etag if etag.startswith("W/") else f"W/{etag}"
+
+
+async def compress(encoding: str, body: bytes) -> bytes:
+    """Compresses on the event loop for small bodies, in a worker thread otherwise."""
+    codec = CODECS[encoding]
+    if len(body) < PROXY_COMPRESSION_THREAD_SIZE:
+        return codec(body)
+    return await asyncio.to_thread(codec, body)
+
+
+class CompressionMiddleware:
+    """
+    Raw ASGI middleware compressing buffered responses with gzip, brotli or
+    zstd as negotiated through Accept-Encoding. Only bodies of at least
+    PROXY_COMPRESSION_MIN_SIZE bytes with an allowlisted content type are
+    compressed; responses that already carry a Content-Encoding (e.g. passed
+    through from the backend), use no-transform or are streamed (no
+    Content-Length, or several chunks) go out untouched.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self.encodings = available_encodings(PROXY_COMPRESSION_ENCODINGS)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] == "HEAD" or not self.encodings:
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = ""
+        for key, value in scope["headers"]:
+            if key == b"accept-encoding":
+                accept_encoding = value.decode("latin-1")
+                break
+        encoding = negotiate(accept_encoding, self.encodings)
+        start: Message | None = None
+
+        async def send_compressed(message: Message) -> None:
+            nonlocal start
+            if message["type"] == "http.response.start":
+                if self._eligible(message["status"], MutableHeaders(scope=message)):
+                    # Decyzja zapada dopiero przy ciele, więc wstrzymujemy nagłówki
+                    start = message
+                else:
+                    # Strumień (SSE, long-poll) dostaje status i nagłówki od razu
+                    await send(message)
+                return
+            if start is None or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            response_start, start = start, None
+            body = message.get("body", b"")
+            if message.get("more_body", False):
+                await send(response_start)
+                await send(message)
+                return
+
+            headers = MutableHeaders(scope=response_start)
+            if len(body) < PROXY_COMPRESSION_MIN_SIZE:
+                await send(response_start)
+                await send(message)
+                return
+
+            if "accept-encoding" not in headers.get("vary", "").lower():
+                headers.add_vary_header("Accept-Encoding")
+            if encoding is not None:
+                body = await compress(encoding, body)
+                headers["content-encoding"] = encoding
+                headers["content-length"] = str(len(body))
+                if "etag" in headers:
+                    headers["etag"] = _weaken(headers["etag"])
+            await send(response_start)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_compressed)
+
+    @staticmethod
+    def _eligible(status_code: int, headers: MutableHeaders) -> bool:
+        """Whether a response with this start could be compressed once its body arrives."""
+        length = headers.get("content-length")
+        return (
+            status_code >= 200
+            and status_code not in (204, 206, 304)
+            # Bez Content-Length odpowiedź jest strumieniowana
+            and length is not None
+            and length.isdigit()
+            and int(length) >= PROXY_COMPRESSION_MIN_SIZE
+            and "content-encoding" not in headers
+            and "content-range" not in headers
+            and compressible_type(headers.get("content-type"))
+            and "no-transform" not in parse_cache_control(headers.get("cache-control"))
+        )
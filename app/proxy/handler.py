@@ -0,0 +1,403 @@
+import httpx
+from fastapi import status
+from fastapi.responses import JSONResponse, Response
+from starlette.requests import Request
+
+from app.access_log import logger, note
+from app.breaker import CircuitOpenError
+from app.config import (
+    BREAKER_OPEN_DURATION,
+    PROXY_COLLAPSE_PREFIXES,
+    PROXY_COLLAPSE_VARY_HEADERS,
+    PROXY_MAX_REQUEST_BODY_SIZE,
+    PROXY_MAX_RESPONSE_BODY_SIZE,
+    PROXY_STREAMING,
+)
+from app.limiter import OverloadedError, role_priority
+from app.metrics import UpstreamTimer
+from app.ratelimit import rate_limiter
+from app.retry import RetryPolicy
+from app.routers.auth.proto_gen import user_p2p
+from app.singleflight import SingleFlight
+
+from . import client as upstream
+from .balancer import Instance, Lease
+from .cache import (
+    CACHEABLE_METHODS,
+    CachedResponse,
+    cache_key,
+    conditional_headers,
+    is_storable,
+    respond,
+    response_cache,
+)
+from .headers import (
+    EXCLUDED_RESPONSE_HEADERS,
+    filter_headers,
+    upstream_raw_headers,
+)
+from .routes import DEFAULT_CLUSTER, api_routes
+from .streaming import (
+    RequestBodyTooLarge,
+    ResponseBodyTooLarge,
+    check_length,
+    declared_length,
+    forward_streaming,
+    read_raw,
+)
+
+# Metody, które można bezpiecznie wysłać do backendu ponownie
+RETRYABLE_METHODS = frozenset({"GET", "HEAD", "PUT", "DELETE"})
+RETRYABLE_STATUSES = frozenset({502, 503, 504})
+
+retry_policy = RetryPolicy("backend")
+
+# Odpowiedź zależy też od nagłówków warunkowych wysłanych przez klienta
+COLLAPSE_KEY_HEADERS = (
+    *PROXY_COLLAPSE_VARY_HEADERS,
+    "if-none-match",
+    "if-modified-since",
+)
+
+request_collapser = SingleFlight()
+
+
+def _collapse_key(
+    request: Request,
+    cluster: str,
+    upstream_path: str,
+    headers: dict[str, str],
+    cached: CachedResponse | None,
+) -> tuple | None:
+    """
+    Key under which identical concurrent GETs share one backend call, or None
+    when the request is not collapsed (other methods, paths outside
+    PROXY_COLLAPSE_PREFIXES). Revalidations of a cached entry are keyed by
+    its validators, so a 304 only reaches requests holding that entry.
+    """
+    if request.method != "GET" or not PROXY_COLLAPSE_PREFIXES:
+        return None
+    path = request.scope["path"]
+    if not path.startswith(PROXY_COLLAPSE_PREFIXES):
+        return None
+    return (
+        request.method,
+        cluster,
+        upstream_path,
+        request.scope["query_string"],
+        headers.get("Role"),
+        *(headers.get(name) for name in COLLAPSE_KEY_HEADERS),
+        None if cached is None else (cached.etag, cached.last_modified),
+    )
+
+
+async def proxy_request(path: str, request: Request, user: user_p2p.User) -> Response:
+    """
+    Forwards an authenticated request to the backend, applying the user's and
+    role's rate limits first. Shared by the /api route and the raw ASGI fast path.
+    """
+    decision = rate_limiter.check(user.email, user.role)
+    if decision is None:
+        return await forward(path, request, user)
+    if not decision.allowed:
+        return JSONResponse(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            content={"error": "Too Many Requests"},
+            headers=decision.headers(),
+        )
+    response = await forward(path, request, user)
+    response.headers.update(decision.headers())
+    return response
+
+
+async def forward(path: str, request: Request, user: user_p2p.User) -> Response:
+    route = api_routes.match(f"/{path}", request.method, request.headers.get("host"))
+    if route is None:
+        return JSONResponse(
+            status_code=status.HTTP_404_NOT_FOUND,
+            content={"error": "Not Found", "details": "No route for this request"},
+        )
+    if route.cluster != DEFAULT_CLUSTER:
+        note(cluster=route.cluster)
+    upstream_path = route.upstream_path(f"/{path}")
+
+    # Kopiowanie nagłówków, usuwamy te niepotrzebne
+    headers = upstream_raw_headers(request.headers.raw, user.role)
+
+    # Cache działa tylko w trybie buforowanym; świeży wpis omija backend całkowicie
+    use_cache = (
+        response_cache.enabled
+        and not PROXY_STREAMING
+        and request.method in CACHEABLE_METHODS
+    )
+    cached = None
+    if use_cache:
+        key = cache_key(route.cluster, upstream_path, request.url.query)
+        cached = response_cache.lookup(key, headers)
+        if cached is not None and cached.usable_for(headers):
+            response = await respond(response_cache, cached, request)
+            if response is not None:
+                note(cache="hit")
+                return response
+            # Plik wpisu usunął w międzyczasie inny zapis lub eviction
+            cached = None
+        note(cache="miss" if cached is None else "stale")
+
+    url = upstream_path
+    lease = None
+    streaming = False
+    # Przy przeciążeniu niższe priorytety czekają dłużej i są odrzucane pierwsze
+    priority = role_priority(user.role)
+
+    try:
+        client = upstream.get_client()
+        if PROXY_STREAMING:
+            # Email użytkownika jest kluczem dla strategii consistent_hash
+            lease = await route.pool.acquire(user.email, priority=priority)
+            url = f"{lease.instance.url}{upstream_path}"
+            note(upstream=lease.instance.url)
+            timer = UpstreamTimer(lease.instance.url)
+
+            def finish_streaming() -> None:
+                timer.finish()
+                note(**timer.as_fields())
+                lease.release()
+
+            response = await forward_streaming(
+                client,
+                request,
+                url,
+                user.role,
+                max_request_body=PROXY_MAX_REQUEST_BODY_SIZE,
+                max_response_body=PROXY_MAX_RESPONSE_BODY_SIZE,
+                on_close=finish_streaming,
+                extensions=timer.extensions,
+                timeout=route.timeout,
+            )
+            note(upstream_status=response.status_code)
+            lease.record(response.status_code < 500)
+            streaming = True
+            return response
+
+        check_length(
+            declared_length(request.headers),
+            PROXY_MAX_REQUEST_BODY_SIZE,
+            RequestBodyTooLarge,
+        )
+        body = await request.body()
+        check_length(len(body), PROXY_MAX_REQUEST_BODY_SIZE, RequestBodyTooLarge)
+
+        # Nieaktualny wpis rewalidujemy warunkowo zamiast pobierać całe ciało
+        request_headers = headers
+        if cached is not None:
+            request_headers = conditional_headers(cached, headers)
+
+        # Ponowienia i hedging trafiają w miarę możliwości do innych instancji
+        tried: set[Instance] = set()
+
+        async def attempt(number: int) -> Exchange:
+            nonlocal url
+            # Ponowienia i hedging nie czekają w kolejce, biorą tylko wolne miejsce
+            current = await route.pool.acquire(
+                user.email, exclude=tried, priority=priority, wait=number == 0
+            )
+            tried.add(current.instance)
+            url = f"{current.instance.url}{upstream_path}"
+            return await _exchange(
+                client,
+                current,
+                request,
+                url,
+                request_headers,
+                body,
+                number,
+                route.timeout,
+            )
+
+        async def fetch() -> Exchange:
+            if request.method in RETRYABLE_METHODS:
+                exchange = await retry_policy.run(attempt, _should_retry)
+            else:
+                exchange = await attempt(0)
+            # Przy sklejonych zapytaniach odpowiedź zapisuje tylko to, które ją pobrało
+            if (
+                use_cache
+                and request.method == "GET"
+                and is_storable(
+                    exchange.response.status_code, exchange.headers, headers
+                )
+            ):
+                await response_cache.store(
+                    key,
+                    headers,
+                    exchange.response.status_code,
+                    exchange.headers,
+                    exchange.content,
+                )
+            return exchange
+
+        collapse_key = _collapse_key(
+            request, route.cluster, upstream_path, headers, cached
+        )
+        if collapse_key is None:
+            exchange = await fetch()
+        else:
+            if collapse_key in request_collapser:
+                note(collapsed=True)
+            exchange = await request_collapser.do(collapse_key, fetch)
+
+        if cached is not None and exchange.response.status_code == 304:
+            if response_cache.freshen(cached, exchange.response.headers):
+                response = await respond(response_cache, cached, request)
+                if response is not None:
+                    _note_exchange(exchange)
+                    note(cache="revalidated")
+                    return response
+            # Wpis jest nieaktualny albo jego ciało zniknęło z dysku: pytamy backend
+            # z walidatorami klienta, więc jego 304 trafia prosto do klienta
+            note(cache="miss")
+            request_headers = headers
+            exchange = await fetch()
+        _note_exchange(exchange)
+
+        # Tworzymy odpowiedź przekazując status, nagłówki i treść
+        return Response(
+            content=exchange.content,
+            status_code=exchange.response.status_code,
+            headers=exchange.headers,
+            media_type=exchange.response.headers.get("content-type"),
+        )
+
+    except CircuitOpenError as exc:
+        # Nie została żadna instancja z zamkniętym breakerem
+        return JSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content={"error": "Service Unavailable", "details": str(exc)},
+            headers={"Retry-After": str(int(BREAKER_OPEN_DURATION))},
+        )
+
+    except OverloadedError as exc:
+        note(shed=exc.reason)
+        return JSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content={"error": "Service Unavailable", "details": str(exc)},
+            headers={"Retry-After": "1"},
+        )
+
+    except RequestBodyTooLarge as exc:
+        return JSONResponse(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            content={"error": "Payload Too Large", "details": str(exc)},
+        )
+
+    except ResponseBodyTooLarge as exc:
+        logger.warning("Backend response from %s rejected: %s", url, exc)
+        note(error=str(exc))
+        return JSONResponse(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            content={"error": "Bad Gateway", "details": str(exc)},
+        )
+
+    except httpx.RequestError as exc:
+        if lease is not None:
+            lease.record(False)
+        logger.warning("Backend request to %s failed: %r", url, exc)
+        note(error=repr(exc))
+        return JSONResponse(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            content={"error": "Bad Gateway", "details": str(exc)},
+        )
+
+    except Exception as exc:
+        logger.exception("Proxying to %s failed", url)
+        note(error=repr(exc))
+        return JSONResponse(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            content={"error": "Internal Server Error", "details": str(exc)},
+        )
+
+    finally:
+        # W trybie strumieniowym instancję zwalnia koniec przekazywania ciała
+        if lease is not None and not streaming:
+            lease.release()
+
+
+class Exchange:
+    """
+    One attempt at the backend: the response, its raw body, the headers passed
+    on to the client and timings. Shared as is by collapsed requests.
+    """
+
+    __slots__ = ("attempt", "content", "headers", "instance", "response", "timer")
+
+    def __init__(
+        self,
+        instance: str,
+        response: httpx.Response,
+        content: bytes,
+        timer: UpstreamTimer,
+        attempt: int,
+    ):
+        self.instance = instance
+        self.response = response
+        self.content = content
+        self.headers = filter_headers(
+            response.headers.items(), EXCLUDED_RESPONSE_HEADERS
+        )
+        self.timer = timer
+        self.attempt = attempt
+
+
+async def _exchange(
+    client: httpx.AsyncClient,
+    lease: Lease,
+    request: Request,
+    url: str,
+    headers: dict[str, str],
+    body: bytes,
+    attempt: int,
+    timeout: httpx.Timeout | None = None,
+) -> Exchange:
+    timer = UpstreamTimer(lease.instance.url)
+    try:
+        # Ciało czytamy w postaci surowej: skompresowane przez backend przechodzi bez zmian
+        backend_response = await client.send(
+            client.build_request(
+                method=request.method,
+                url=url,
+                headers=headers,
+                content=body,
+                params=request.query_params,
+                # Bez limitu trasy obowiązuje UPSTREAM_TIMEOUT klienta
+                timeout=timeout or httpx.USE_CLIENT_DEFAULT,
+                extensions=timer.extensions,
+            ),
+            stream=True,
+        )
+        content = await read_raw(backend_response, PROXY_MAX_RESPONSE_BODY_SIZE)
+        timer.finish()
+        lease.record(backend_response.status_code < 500)
+        return Exchange(lease.instance.url, backend_response, content, timer, attempt)
+    except httpx.RequestError:
+        lease.record(False)
+        raise
+    finally:
+        # Przegrana próba hedgingu jest anulowana i też musi zwolnić instancję
+        lease.release()
+
+
+def _note_exchange(exchange: Exchange) -> None:
+    note(
+        upstream=exchange.instance,
+        upstream_status=exchange.response.status_code,
+        **exchange.timer.as_fields(),
+    )
+    if exchange.attempt:
+        note(attempt=exchange.attempt)
+
+
+def _should_retry(outcome: Exchange | BaseException) -> bool:
+    if isinstance(outcome, BaseException):
+        # Odrzucony hedging czeka na pierwszą próbę, a inna instancja może mieć miejsce
+        return isinstance(outcome, httpx.TransportError | OverloadedError)
+    return outcome.response.status_code in RETRYABLE_STATUSES
@@ -0,0 +1,55 @@
+from collections.abc import Iterable
+
+# Nagłówki klienta, których nie przekazujemy do backendu. Accept-Encoding
+# zostaje: backend kompresuje, a brama przekazuje ciało bez dekodowania
+EXCLUDED_REQUEST_HEADERS = frozenset(
+    {"host", "content-length", "transfer-encoding", "connection"}
+)
+
+# Nagłówki odpowiedzi backendu, których nie przekazujemy do klienta; ciało
+# przechodzi jako surowe bajty, więc Content-Encoding zostaje
+EXCLUDED_RESPONSE_HEADERS = frozenset({"transfer-encoding", "connection"})
+
+
+def raw_names(names: frozenset[str]) -> frozenset[bytes]:
+    """Header names as ASGI carries them: lower-case bytes."""
+    return frozenset(name.encode("latin-1") for name in names)
+
+
+# Wersje bajtowe liczone raz, porównywane wprost z nagłówkami ze scope ASGI
+EXCLUDED_REQUEST_HEADERS_RAW = raw_names(EXCLUDED_REQUEST_HEADERS)
+
+
+def filter_headers(
+    headers: Iterable[tuple[str, str]], excluded: frozenset[str]
+) -> dict[str, str]:
+    return {key: value for key, value in headers if key.lower() not in excluded}
+
+
+def upstream_headers(
+    headers: Iterable[tuple[str, str]],
+    role: str,
+    excluded: frozenset[str] = EXCLUDED_REQUEST_HEADERS,
+) -> dict[str, str]:
+    """Copies client headers for the backend request and injects the user's role."""
+    forwarded = filter_headers(headers, excluded)
+    forwarded["Role"] = role
+    return forwarded
+
+
+def upstream_raw_headers(
+    raw: Iterable[tuple[bytes, bytes]],
+    role: str,
+    excluded: frozenset[bytes] = EXCLUDED_REQUEST_HEADERS_RAW,
+) -> dict[str, str]:
+    """
+    Same as `upstream_headers`, but reads the ASGI header list directly. Names
+    there are already lower-case, so no per-header `lower()` is needed.
+    """
+    forwarded = {
+        key.decode("latin-1"): value.decode("latin-1")
+        for key, value in raw
+        if key not in excluded
+    }
+    forwarded["Role"] = role
+    return forwarded
@@ -0,0 +1,313 @@
+import asyncio
+import contextlib
+import os
+import tomllib
+
+import httpx
+
+from app.access_log import logger
+from app.config import (
+    LB_STRATEGY,
+    ROUTES_FILE,
+    ROUTES_RELOAD_INTERVAL,
+    SERVICE_INSTANCES,
+    UPSTREAM_CONNECT_TIMEOUT,
+    UPSTREAM_POOL_TIMEOUT,
+)
+
+from .balancer import Instance, UpstreamPool, upstream_pool
+
+# Klaster z SERVICE_INSTANCES i LB_STRATEGY, istnieje zawsze
+DEFAULT_CLUSTER = "default"
+
+ROUTE_KEYS = frozenset({"prefix", "cluster", "methods", "host", "timeout", "rewrite"})
+
+
+def _hostname(host: str | None) -> str | None:
+    if not host:
+        return None
+    host = host.lower()
+    if host.startswith("["):
+        return host[: host.find("]") + 1]
+    return host.partition(":")[0]
+
+
+class Route:
+    """
+    One entry of the route table: requests whose path (after /api) starts
+    with `prefix` and that match the optional methods and host go to the
+    `cluster` pool, with the prefix replaced by `rewrite` if set.
+    """
+
+    __slots__ = ("cluster", "host", "methods", "pool", "prefix", "rewrite", "timeout")
+
+    def __init__(
+        self,
+        prefix: str,
+        cluster: str,
+        pool: UpstreamPool,
+        methods: list[str] | None = None,
+        host: str | None = None,
+        timeout: float | None = None,
+        rewrite: str | None = None,
+    ):
+        self.prefix = prefix
+        self.cluster = cluster
+        self.pool = pool
+        self.methods = None
+        if methods:
+            self.methods = frozenset(method.upper() for method in methods)
+            if "GET" in self.methods:
+                self.methods |= {"HEAD"}
+        self.host = host.lower() if host else None
+        self.timeout = None
+        if timeout:
+            self.timeout = httpx.Timeout(
+                timeout,
+                connect=min(UPSTREAM_CONNECT_TIMEOUT, timeout),
+                pool=min(UPSTREAM_POOL_TIMEOUT, timeout),
+            )
+        self.rewrite = rewrite
+
+    def accepts(self, method: str, host: str | None) -> bool:
+        if self.methods is not None and method not in self.methods:
+            return False
+        if self.host is None:
+            return True
+        if host is None:
+            return False
+        if self.host.startswith("*."):
+            return host.endswith(self.host[1:])
+        return host == self.host
+
+    def upstream_path(self, path: str) -> str:
+        if self.rewrite is None:
+            return path
+        return self.rewrite + path[len(self.prefix) :]
+
+
+class _Node:
+    __slots__ = ("children", "label", "routes")
+
+    def __init__(self, label: str):
+        self.label = label
+        self.children: dict[str, _Node] = {}
+        self.routes: list[Route] = []
+
+
+class RadixTree:
+    """
+    Compressed trie of route prefixes. A lookup walks the path once, so its
+    cost depends on the path length and not on the number of routes.
+    """
+
+    def __init__(self):
+        self._root = _Node("")
+
+    def insert(self, prefix: str, route: Route) -> None:
+        node = self._root
+        while prefix:
+            child = node.children.get(prefix[0])
+            if child is None:
+                child = node.children[prefix[0]] = _Node(prefix)
+            else:
+                common = len(os.path.commonprefix((prefix, child.label)))
+                if common < len(child.label):
+                    # Rozdzielamy krawędź na wspólny początek i resztę
+                    middle = node.children[prefix[0]] = _Node(child.label[:common])
+                    child.label = child.label[common:]
+                    middle.children[child.label[0]] = child
+                    child = middle
+            prefix = prefix[len(child.label) :]
+            node = child
+        node.routes.append(route)
+
+    def lookup(self, path: str) -> list[list[Route]]:
+        """Routes of every prefix of `path`, longest prefix first."""
+        node = self._root
+        found = [node.routes] if node.routes else []
+        position = 0
+        while position < len(path):
+            child = node.children.get(path[position])
+            if child is None or not path.startswith(child.label, position):
+                break
+            position += len(child.label)
+            node = child
+            if node.routes:
+                found.append(node.routes)
+        found.reverse()
+        return found
+
+
+class RouteTable:
+    """
+    Routes compiled into a RadixTree. The longest matching prefix wins; among
+    routes with the same prefix, the first one in the file whose methods and
+    host match.
+    """
+
+    def __init__(self, routes: list[Route]):
+        self.routes = routes
+        self._tree = RadixTree()
+        for route in routes:
+            self._tree.insert(route.prefix, route)
+        self._uses_hosts = any(route.host for route in routes)
+
+    def match(self, path: str, method: str, host: str | None = None) -> Route | None:
+        host = _hostname(host) if self._uses_hosts else None
+        for routes in self._tree.lookup(path):
+            for route in routes:
+                if route.accepts(method, host):
+                    return route
+        return None
+
+    def pools(self) -> list[UpstreamPool]:
+        return list({id(route.pool): route.pool for route in self.routes}.values())
+
+
+def _cluster_key(instances: list[str], strategy: str) -> tuple:
+    return (tuple(url.rstrip("/") for url in instances if url), strategy)
+
+
+def parse(document: dict, pools: dict[tuple, UpstreamPool]) -> RouteTable:
+    """
+    Builds a table from a parsed routes file. Clusters whose instances and
+    strategy match a pool in `pools` reuse it, so breaker, limiter and load
+    state survive a reload; new pools are added to `pools`.
+    \nRaises:
+        ValueError: If a cluster or route is invalid.
+    """
+    clusters = {DEFAULT_CLUSTER: upstream_pool}
+    for name, spec in document.get("clusters", {}).items():
+        instances = spec.get("instances")
+        if not instances or not all(isinstance(url, str) for url in instances):
+            raise ValueError(f"Cluster {name!r} needs a list of instance URLs")
+        key = _cluster_key(instances, spec.get("strategy", LB_STRATEGY))
+        if key not in pools:
+            pools[key] = UpstreamPool(list(key[0]), key[1])
+        clusters[name] = pools[key]
+
+    routes = []
+    for number, spec in enumerate(document.get("routes", []), 1):
+        unknown = set(spec) - ROUTE_KEYS
+        if unknown:
+            raise ValueError(f"Route {number}: unknown keys {sorted(unknown)}")
+        prefix, cluster = spec.get("prefix"), spec.get("cluster", DEFAULT_CLUSTER)
+        if not isinstance(prefix, str) or not prefix.startswith("/"):
+            raise ValueError(f"Route {number}: prefix must start with /")
+        if cluster not in clusters:
+            raise ValueError(f"Route {number}: unknown cluster {cluster!r}")
+        rewrite = spec.get("rewrite")
+        if rewrite is not None and not str(rewrite).startswith("/"):
+            raise ValueError(f"Route {number}: rewrite must start with /")
+        timeout = spec.get("timeout")
+        if timeout is not None and (
+            not isinstance(timeout, int | float) or timeout <= 0
+        ):
+            raise ValueError(f"Route {number}: timeout must be a positive number")
+        routes.append(
+            Route(
+                prefix,
+                cluster,
+                clusters[cluster],
+                methods=spec.get("methods"),
+                host=spec.get("host"),
+                timeout=timeout,
+                rewrite=rewrite,
+            )
+        )
+    return RouteTable(routes)
+
+
+class Router:
+    """
+    The route table for /api requests. Without a routes file every request
+    goes to the default cluster unchanged. With one, the file is re-read every
+    `reload_interval` seconds once it changes; the new table replaces the old
+    one in a single assignment, so a request keeps the route it matched and
+    an invalid file leaves the previous table in place.
+    """
+
+    def __init__(
+        self,
+        path: str = ROUTES_FILE,
+        reload_interval: float = ROUTES_RELOAD_INTERVAL,
+    ):
+        self.path = path
+        self.reload_interval = reload_interval
+        self._pools = {_cluster_key(SERVICE_INSTANCES, LB_STRATEGY): upstream_pool}
+        self._file_id: tuple | None = None
+        self._client: httpx.AsyncClient | None = None
+        self._task: asyncio.Task | None = None
+        self.table = RouteTable([Route("/", DEFAULT_CLUSTER, upstream_pool)])
+        if path:
+            self._load()
+
+    def match(self, path: str, method: str, host: str | None = None) -> Route | None:
+        return self.table.match(path, method, host)
+
+    def instances(self) -> list[Instance]:
+        return [instance for pool in self.table.pools() for instance in pool.instances]
+
+    def _load(self) -> list[UpstreamPool]:
+        """
+        Swaps in the table from the file if it changed and returns the pools
+        no longer used.
+        \nRaises:
+            OSError: If the file cannot be read.
+            ValueError: If the file is not a valid routes file.
+        """
+        stat = os.stat(self.path)
+        file_id = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if file_id == self._file_id:
+            return []
+        # Błędny plik zgłaszamy raz, a nie przy każdym sprawdzeniu
+        self._file_id = file_id
+        with open(self.path, "rb") as file:
+            document = tomllib.load(file)
+        pools = dict(self._pools)
+        table = parse(document, pools)
+        used = {id(pool) for pool in table.pools()} | {id(upstream_pool)}
+        self._pools = {key: pool for key, pool in pools.items() if id(pool) in used}
+        unused = [pool for pool in pools.values() if id(pool) not in used]
+
+        self.table = table
+        logger.info("Loaded %d routes from %s", len(table.routes), self.path)
+        return unused
+
+    async def reload(self) -> None:
+        unused = self._load()
+        if self._client is not None:
+            for pool in self.table.pools():
+                pool.start_health_checks(self._client)
+        for pool in unused:
+            await pool.stop_health_checks()
+
+    def start(self, client: httpx.AsyncClient) -> None:
+        """Starts health checks of every cluster and watching the routes file."""
+        self._client = client
+        for pool in self.table.pools():
+            pool.start_health_checks(client)
+        if self.path and self.reload_interval > 0 and self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+        for pool in self._pools.values():
+            await pool.stop_health_checks()
+        self._client = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            try:
+                await self.reload()
+            except (OSError, ValueError) as exc:
+                logger.warning("Could not reload routes from %s: %r", self.path, exc)
+
+
+api_routes = Router()
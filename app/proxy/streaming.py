@@ -0,0 +1,197 @@
+from collections.abc import AsyncIterator, Callable
+
+import httpx
+from starlette.requests import Request
+from starlette.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+from .headers import (
+    EXCLUDED_REQUEST_HEADERS_RAW,
+    EXCLUDED_RESPONSE_HEADERS,
+    filter_headers,
+    upstream_raw_headers,
+)
+
+# Surowe bajty ciała przekazujemy 1:1, więc znany content-length może zostać
+_STREAMING_EXCLUDED = EXCLUDED_REQUEST_HEADERS_RAW - {b"content-length"}
+
+
+class BodyTooLarge(Exception):
+    """Raised when a request or response body exceeds the configured limit."""
+
+    def __init__(self, limit: int):
+        super().__init__(f"Body exceeds the limit of {limit} bytes")
+        self.limit = limit
+
+
+class RequestBodyTooLarge(BodyTooLarge):
+    pass
+
+
+class ResponseBodyTooLarge(BodyTooLarge):
+    pass
+
+
+def declared_length(headers) -> int | None:
+    value = headers.get("content-length")
+    if value is None or not value.isdigit():
+        return None
+    return int(value)
+
+
+def check_length(
+    length: int | None, limit: int, error: type[BodyTooLarge] = BodyTooLarge
+) -> None:
+    if limit and length is not None and length > limit:
+        raise error(limit)
+
+
+async def _limited(
+    chunks: AsyncIterator[bytes], limit: int, error: type[BodyTooLarge]
+) -> AsyncIterator[bytes]:
+    received = 0
+    async for chunk in chunks:
+        received += len(chunk)
+        check_length(received, limit, error)
+        yield chunk
+
+
+class _Closer:
+    """Closes the backend response and runs `on_close` once, whoever calls it first."""
+
+    def __init__(self, response: httpx.Response, on_close: Callable[[], None] | None):
+        self._response = response
+        self._on_close = on_close
+        self._closed = False
+
+    async def __call__(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            await self._response.aclose()
+        finally:
+            if self._on_close is not None:
+                self._on_close()
+
+
+async def _relay(
+    response: httpx.Response, limit: int, close: _Closer
+) -> AsyncIterator[bytes]:
+    # Zamykamy odpowiedź backendu także przy rozłączeniu klienta lub przekroczeniu limitu
+    try:
+        async for chunk in _limited(response.aiter_raw(), limit, ResponseBodyTooLarge):
+            yield chunk
+    finally:
+        await close()
+
+
+class _RelayResponse(StreamingResponse):
+    """
+    StreamingResponse that closes the backend response however sending ends.
+    The generator's own cleanup only runs once it has started, which it never
+    does if the client disconnects first or sending the headers fails.
+    """
+
+    def __init__(self, content: AsyncIterator[bytes], close: _Closer, **kwargs):
+        super().__init__(content, **kwargs)
+        self._close = close
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self._close()
+
+
+async def read_raw(response: httpx.Response, limit: int = 0) -> bytes:
+    """
+    Reads a streamed backend body as sent, without undoing its Content-Encoding,
+    and closes the response.
+    \nRaises:
+        ResponseBodyTooLarge: If the declared or received body exceeds `limit`.
+    """
+    try:
+        check_length(declared_length(response.headers), limit, ResponseBodyTooLarge)
+        return b"".join(
+            [
+                chunk
+                async for chunk in _limited(
+                    response.aiter_raw(), limit, ResponseBodyTooLarge
+                )
+            ]
+        )
+    finally:
+        await response.aclose()
+
+
+def _has_body(request: Request) -> bool:
+    headers = request.headers
+    return "content-length" in headers or "transfer-encoding" in headers
+
+
+async def forward_streaming(
+    client: httpx.AsyncClient,
+    request: Request,
+    url: str,
+    role: str,
+    max_request_body: int = 0,
+    max_response_body: int = 0,
+    on_close: Callable[[], None] | None = None,
+    extensions: dict | None = None,
+    timeout: httpx.Timeout | None = None,
+) -> StreamingResponse:
+    """
+    Pipes the client body to the backend and the backend body back to the client
+    chunk by chunk, so memory stays constant regardless of payload size.
+    Backpressure comes for free: a chunk is only read from one side once the
+    other side has accepted the previous one. `on_close` runs once the
+    backend body has been fully relayed or abandoned; `extensions` are passed
+    to the httpx request (e.g. a trace hook) and `timeout` replaces the
+    client's default.
+    \nRaises:
+        RequestBodyTooLarge: If the client body exceeds `max_request_body`.
+        ResponseBodyTooLarge: If the declared backend body exceeds `max_response_body`.
+    """
+    check_length(
+        declared_length(request.headers), max_request_body, RequestBodyTooLarge
+    )
+
+    headers = upstream_raw_headers(request.headers.raw, role, _STREAMING_EXCLUDED)
+    content = (
+        _limited(request.stream(), max_request_body, RequestBodyTooLarge)
+        if _has_body(request)
+        else None
+    )
+
+    upstream_request = client.build_request(
+        method=request.method,
+        url=url,
+        headers=headers,
+        content=content,
+        params=request.query_params,
+        timeout=timeout or httpx.USE_CLIENT_DEFAULT,
+        extensions=extensions,
+    )
+    backend_response = await client.send(upstream_request, stream=True)
+
+    try:
+        check_length(
+            declared_length(backend_response.headers),
+            max_response_body,
+            ResponseBodyTooLarge,
+        )
+    except ResponseBodyTooLarge:
+        await backend_response.aclose()
+        raise
+
+    close = _Closer(backend_response, on_close)
+    return _RelayResponse(
+        _relay(backend_response, max_response_body, close),
+        close,
+        status_code=backend_response.status_code,
+        headers=filter_headers(
+            backend_response.headers.items(), EXCLUDED_RESPONSE_HEADERS
+        ),
+        media_type=backend_response.headers.get("content-type"),
+    )
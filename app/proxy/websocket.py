@@ -0,0 +1,374 @@
+import asyncio
+from urllib.parse import parse_qsl, urlencode
+
+from fastapi import HTTPException, status
+from fastapi.responses import JSONResponse, Response
+from starlette.websockets import WebSocket, WebSocketDisconnect, WebSocketState
+from websockets.asyncio.client import ClientConnection, connect
+from websockets.exceptions import ConnectionClosed, InvalidHandshake, InvalidStatus
+
+from app.access_log import logger, note
+from app.breaker import CircuitOpenError
+from app.config import (
+    BREAKER_OPEN_DURATION,
+    PROXY_WS_CONNECT_TIMEOUT,
+    PROXY_WS_IDLE_TIMEOUT,
+    PROXY_WS_MAX_CONNECTIONS,
+    PROXY_WS_MAX_MESSAGE_SIZE,
+    PROXY_WS_MAX_QUEUE,
+    PROXY_WS_PING_INTERVAL,
+)
+from app.ratelimit import rate_limiter
+from app.routers.auth.proto_gen import user_p2p
+from app.routers.auth.services import get_current_user
+
+from .asgi import bearer_token
+from .headers import EXCLUDED_REQUEST_HEADERS, raw_names, upstream_raw_headers
+from .routes import DEFAULT_CLUSTER, api_routes
+
+# Nagłówki handshake'u ustawia od nowa klient WebSocket po stronie backendu
+EXCLUDED_HANDSHAKE_HEADERS_RAW = raw_names(
+    EXCLUDED_REQUEST_HEADERS
+    | {
+        "upgrade",
+        "sec-websocket-key",
+        "sec-websocket-version",
+        "sec-websocket-extensions",
+        "sec-websocket-protocol",
+    }
+)
+
+# Kody zamknięcia, których nie wolno wysłać w ramce (RFC 6455 7.4.1)
+RESERVED_CLOSE_CODES = frozenset({1004, 1005, 1006, 1015})
+
+
+def _close_code(code: int | None) -> int:
+    if code is None or code in RESERVED_CLOSE_CODES or not 1000 <= code < 5000:
+        return 1000
+    return code
+
+
+def _access_token(websocket: WebSocket) -> tuple[str, bytes]:
+    """
+    The bearer token and the query string to forward. Browsers cannot set
+    Authorization on a WebSocket, so the token may also come in the
+    `access_token` query parameter (RFC 6750 2.3), which is then not forwarded.
+    \nRaises:
+        HTTPException: If neither carries a token.
+    """
+    query_string = websocket.scope["query_string"]
+    try:
+        return bearer_token(websocket.scope), query_string
+    except HTTPException:
+        token = websocket.query_params.get("access_token")
+        if not token:
+            raise
+    query = [
+        (name, value)
+        for name, value in parse_qsl(query_string.decode("latin-1"), True)
+        if name != "access_token"
+    ]
+    return token, urlencode(query).encode("latin-1")
+
+
+def _backend_url(instance_url: str, path: str, query_string: bytes) -> str:
+    url = f"ws{instance_url.removeprefix('http')}{path}"
+    if query_string:
+        url = f"{url}?{query_string.decode('latin-1')}"
+    return url
+
+
+class Relay:
+    """
+    Frames of one proxied connection, pumped both ways until either side
+    closes or nothing was sent for `idle_timeout` seconds. Each direction
+    awaits its send before reading the next frame, so a slow reader on one
+    side pauses reading from the other instead of buffering.
+    """
+
+    __slots__ = ("_idle", "backend", "client", "idle_timeout", "last_activity")
+
+    def __init__(
+        self, client: WebSocket, backend: ClientConnection, idle_timeout: float
+    ):
+        self.client = client
+        self.backend = backend
+        self.idle_timeout = idle_timeout
+        self.last_activity = 0.0
+        self._idle: asyncio.Future | None = None
+
+    async def run(self) -> str:
+        """Relays until the end of the connection and returns why it ended."""
+        loop = asyncio.get_running_loop()
+        self.last_activity = loop.time()
+        pumps = {
+            asyncio.ensure_future(self._client_to_backend()),
+            asyncio.ensure_future(self._backend_to_client()),
+        }
+        waiting = set(pumps)
+        timer = None
+        if self.idle_timeout > 0:
+            # Jeden timer na połączenie, przestawiany leniwie: ramka tylko zapisuje czas
+            self._idle = loop.create_future()
+            waiting.add(self._idle)
+            timer = loop.call_later(self.idle_timeout, self._check_idle)
+        try:
+            done, _ = await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                if future is self._idle:
+                    await self._close(1001, "Idle timeout")
+                    return "idle"
+                if future.exception() is not None:
+                    logger.warning("WebSocket relay failed: %r", future.exception())
+                    await self._close(1011, "Upstream error")
+                    return "error"
+                return future.result()
+        finally:
+            if timer is not None:
+                timer.cancel()
+            self._idle = None
+            for pump in pumps:
+                pump.cancel()
+            # Czekamy na zakończenie pomp, żeby ich sprzątanie i błędy nie zostały bez właściciela
+            await asyncio.gather(*pumps, return_exceptions=True)
+            await self.backend.close()
+
+    def _check_idle(self) -> None:
+        if self._idle is None or self._idle.done():
+            return
+        loop = asyncio.get_running_loop()
+        remaining = self.last_activity + self.idle_timeout - loop.time()
+        if remaining > 0:
+            loop.call_later(remaining, self._check_idle)
+        else:
+            self._idle.set_result(None)
+
+    async def _client_to_backend(self) -> str:
+        loop = asyncio.get_running_loop()
+        while True:
+            message = await self.client.receive()
+            if message["type"] == "websocket.disconnect":
+                await self.backend.close(
+                    _close_code(message.get("code")), message.get("reason") or ""
+                )
+                return "client"
+            self.last_activity = loop.time()
+            text = message.get("text")
+            try:
+                await self.backend.send(text if text is not None else message["bytes"])
+            except ConnectionClosed:
+                return await self._backend_closed()
+
+    async def _backend_to_client(self) -> str:
+        loop = asyncio.get_running_loop()
+        send = self.client.send
+        try:
+            async for data in self.backend:
+                self.last_activity = loop.time()
+                if isinstance(data, str):
+                    await send({"type": "websocket.send", "text": data})
+                else:
+                    await send({"type": "websocket.send", "bytes": data})
+        except ConnectionClosed:
+            pass
+        except WebSocketDisconnect as exc:
+            await self.backend.close(_close_code(exc.code), exc.reason or "")
+            return "client"
+        return await self._backend_closed()
+
+    async def _backend_closed(self) -> str:
+        # Klient dostaje kod i powód zamknięcia od backendu
+        await self._close_client(
+            _close_code(self.backend.close_code), self.backend.close_reason or ""
+        )
+        return "backend"
+
+    async def _close(self, code: int, reason: str) -> None:
+        await self.backend.close(code, reason)
+        await self._close_client(code, reason)
+
+    async def _close_client(self, code: int, reason: str) -> None:
+        if self.client.application_state != WebSocketState.CONNECTED:
+            return
+        try:
+            await self.client.close(code, reason)
+        except (RuntimeError, WebSocketDisconnect):
+            # Klient zdążył się rozłączyć
+            pass
+
+
+class WebSocketProxy:
+    """
+    Proxies WebSocket connections on /api/{path} to the backend with the same
+    token check, rate limits and Role header as HTTP requests. Rejected
+    handshakes get the HTTP response the /api route would have sent where
+    the server supports denial responses, and a close frame otherwise.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = PROXY_WS_MAX_CONNECTIONS,
+        idle_timeout: float = PROXY_WS_IDLE_TIMEOUT,
+    ):
+        self.max_connections = max_connections
+        self.idle_timeout = idle_timeout
+        self.open = 0
+        self.closed = {
+            "rejected": 0,
+            "client": 0,
+            "backend": 0,
+            "idle": 0,
+            "error": 0,
+        }
+
+    async def handle(self, path: str, websocket: WebSocket) -> None:
+        if self.max_connections and self.open >= self.max_connections:
+            reason = await self._deny(
+                websocket,
+                JSONResponse(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    content={
+                        "error": "Service Unavailable",
+                        "details": "Too many WebSocket connections",
+                    },
+                ),
+            )
+        else:
+            self.open += 1
+            try:
+                reason = await self._proxy(path, websocket)
+            finally:
+                self.open -= 1
+        self.closed[reason] += 1
+        note(close=reason)
+
+    async def _proxy(self, path: str, websocket: WebSocket) -> str:
+        try:
+            token, query_string = _access_token(websocket)
+            user = await get_current_user(token)
+        except HTTPException as e:
+            return await self._deny(
+                websocket,
+                JSONResponse(
+                    status_code=e.status_code,
+                    content={"detail": e.detail},
+                    headers=e.headers,
+                ),
+            )
+
+        decision = rate_limiter.check(user.email, user.role)
+        if decision is not None and not decision.allowed:
+            return await self._deny(
+                websocket,
+                JSONResponse(
+                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                    content={"error": "Too Many Requests"},
+                    headers=decision.headers(),
+                ),
+            )
+
+        backend = await self._connect(path, websocket, query_string, user)
+        if isinstance(backend, Response):
+            return await self._deny(websocket, backend)
+
+        try:
+            await websocket.accept(subprotocol=backend.subprotocol)
+        except BaseException:
+            await backend.close()
+            raise
+        return await Relay(websocket, backend, self.idle_timeout).run()
+
+    async def _connect(
+        self,
+        path: str,
+        websocket: WebSocket,
+        query_string: bytes,
+        user: user_p2p.User,
+    ) -> ClientConnection | Response:
+        """Opens the backend connection, or returns the response to deny with."""
+        route = api_routes.match(f"/{path}", "GET", websocket.headers.get("host"))
+        if route is None:
+            return JSONResponse(
+                status_code=status.HTTP_404_NOT_FOUND,
+                content={"error": "Not Found", "details": "No route for this request"},
+            )
+        if route.cluster != DEFAULT_CLUSTER:
+            note(cluster=route.cluster)
+        try:
+            # Email użytkownika jest kluczem dla strategii consistent_hash
+            lease = route.pool.lease(user.email)
+        except CircuitOpenError as exc:
+            return JSONResponse(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                content={"error": "Service Unavailable", "details": str(exc)},
+                headers={"Retry-After": str(int(BREAKER_OPEN_DURATION))},
+            )
+
+        url = _backend_url(
+            lease.instance.url, route.upstream_path(f"/{path}"), query_string
+        )
+        note(upstream=lease.instance.url)
+        subprotocols = [
+            value.strip()
+            for value in websocket.headers.get("sec-websocket-protocol", "").split(",")
+            if value.strip()
+        ]
+        try:
+            backend = await connect(
+                url,
+                additional_headers=upstream_raw_headers(
+                    websocket.scope["headers"],
+                    user.role,
+                    EXCLUDED_HANDSHAKE_HEADERS_RAW,
+                ),
+                user_agent_header=None,
+                subprotocols=subprotocols or None,
+                # Kontekst deflate to setki KB na połączenie; w sieci wewnętrznej się nie opłaca
+                compression=None,
+                proxy=None,
+                open_timeout=PROXY_WS_CONNECT_TIMEOUT,
+                ping_interval=PROXY_WS_PING_INTERVAL or None,
+                max_size=PROXY_WS_MAX_MESSAGE_SIZE or None,
+                max_queue=PROXY_WS_MAX_QUEUE or None,
+            )
+        except InvalidStatus as exc:
+            # Odmowę backendu (np. 403, 404) przekazujemy klientowi bez zmian
+            response = exc.response
+            lease.record(response.status_code < 500)
+            note(upstream_status=response.status_code)
+            return Response(
+                content=bytes(response.body),
+                status_code=response.status_code,
+                media_type=response.headers.get("content-type"),
+            )
+        except (OSError, TimeoutError, InvalidHandshake) as exc:
+            lease.record(False)
+            logger.warning("WebSocket connection to %s failed: %r", url, exc)
+            note(error=repr(exc))
+            return JSONResponse(
+                status_code=status.HTTP_502_BAD_GATEWAY,
+                content={"error": "Bad Gateway", "details": str(exc)},
+            )
+        else:
+            lease.record(True)
+        finally:
+            # Instancja jest zajęta tylko na czas handshake'u: bezczynne gniazda nie
+            # mogą zaburzać wyboru instancji dla zwykłych zapytań
+            lease.release()
+
+        note(upstream_status=101)
+        return backend
+
+    async def _deny(self, websocket: WebSocket, response: Response) -> str:
+        try:
+            await websocket.send_denial_response(response)
+        except RuntimeError:
+            # Serwer bez rozszerzenia websocket.http.response: handshake kończy się 403
+            await websocket.close(code=1008)
+        return "rejected"
+
+    def stats(self) -> dict[str, int]:
+        return {"open": self.open, **self.closed}
+
+
+websocket_proxy = WebSocketProxy()
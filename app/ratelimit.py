@@ -0,0 +1,209 @@
+import fcntl
+import functools
+import hashlib
+import math
+import mmap
+import os
+import struct
+import tempfile
+import time
+
+from app.config import (
+    RATE_LIMIT_BUCKETS,
+    RATE_LIMIT_PATH,
+    RATE_LIMIT_ROLE_BURST,
+    RATE_LIMIT_ROLE_RATE,
+    RATE_LIMIT_USER_BURST,
+    RATE_LIMIT_USER_RATE,
+)
+
+# Slot: odcisk klucza (0 = pusty) i TAT algorytmu GCRA jako czas uniksowy
+SLOT = struct.Struct("<Qd")
+SLOTS_PER_BUCKET = 8
+BUCKET = struct.Struct("<" + "Qd" * SLOTS_PER_BUCKET)
+
+
+def default_path() -> str:
+    directory = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(directory, "api-gateway-ratelimit")
+
+
+@functools.lru_cache(maxsize=65536)
+def _fingerprint(key: str) -> int:
+    value = int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest())
+    return value or 1
+
+
+class Decision:
+    """Outcome of one rate limit check, rendered as RateLimit-* headers."""
+
+    __slots__ = ("allowed", "limit", "remaining", "reset", "retry_after")
+
+    def __init__(
+        self,
+        allowed: bool,
+        limit: int,
+        remaining: int,
+        reset: float,
+        retry_after: float = 0.0,
+    ):
+        self.allowed = allowed
+        self.limit = limit
+        self.remaining = remaining
+        self.reset = reset
+        self.retry_after = retry_after
+
+    def headers(self) -> dict[str, str]:
+        headers = {
+            "RateLimit-Limit": str(self.limit),
+            "RateLimit-Remaining": str(self.remaining),
+            "RateLimit-Reset": str(math.ceil(self.reset)),
+        }
+        if not self.allowed:
+            headers["Retry-After"] = str(math.ceil(self.retry_after))
+        return headers
+
+
+class SharedBuckets:
+    """
+    GCRA state in a memory-mapped file, so every worker process on the host
+    enforces the same limits. Keys hash into fixed buckets of a few slots;
+    each bucket is updated under its own fcntl record lock. When a bucket is
+    full the slot closest to expiry is reused.
+    """
+
+    def __init__(self, path: str = RATE_LIMIT_PATH, buckets: int = RATE_LIMIT_BUCKETS):
+        self.path = path or default_path()
+        self.buckets = buckets
+        self._fd: int | None = None
+        self._map: mmap.mmap | None = None
+
+    def open(self) -> None:
+        if self._map is not None:
+            return
+        size = self.buckets * BUCKET.size
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        # Pierwszy worker tworzy plik; pozostałe tylko go mapują
+        fcntl.lockf(fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(fd).st_size < size:
+                os.ftruncate(fd, size)
+        finally:
+            fcntl.lockf(fd, fcntl.LOCK_UN)
+        self._fd = fd
+        self._map = mmap.mmap(fd, size)
+
+    def close(self) -> None:
+        if self._map is not None:
+            self._map.close()
+            os.close(self._fd)
+            self._map = None
+            self._fd = None
+
+    def acquire(self, *limits: tuple[str, float, int]) -> list[Decision]:
+        """
+        Takes one request from each `(key, rate, burst)` allowance of `rate`
+        requests per second with bursts of up to `burst`. Either every key is
+        charged or none is: when one limit rejects, the others keep their
+        allowance.
+        """
+        if self._map is None:
+            raise RuntimeError("Rate limit store is not open")
+        fingerprints = [_fingerprint(key) for key, _, _ in limits]
+        offsets = sorted({(f % self.buckets) * BUCKET.size for f in fingerprints})
+
+        # Kubełki blokowane rosnąco, żeby dwa procesy nie zakleszczyły się
+        for offset in offsets:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, BUCKET.size, offset)
+        try:
+            now = time.time()
+            buckets = {
+                offset: list(BUCKET.unpack_from(self._map, offset))
+                for offset in offsets
+            }
+            decisions = []
+            for fingerprint, (_, rate, burst) in zip(fingerprints, limits):
+                offset = (fingerprint % self.buckets) * BUCKET.size
+                slots = buckets[offset]
+                keys, tats = slots[0::2], slots[1::2]
+                interval = 1 / rate
+                tolerance = interval * burst
+                if fingerprint in keys:
+                    index = keys.index(fingerprint)
+                    tat = max(tats[index], now)
+                else:
+                    # Pusty slot ma TAT 0, więc też wypada jako pierwszy do zajęcia
+                    index = tats.index(min(tats))
+                    tat = now
+
+                new_tat = tat + interval
+                if new_tat - now > tolerance:
+                    decisions.append(
+                        Decision(False, burst, 0, tat - now, new_tat - now - tolerance)
+                    )
+                    continue
+                slots[2 * index : 2 * index + 2] = fingerprint, new_tat
+                remaining = int((tolerance - (new_tat - now)) / interval)
+                decisions.append(Decision(True, burst, remaining, new_tat - now))
+
+            # Zapis tylko gdy wszystkie limity przepuszczają żądanie
+            if all(decision.allowed for decision in decisions):
+                for offset, slots in buckets.items():
+                    BUCKET.pack_into(self._map, offset, *slots)
+        finally:
+            for offset in reversed(offsets):
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, BUCKET.size, offset)
+        return decisions
+
+
+class RateLimiter:
+    """
+    Per-user and per-role admission control. A request must fit both the
+    user's own allowance and the allowance shared by everyone with the same
+    role; a rate of 0 switches that limit off.
+    """
+
+    def __init__(
+        self,
+        store: SharedBuckets,
+        user_rate: float = RATE_LIMIT_USER_RATE,
+        user_burst: int = RATE_LIMIT_USER_BURST,
+        role_rate: float = RATE_LIMIT_ROLE_RATE,
+        role_burst: int = RATE_LIMIT_ROLE_BURST,
+    ):
+        self.store = store
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.role_rate = role_rate
+        self.role_burst = role_burst
+        self.rejected = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.user_rate > 0 or self.role_rate > 0
+
+    def open(self) -> None:
+        if self.enabled:
+            self.store.open()
+
+    def close(self) -> None:
+        self.store.close()
+
+    def check(self, email: str, role: str) -> Decision | None:
+        """Returns the most restrictive decision, or None if limits are off."""
+        limits = []
+        if self.user_rate > 0:
+            limits.append((f"user:{email}", self.user_rate, self.user_burst))
+        if self.role_rate > 0:
+            limits.append((f"role:{role}", self.role_rate, self.role_burst))
+        if not limits:
+            return None
+        decisions = self.store.acquire(*limits)
+        for decision in decisions:
+            if not decision.allowed:
+                self.rejected += 1
+                return decision
+        return min(decisions, key=lambda decision: decision.remaining)
+
+
+rate_limiter = RateLimiter(SharedBuckets())
@@ -0,0 +1,224 @@
+import asyncio
+import random
+import time
+from collections.abc import Awaitable, Callable
+from typing import TypeVar
+
+from app.config import (
+    HEDGE_ENABLED,
+    HEDGE_MIN_DELAY,
+    HEDGE_MIN_SAMPLES,
+    HEDGE_QUANTILE,
+    RETRY_ATTEMPTS,
+    RETRY_BACKOFF,
+    RETRY_BUDGET_MIN_PER_SECOND,
+    RETRY_BUDGET_RATIO,
+    RETRY_BUDGET_WINDOW,
+)
+
+T = TypeVar("T")
+
+
+class RetryBudget:
+    """
+    Extra attempts (retries and hedges) allowed as a fraction of the calls made
+    over the last `window` seconds, plus a small floor for low traffic. When an
+    upstream is down every call fails, so retries add at most `ratio` more load
+    instead of multiplying it.
+    """
+
+    def __init__(
+        self,
+        ratio: float = RETRY_BUDGET_RATIO,
+        min_per_second: float = RETRY_BUDGET_MIN_PER_SECOND,
+        window: int = RETRY_BUDGET_WINDOW,
+    ):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.window = max(window, 1)
+        # Liczniki per sekunda w buforze cyklicznym: [sekunda, wywołania, ponowienia]
+        self._slots = [[-1, 0, 0] for _ in range(self.window)]
+        self.exhausted = 0
+
+    def _slot(self) -> list[int]:
+        second = int(time.monotonic())
+        slot = self._slots[second % self.window]
+        if slot[0] != second:
+            slot[:] = [second, 0, 0]
+        return slot
+
+    def deposit(self) -> None:
+        self._slot()[1] += 1
+
+    def try_withdraw(self) -> bool:
+        current = self._slot()
+        oldest = current[0] - self.window
+        calls = retries = 0
+        for second, slot_calls, slot_retries in self._slots:
+            if second > oldest:
+                calls += slot_calls
+                retries += slot_retries
+        allowed = self.ratio * calls + self.min_per_second * self.window
+        if retries + 1 > allowed:
+            self.exhausted += 1
+            return False
+        current[2] += 1
+        return True
+
+
+class LatencyWindow:
+    """Latencies of the most recent successful calls, for the hedging delay."""
+
+    def __init__(self, size: int = 1000):
+        self._samples: list[float] = []
+        self._size = size
+        self._next = 0
+        self._since_sort = 0
+        self._sorted: list[float] = []
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def observe(self, latency: float) -> None:
+        if len(self._samples) < self._size:
+            self._samples.append(latency)
+        else:
+            self._samples[self._next] = latency
+            self._next = (self._next + 1) % self._size
+        self._since_sort += 1
+
+    def quantile(self, q: float) -> float:
+        # Sortujemy dopiero, gdy przybyło 10% nowych próbek, a nie przy każdym zapytaniu
+        if self._since_sort * 10 >= len(self._samples) or not self._sorted:
+            self._sorted = sorted(self._samples)
+            self._since_sort = 0
+        index = min(int(q * len(self._sorted)), len(self._sorted) - 1)
+        return self._sorted[index]
+
+
+def _retrieve(task: asyncio.Task) -> None:
+    # Wynik anulowanej próby nikogo nie interesuje, ale wyjątek trzeba odebrać
+    if not task.cancelled():
+        task.exception()
+
+
+class RetryPolicy:
+    """
+    Retries and hedging for calls to one upstream. A failed attempt is retried
+    (with jittered exponential backoff) up to `attempts` times; with hedging
+    on, a second attempt is sent if the first has not finished within the
+    observed `hedge_quantile` latency, and whichever finishes first wins.
+    Every extra attempt is paid from `budget`.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        attempts: int = RETRY_ATTEMPTS,
+        backoff: float = RETRY_BACKOFF,
+        hedge: bool = HEDGE_ENABLED,
+        hedge_quantile: float = HEDGE_QUANTILE,
+        hedge_min_delay: float = HEDGE_MIN_DELAY,
+        hedge_min_samples: int = HEDGE_MIN_SAMPLES,
+        budget: RetryBudget | None = None,
+    ):
+        self.name = name
+        self.attempts = max(attempts, 0)
+        self.backoff = backoff
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_min_samples = hedge_min_samples
+        self.budget = budget or RetryBudget()
+        self.latencies = LatencyWindow()
+        self.retries = 0
+        self.hedges = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.attempts > 0 or self.hedge
+
+    def hedge_delay(self) -> float | None:
+        """Seconds to wait before hedging, or None until enough calls were seen."""
+        if not self.hedge or len(self.latencies) < self.hedge_min_samples:
+            return None
+        return max(self.latencies.quantile(self.hedge_quantile), self.hedge_min_delay)
+
+    async def run(
+        self,
+        attempt: Callable[[int], Awaitable[T]],
+        should_retry: Callable[[T | BaseException], bool],
+    ) -> T:
+        """
+        Calls `attempt(n)` for attempt number n until one succeeds, fails in a
+        way `should_retry` rejects, or retries and budget run out. The last
+        outcome is returned or raised as is.
+        """
+        if not self.enabled:
+            return await attempt(0)
+
+        self.budget.deposit()
+        pending: dict[asyncio.Task, float] = {}
+        started = 0
+        retries = 0
+
+        def start() -> None:
+            nonlocal started
+            task = asyncio.ensure_future(attempt(started))
+            pending[task] = time.monotonic()
+            started += 1
+
+        hedge_delay = self.hedge_delay()
+        start()
+        try:
+            while True:
+                timeout = None
+                if hedge_delay is not None:
+                    first_started = min(pending.values())
+                    timeout = max(first_started + hedge_delay - time.monotonic(), 0)
+                done, _ = await asyncio.wait(
+                    pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+
+                if not done:
+                    # Jedna dodatkowa próba na wywołanie, tylko w ramach budżetu
+                    hedge_delay = None
+                    if self.budget.try_withdraw():
+                        self.hedges += 1
+                        start()
+                    continue
+
+                last: asyncio.Task | None = None
+                for task in done:
+                    task_started = pending.pop(task)
+                    error = task.exception()
+                    outcome = error if error is not None else task.result()
+                    if not should_retry(outcome):
+                        if error is None:
+                            self.latencies.observe(time.monotonic() - task_started)
+                        return task.result()
+                    last = task
+                if pending:
+                    continue
+
+                if retries >= self.attempts or not self.budget.try_withdraw():
+                    return last.result()
+                retries += 1
+                self.retries += 1
+                # Pełny jitter: równoległe ponowienia nie uderzają w tej samej chwili
+                await asyncio.sleep(
+                    random.uniform(0, self.backoff * 2 ** (retries - 1))
+                )
+                hedge_delay = None
+                start()
+        finally:
+            for task in pending:
+                task.cancel()
+                task.add_done_callback(_retrieve)
+
+    def stats(self) -> dict:
+        return {
+            "retries": self.retries,
+            "hedges": self.hedges,
+            "budget_exhausted": self.budget.exhausted,
+        }
@@ -0,0 +1,124 @@
+import asyncio
+
+import grpc
+from google.protobuf.json_format import MessageToDict
+
+from app.access_log import logger
+from app.config import (
+    USER_LOOKUP_BATCH_DELAY,
+    USER_LOOKUP_BATCH_SIZE,
+    USER_SERVICE_TIMEOUT,
+)
+from app.metrics import USER_LOOKUP_BATCH
+
+from .channel import get_stub
+from .proto_gen import user_p2p, user_service_pb2
+
+
+def _not_found(email: str) -> grpc.aio.AioRpcError:
+    return grpc.aio.AioRpcError(
+        grpc.StatusCode.NOT_FOUND,
+        grpc.aio.Metadata(),
+        grpc.aio.Metadata(),
+        details=f"User {email} not found",
+    )
+
+
+def _retrieve(future: asyncio.Future) -> None:
+    # Wszyscy czekający mogli zrezygnować; wyjątek i tak trzeba odebrać
+    if not future.cancelled():
+        future.exception()
+
+
+class UserBatcher:
+    """
+    Gathers user lookups for up to `max_delay` seconds or `max_size` emails
+    and sends them as one BatchGetUsersByEmail call. Emails missing from the
+    response fail with NOT_FOUND, the same as a single GetUserByEmail. If the
+    user service does not implement the batch call, batching turns itself
+    off and the lookups fail with UNIMPLEMENTED for the caller to retry one
+    by one.
+    """
+
+    def __init__(
+        self,
+        max_size: int = USER_LOOKUP_BATCH_SIZE,
+        max_delay: float = USER_LOOKUP_BATCH_DELAY,
+    ):
+        self.max_size = max_size
+        self.max_delay = max_delay
+        self.enabled = max_size > 1
+        self._pending: dict[str, asyncio.Future] = {}
+        self._timer: asyncio.TimerHandle | None = None
+        self._tasks: set[asyncio.Task] = set()
+        self.batches = 0
+        self.lookups = 0
+
+    async def get(self, email: str) -> user_p2p.User:
+        """
+        Looks the user up in the next batch.
+        \nRaises:
+            grpc.RpcError: If the batch call fails or the user was not found.
+        """
+        future = self._pending.get(email)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = self._pending[email] = loop.create_future()
+            future.add_done_callback(_retrieve)
+            if len(self._pending) >= self.max_size:
+                self._flush()
+            elif self._timer is None:
+                self._timer = loop.call_later(self.max_delay, self._flush)
+        return await asyncio.shield(future)
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, {}
+        if batch:
+            task = asyncio.ensure_future(self._send(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, batch: dict[str, asyncio.Future]) -> None:
+        self.batches += 1
+        self.lookups += len(batch)
+        USER_LOOKUP_BATCH.observe(len(batch))
+        try:
+            response = await get_stub().BatchGetUsersByEmail(
+                user_service_pb2.BatchGetUsersByEmailRequest(emails=list(batch)),
+                timeout=USER_SERVICE_TIMEOUT,
+            )
+        except grpc.RpcError as e:
+            if e.code() == grpc.StatusCode.UNIMPLEMENTED and self.enabled:
+                logger.warning(
+                    "User service does not implement BatchGetUsersByEmail, "
+                    "looking users up one by one"
+                )
+                self.enabled = False
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+        except BaseException:
+            for future in batch.values():
+                future.cancel()
+            raise
+
+        # User service może znormalizować wielkość liter w adresie
+        users = {user.email.lower(): user for user in response.users}
+        for email, future in batch.items():
+            if future.done():
+                continue
+            user = users.get(email.lower())
+            if user is None:
+                future.set_exception(_not_found(email))
+            else:
+                future.set_result(user_p2p.User(**MessageToDict(user)))
+
+    def stats(self) -> dict[str, int]:
+        return {"batches": self.batches, "lookups": self.lookups}
+
+
+user_batcher = UserBatcher()
@@ -0,0 +1,88 @@
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+
+from app.config import USER_CACHE_SIZE, USER_CACHE_STALE_TTL, USER_CACHE_TTL
+
+from .proto_gen import user_p2p
+
+
+class UserCache:
+    """
+    In-process LRU cache of resolved users keyed by email.
+    Entries are fresh for `ttl` seconds; for a further `stale_ttl` seconds they
+    are still served but reported as stale, so the caller can refresh them
+    in the background (stale-while-revalidate).
+    """
+
+    def __init__(
+        self,
+        max_size: int,
+        ttl: float,
+        stale_ttl: float = 0.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._clock = clock
+        self._entries: OrderedDict[str, tuple[float, user_p2p.User]] = OrderedDict()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, email: str) -> tuple[user_p2p.User | None, bool]:
+        """Returns the cached user (or None) and whether the entry is stale."""
+        entry = self._entries.get(email)
+        if entry is None:
+            self.misses += 1
+            return None, False
+
+        stored_at, user = entry
+        age = self._clock() - stored_at
+        if age <= self.ttl:
+            self.hits += 1
+            self._entries.move_to_end(email)
+            return user, False
+        if age <= self.ttl + self.stale_ttl:
+            self.stale_hits += 1
+            self._entries.move_to_end(email)
+            return user, True
+
+        del self._entries[email]
+        self.expirations += 1
+        self.misses += 1
+        return None, False
+
+    def set(self, email: str, user: user_p2p.User) -> None:
+        if self.max_size <= 0:
+            return
+        self._entries[email] = (self._clock(), user)
+        self._entries.move_to_end(email)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, email: str) -> None:
+        self._entries.pop(email, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+user_cache = UserCache(USER_CACHE_SIZE, USER_CACHE_TTL, USER_CACHE_STALE_TTL)
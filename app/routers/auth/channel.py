@@ -0,0 +1,196 @@
+import asyncio
+import itertools
+import time
+
+import grpc
+
+from app.breaker import CircuitBreaker, CircuitOpenError
+from app.config import (
+    METRICS_ENABLED,
+    USER_SERVICE_CHANNELS,
+    USER_SERVICE_CLOSE_GRACE,
+    USER_SERVICE_KEEPALIVE_TIME_MS,
+    USER_SERVICE_KEEPALIVE_TIMEOUT_MS,
+    USER_SERVICE_URL,
+)
+from app.metrics import USER_SERVICE_DURATION
+from app.retry import RetryPolicy
+
+from .proto_gen import user_service_pb2_grpc
+
+# Kody gRPC świadczące o awarii user service, a nie o błędzie w samym zapytaniu
+FAILURE_CODES = frozenset(
+    {
+        grpc.StatusCode.UNAVAILABLE,
+        grpc.StatusCode.DEADLINE_EXCEEDED,
+        grpc.StatusCode.INTERNAL,
+        grpc.StatusCode.UNKNOWN,
+        grpc.StatusCode.RESOURCE_EXHAUSTED,
+    }
+)
+
+
+class CircuitBreakerInterceptor(grpc.aio.UnaryUnaryClientInterceptor):
+    """
+    Runs every unary call through the target's circuit breaker. While it is
+    open, calls fail immediately with UNAVAILABLE, so callers keep handling a
+    plain `grpc.RpcError`.
+    """
+
+    def __init__(self, breaker: CircuitBreaker):
+        self.breaker = breaker
+
+    async def intercept_unary_unary(self, continuation, client_call_details, request):
+        try:
+            self.breaker.before_call()
+        except CircuitOpenError as e:
+            raise grpc.aio.AioRpcError(
+                grpc.StatusCode.UNAVAILABLE,
+                grpc.aio.Metadata(),
+                grpc.aio.Metadata(),
+                details=str(e),
+            )
+
+        started = time.monotonic()
+        try:
+            call = await continuation(client_call_details, request)
+            response = await call
+        except grpc.RpcError as e:
+            self.breaker.on_result(
+                time.monotonic() - started, e.code() not in FAILURE_CODES
+            )
+            raise
+        except BaseException:
+            self.breaker.on_cancel()
+            raise
+        self.breaker.on_result(time.monotonic() - started, True)
+        return response
+
+
+# Wywołania, które można bezpiecznie powtórzyć: odczyty i usuwanie
+IDEMPOTENT_METHODS = frozenset({"GetUserByEmail", "BatchGetUsersByEmail", "Delete"})
+RETRYABLE_CODES = frozenset({grpc.StatusCode.UNAVAILABLE})
+
+
+def _method_name(client_call_details) -> str:
+    method = client_call_details.method
+    if isinstance(method, bytes):
+        method = method.decode()
+    return method.rsplit("/", 1)[-1]
+
+
+def _should_retry(outcome) -> bool:
+    return isinstance(outcome, grpc.RpcError) and outcome.code() in RETRYABLE_CODES
+
+
+class RetryInterceptor(grpc.aio.UnaryUnaryClientInterceptor):
+    """
+    Applies the retry policy (retries, hedging and the retry budget) to
+    idempotent unary calls. Every attempt passes through the circuit breaker
+    and gets only what is left of the call's deadline.
+    """
+
+    def __init__(self, policy: RetryPolicy):
+        self.policy = policy
+
+    async def intercept_unary_unary(self, continuation, client_call_details, request):
+        if _method_name(client_call_details) not in IDEMPOTENT_METHODS:
+            call = await continuation(client_call_details, request)
+            return await call
+
+        started = time.monotonic()
+        timeout = client_call_details.timeout
+
+        async def attempt(number: int):
+            details = client_call_details
+            if number > 0 and timeout is not None:
+                remaining = timeout - (time.monotonic() - started)
+                if remaining <= 0:
+                    raise grpc.aio.AioRpcError(
+                        grpc.StatusCode.DEADLINE_EXCEEDED,
+                        grpc.aio.Metadata(),
+                        grpc.aio.Metadata(),
+                        details="Deadline exceeded before retry",
+                    )
+                details = details._replace(timeout=remaining)
+            call = await continuation(details, request)
+            return await call
+
+        return await self.policy.run(attempt, _should_retry)
+
+
+class MetricsInterceptor(grpc.aio.UnaryUnaryClientInterceptor):
+    """Records the latency and status code of every unary call."""
+
+    async def intercept_unary_unary(self, continuation, client_call_details, request):
+        method = _method_name(client_call_details)
+        started = time.perf_counter()
+        code = "OK"
+        try:
+            call = await continuation(client_call_details, request)
+            return await call
+        except grpc.RpcError as e:
+            code = e.code().name
+            raise
+        except BaseException:
+            code = "CANCELLED"
+            raise
+        finally:
+            USER_SERVICE_DURATION.observe(time.perf_counter() - started, method, code)
+
+
+breaker = CircuitBreaker(f"user service {USER_SERVICE_URL}")
+retry_policy = RetryPolicy("user_service")
+_channels: list[grpc.aio.Channel] = []
+_stubs: list[user_service_pb2_grpc.UserServiceStub] = []
+_next_stub = itertools.count()
+
+CHANNEL_OPTIONS = (
+    ("grpc.keepalive_time_ms", USER_SERVICE_KEEPALIVE_TIME_MS),
+    ("grpc.keepalive_timeout_ms", USER_SERVICE_KEEPALIVE_TIMEOUT_MS),
+    ("grpc.keepalive_permit_without_calls", 1),
+    ("grpc.http2.max_pings_without_data", 0),
+    # Każdy kanał z puli dostaje własne połączenie HTTP/2
+    ("grpc.use_local_subchannel_pool", 1),
+)
+
+
+async def open_channels() -> None:
+    """Opens the long-lived user service channels on startup."""
+    if _channels:
+        return
+    interceptors = [CircuitBreakerInterceptor(breaker)]
+    # Ponowienia nad breakerem: każda próba jest przez niego liczona osobno
+    if retry_policy.enabled:
+        interceptors.insert(0, RetryInterceptor(retry_policy))
+    if METRICS_ENABLED:
+        interceptors.insert(0, MetricsInterceptor())
+    for _ in range(max(USER_SERVICE_CHANNELS, 1)):
+        channel = grpc.aio.insecure_channel(
+            USER_SERVICE_URL,
+            options=CHANNEL_OPTIONS,
+            interceptors=interceptors,
+        )
+        # Zaczynamy łączyć się od razu, bez czekania na pierwsze wywołanie
+        channel.get_state(try_to_connect=True)
+        _channels.append(channel)
+        _stubs.append(user_service_pb2_grpc.UserServiceStub(channel))
+
+
+async def close_channels() -> None:
+    """
+    Closes the channels on shutdown, giving calls still in flight (such as
+    background revalidations) up to USER_SERVICE_CLOSE_GRACE seconds to finish.
+    """
+    channels = list(_channels)
+    _channels.clear()
+    _stubs.clear()
+    grace = USER_SERVICE_CLOSE_GRACE or None
+    await asyncio.gather(*(channel.close(grace=grace) for channel in channels))
+
+
+def get_stub() -> user_service_pb2_grpc.UserServiceStub:
+    """Returns a stub bound to the next channel in the pool (round robin)."""
+    if not _stubs:
+        raise RuntimeError("User service channels are not open")
+    return _stubs[next(_next_stub) % len(_stubs)]
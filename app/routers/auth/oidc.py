@@ -0,0 +1,133 @@
+import asyncio
+import contextlib
+import time
+
+import httpx
+from fastapi import HTTPException, Request
+from starlette import status
+from starlette.config import Config
+from starlette.responses import RedirectResponse
+
+from app.access_log import logger
+from app.config import (
+    GOOGLE_CLIENT_ID,
+    GOOGLE_CLIENT_SECRET,
+    OIDC_REFRESH_INTERVAL,
+)
+
+GOOGLE_METADATA_URL = "https://accounts.google.com/.well-known/openid-configuration"
+
+# Po nieudanym pobraniu próbujemy ponownie wcześniej niż przy zwykłym odświeżaniu
+RETRY_DELAY = 30.0
+
+if GOOGLE_CLIENT_ID is None or GOOGLE_CLIENT_SECRET is None:
+    raise RuntimeError("Missing env variables")
+
+
+class GoogleOAuth:
+    """
+    The Google OAuth client. authlib is only imported when the client is first
+    used, and the OpenID discovery document and JWKS can be fetched in the
+    background on startup and refreshed every `refresh_interval` seconds, so
+    the first login after a restart does not wait for them. If a refresh
+    fails, the previous documents stay in use.
+    """
+
+    def __init__(self, refresh_interval: float = OIDC_REFRESH_INTERVAL):
+        self.refresh_interval = refresh_interval
+        self.loaded_at: float | None = None
+        self.failures = 0
+        self._client = None
+        self._task: asyncio.Task | None = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            # authlib to kilkadziesiąt ms importu, a potrzebny jest tylko przy logowaniu
+            from authlib.integrations.starlette_client import OAuth
+
+            oauth = OAuth(
+                Config(
+                    environ={
+                        "GOOGLE_CLIENT_ID": GOOGLE_CLIENT_ID,
+                        "GOOGLE_CLIENT_SECRET": GOOGLE_CLIENT_SECRET,
+                    }
+                )
+            )
+            self._client = oauth.register(
+                name="google",
+                server_metadata_url=GOOGLE_METADATA_URL,
+                client_kwargs={"scope": "openid email profile"},
+            )
+        return self._client
+
+    async def authorize_redirect(
+        self, request: Request, redirect_uri: str
+    ) -> RedirectResponse:
+        return await self.client.authorize_redirect(request, redirect_uri)
+
+    async def authorize_access_token(self, request: Request) -> dict:
+        """
+        Exchanges the callback's authorization code for tokens and user info.
+        \nRaises:
+            HTTPException: If the OAuth2 authorization fails.
+        """
+        from authlib.integrations.base_client import OAuthError
+
+        try:
+            return await self.client.authorize_access_token(request)
+        except OAuthError:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Could not validate credentials",
+            )
+
+    async def refresh(self) -> None:
+        """Fetches the discovery document and JWKS again."""
+        client = self.client
+        previous = dict(client.server_metadata)
+        # authlib pobiera metadane ponownie dopiero po usunięciu znacznika _loaded_at
+        client.server_metadata.pop("_loaded_at", None)
+        try:
+            await client.load_server_metadata()
+            await client.fetch_jwk_set(force=True)
+        except BaseException:
+            client.server_metadata.update(previous)
+            raise
+        self.loaded_at = time.time()
+
+    def start(self) -> None:
+        """Starts fetching in the background; startup does not wait for it."""
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+
+    async def _run(self) -> None:
+        from authlib.common.errors import AuthlibBaseError
+
+        while True:
+            try:
+                await self.refresh()
+            # RuntimeError: w metadanych brakuje jwks_uri, ValueError: odpowiedź to nie JSON
+            except (httpx.HTTPError, AuthlibBaseError, RuntimeError, ValueError) as exc:
+                self.failures += 1
+                logger.warning("Could not fetch Google OpenID metadata: %r", exc)
+                # Po błędzie ponawiamy także przy interwale 0 (pobranie jednorazowe)
+                if self.refresh_interval > 0:
+                    delay = min(self.refresh_interval, RETRY_DELAY)
+                else:
+                    delay = RETRY_DELAY
+            else:
+                if self.refresh_interval <= 0:
+                    return
+                delay = self.refresh_interval
+            await asyncio.sleep(delay)
+
+
+google_oauth = GoogleOAuth()
@@ -1,12 +1,13 @@
 # This is an automatically generated file, please do not change
-# gen by protobuf_to_pydantic[v0.3.3.0](https://github.com/so1n/protobuf_to_pydantic)
+# gen by protobuf_to_pydantic[v0.3.3.1](https://github.com/so1n/protobuf_to_pydantic)
 # Protobuf Version: 5.29.4 
-# Pydantic Version: 2.11.4 
+# Pydantic Version: 2.14.1 
 from .user_p2p import User
 from .user_p2p import UserMetadata
 from google.protobuf.message import Message  # type: ignore
 from pydantic import BaseModel
 from pydantic import Field
+import typing
 
 
 class AuthenticateWithGoogleRequest(BaseModel):
@@ -19,6 +20,16 @@ class AuthenticateWithGoogleResponse(BaseModel):
 class GetUserByEmailRequest(BaseModel):
     email: str = Field(default="")
 
+class BatchGetUsersByEmailRequest(BaseModel):
+    emails: typing.List[str] = Field(default_factory=list)
+
+class BatchGetUsersByEmailResponse(BaseModel):
+    """
+     Users that were not found are left out of the response
+    """
+
+    users: typing.List[User] = Field(default_factory=list)
+
 class CreateUserResponse(BaseModel):
     success: bool = Field(default=False)
 
@@ -52,6 +52,12 @@ class UserServiceStub(object):
             response_deserializer=user__pb2.User.FromString,
             _registered_method=True,
         )
+        self.BatchGetUsersByEmail = channel.unary_unary(
+            "/user_service.UserService/BatchGetUsersByEmail",
+            request_serializer=user__service__pb2.BatchGetUsersByEmailRequest.SerializeToString,
+            response_deserializer=user__service__pb2.BatchGetUsersByEmailResponse.FromString,
+            _registered_method=True,
+        )
         self.Create = channel.unary_unary(
             "/user_service.UserService/Create",
             request_serializer=user__pb2.User.SerializeToString,
@@ -81,6 +87,12 @@ class UserServiceServicer(object):
         context.set_details("Method not implemented!")
         raise NotImplementedError("Method not implemented!")
 
+    def BatchGetUsersByEmail(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details("Method not implemented!")
+        raise NotImplementedError("Method not implemented!")
+
     def Create(self, request, context):
         """Missing associated documentation comment in .proto file."""
         context.set_code(grpc.StatusCode.UNIMPLEMENTED)
@@ -106,6 +118,11 @@ def add_UserServiceServicer_to_server(servicer, server):
             request_deserializer=user__service__pb2.GetUserByEmailRequest.FromString,
             response_serializer=user__pb2.User.SerializeToString,
         ),
+        "BatchGetUsersByEmail": grpc.unary_unary_rpc_method_handler(
+            servicer.BatchGetUsersByEmail,
+            request_deserializer=user__service__pb2.BatchGetUsersByEmailRequest.FromString,
+            response_serializer=user__service__pb2.BatchGetUsersByEmailResponse.SerializeToString,
+        ),
         "Create": grpc.unary_unary_rpc_method_handler(
             servicer.Create,
             request_deserializer=user__pb2.User.FromString,
@@ -190,6 +207,36 @@ class UserService(object):
             _registered_method=True,
         )
 
+    @staticmethod
+    def BatchGetUsersByEmail(
+        request,
+        target,
+        options=(),
+        channel_credentials=None,
+        call_credentials=None,
+        insecure=False,
+        compression=None,
+        wait_for_ready=None,
+        timeout=None,
+        metadata=None,
+    ):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            "/user_service.UserService/BatchGetUsersByEmail",
+            user__service__pb2.BatchGetUsersByEmailRequest.SerializeToString,
+            user__service__pb2.BatchGetUsersByEmailResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True,
+        )
+
     @staticmethod
     def Create(
         request,
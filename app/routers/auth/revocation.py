@@ -0,0 +1,249 @@
+import asyncio
+import contextlib
+import fcntl
+import hashlib
+import math
+import os
+import tempfile
+import time
+
+from app.access_log import logger
+from app.config import (
+    AUTH_CLAIMS_ONLY,
+    AUTH_REVOCATION_CAPACITY,
+    AUTH_REVOCATION_PATH,
+    AUTH_REVOCATION_REFRESH,
+    AUTH_REVOCATION_TTL,
+)
+
+# Fałszywe trafienie kosztuje tylko zwykłe wyszukiwanie w user service
+FALSE_POSITIVE_RATE = 0.001
+
+
+def default_path() -> str:
+    directory = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(directory, "api-gateway-revocations")
+
+
+class BloomFilter:
+    """
+    Fixed-size set of strings that can answer "maybe present" for keys never
+    added (at about `error_rate` once `capacity` keys are in), but never
+    misses a key that was added.
+    """
+
+    def __init__(self, capacity: int, error_rate: float = FALSE_POSITIVE_RATE):
+        capacity = max(capacity, 1)
+        self.bits = max(int(-capacity * math.log(error_rate) / math.log(2) ** 2), 8)
+        self.hashes = max(round(self.bits / capacity * math.log(2)), 1)
+        self._array = bytearray((self.bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: str) -> range:
+        # Podwójne haszowanie: k pozycji z dwóch połówek jednego skrótu
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little") % self.bits
+        second = int.from_bytes(digest[8:], "little") % self.bits or 1
+        return range(first, first + self.hashes * second, second)
+
+    def __contains__(self, key: str) -> bool:
+        array, bits = self._array, self.bits
+        # Zwykle już pierwszy bit jest zerowy, więc kończymy od razu
+        for position in self._positions(key):
+            position %= bits
+            if not array[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    def add(self, key: str) -> None:
+        array, bits = self._array, self.bits
+        for position in self._positions(key):
+            position %= bits
+            array[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+
+class RevocationList:
+    """
+    Users whose token claims must not be trusted any more, such as deleted
+    users or users whose role changed. Each worker keeps them in a Bloom
+    filter; a hit only sends the request through the user service lookup.
+
+    Revocations are appended to a shared file (in /dev/shm by default) that
+    every worker re-reads every `refresh_interval` seconds, so they reach all
+    workers on the host, or all hosts if the file is on a shared volume. Other
+    services may append to it too, one `[unix-timestamp ]email` per line,
+    holding a shared flock on `<path>.lock` while they write. Timestamped
+    lines are dropped after `ttl` seconds, the lifetime of an access token,
+    and removed from the file once per `ttl`.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = AUTH_CLAIMS_ONLY,
+        path: str = AUTH_REVOCATION_PATH,
+        capacity: int = AUTH_REVOCATION_CAPACITY,
+        ttl: float = AUTH_REVOCATION_TTL,
+        refresh_interval: float = AUTH_REVOCATION_REFRESH,
+    ):
+        self.enabled = enabled
+        self.path = path or default_path()
+        self.capacity = capacity
+        self.ttl = ttl
+        self.refresh_interval = refresh_interval
+        self._filter = BloomFilter(capacity)
+        self._file_id: tuple[int, int] | None = None
+        self._offset = 0
+        self._built_at = 0.0
+        self._task: asyncio.Task | None = None
+
+    def __contains__(self, email: str) -> bool:
+        return self._filter.count > 0 and email.lower() in self._filter
+
+    def revoke(self, email: str) -> None:
+        """Stops trusting `email`'s tokens in this worker now and in the others on their next refresh."""
+        if not self.enabled:
+            return
+        email = email.lower()
+        self._filter.add(email)
+        try:
+            # Zapis z O_APPEND jest atomowy; blokada chroni go tylko przed kompaktowaniem
+            with self._locked(fcntl.LOCK_SH):
+                fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+                try:
+                    os.write(fd, f"{int(time.time())} {email}\n".encode())
+                finally:
+                    os.close(fd)
+        except OSError as exc:
+            logger.warning("Could not record revocation of %s: %r", email, exc)
+
+    @contextlib.contextmanager
+    def _locked(self, operation: int):
+        fd = os.open(f"{self.path}.lock", os.O_WRONLY | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, operation)
+            yield
+        finally:
+            os.close(fd)
+
+    def _email(self, line: bytes, now: float) -> str | None:
+        """The email a file line revokes, or None if it expired or is malformed."""
+        fields = line.decode(errors="replace").split()
+        if len(fields) == 2:
+            try:
+                revoked_at = float(fields[0])
+            except ValueError:
+                return None
+            if now - revoked_at > self.ttl:
+                return None
+            return fields[1].lower()
+        if len(fields) == 1:
+            return fields[0].lower()
+        return None
+
+    def compact(self, now: float) -> None:
+        """
+        Rewrites the file without expired and malformed lines, so it does not
+        grow without bound. The new file replaces the old one atomically while
+        appends are locked out; workers notice the replacement and rebuild.
+        """
+        with self._locked(fcntl.LOCK_EX):
+            try:
+                with open(self.path, "rb") as file:
+                    data = file.read()
+            except FileNotFoundError:
+                return
+            end = data.rfind(b"\n") + 1
+            lines = data[:end].splitlines(keepends=True)
+            kept = [line for line in lines if self._email(line, now) is not None]
+            if len(kept) == len(lines):
+                return
+            fd, temporary = tempfile.mkstemp(
+                dir=os.path.dirname(self.path), prefix=".revocations-"
+            )
+            try:
+                with os.fdopen(fd, "wb") as file:
+                    file.writelines(kept)
+                    file.write(data[end:])
+                os.replace(temporary, self.path)
+            except BaseException:
+                with contextlib.suppress(OSError):
+                    os.unlink(temporary)
+                raise
+        logger.info("Compacted revocations: dropped %d lines", len(lines) - len(kept))
+
+    def refresh(self) -> None:
+        """
+        Adds lines appended since the last refresh. Once per `ttl` the file is
+        compacted and the filter rebuilt from it, which drops expired entries;
+        so is it when the file was replaced or truncated.
+        """
+        now = time.time()
+        if now - self._built_at >= self.ttl:
+            try:
+                self.compact(now)
+            except OSError as exc:
+                logger.warning("Could not compact revocations: %r", exc)
+        try:
+            with open(self.path, "rb") as file:
+                stat = os.fstat(file.fileno())
+                file_id = (stat.st_dev, stat.st_ino)
+                rebuild = (
+                    file_id != self._file_id
+                    or stat.st_size < self._offset
+                    or now - self._built_at >= self.ttl
+                )
+                if rebuild:
+                    target = BloomFilter(self.capacity)
+                    offset = 0
+                else:
+                    target, offset = self._filter, self._offset
+                file.seek(offset)
+                data = file.read()
+        except FileNotFoundError:
+            return
+
+        # Niedokończoną ostatnią linię doczytamy przy następnym odświeżeniu
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].splitlines():
+            email = self._email(line, now)
+            if email is not None:
+                target.add(email)
+
+        if rebuild:
+            self._filter = target
+            self._file_id = file_id
+            self._built_at = now
+        self._offset = offset + end
+
+    def start(self) -> None:
+        """Loads the file and keeps re-reading it in the background."""
+        if not self.enabled or self._task is not None:
+            return
+        try:
+            self.refresh()
+        except OSError as exc:
+            logger.warning("Could not read revocations: %r", exc)
+        if self.refresh_interval > 0:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                self.refresh()
+            except OSError as exc:
+                logger.warning("Could not read revocations: %r", exc)
+
+    def stats(self) -> dict[str, int]:
+        return {"entries": self._filter.count}
+
+
+revocations = RevocationList()
@@ -2,30 +2,30 @@ from datetime import timedelta
 from typing import Annotated
 
 import grpc
-from authlib.integrations.base_client import OAuthError
-from authlib.oauth2.rfc6749 import OAuth2Token
+import jwt
 from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.responses import RedirectResponse
 from google.protobuf.json_format import MessageToDict
 from starlette import status
 
-from app.config import FRONTEND_URL, GOOGLE_REDIRECT_URI, USER_SERVICE_URL
+from app.config import FRONTEND_URL, GOOGLE_REDIRECT_URI, USER_SERVICE_TIMEOUT
 
+from .cache import user_cache
+from .channel import get_stub
+from .oidc import google_oauth
 from .proto_gen import (
     user_p2p,
     user_pb2,
     user_service_p2p,
     user_service_pb2,
-    user_service_pb2_grpc,
 )
+from .revocation import revocations
 from .services import (
-    UserDep,
+    VerifiedUserDep,
     create_access_token,
     create_refresh_token,
     decode_token,
-    oauth,
     oauth_bearer,
-    token_expired,
 )
 
 router = APIRouter(prefix="/auth", tags=["auth"])
@@ -34,7 +34,7 @@ router = APIRouter(prefix="/auth", tags=["auth"])
 @router.get("/google", response_class=RedirectResponse)
 async def login_google(request: Request):
     """Initiates the Google OAuth2 login flow by redirecting the user to Google's authorization page."""
-    return await oauth.google.authorize_redirect(request, GOOGLE_REDIRECT_URI)
+    return await google_oauth.authorize_redirect(request, GOOGLE_REDIRECT_URI)
 
 
 @router.get("/callback/google", response_class=RedirectResponse)
@@ -47,36 +47,30 @@ async def auth_google(request: Request):
     \nReturns:
         RedirectResponse: Redirects the user to the frontend application, setting authentication cookies.
     """
-    try:
-        user_response: OAuth2Token = await oauth.google.authorize_access_token(request)
-    except OAuthError:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Could not validate credentials",
-        )
+    user_response = await google_oauth.authorize_access_token(request)
 
     # TODO przenieś do services
     user_info = user_response.get("userinfo")
-    async with grpc.aio.insecure_channel(USER_SERVICE_URL) as channel:
-        stub = user_service_pb2_grpc.UserServiceStub(channel)
-        try:
-            response: user_service_pb2.AuthenticateWithGoogleResponse = (
-                await stub.AuthenticateWithGoogle(
-                    user_service_pb2.AuthenticateWithGoogleRequest(
-                        user=user_pb2.UserMetadata(
-                            email=user_info.get("email"),
-                            firstName=user_info.get("given_name"),
-                            lastName=user_info.get("family_name"),
-                        )
+    try:
+        response: user_service_pb2.AuthenticateWithGoogleResponse = (
+            await get_stub().AuthenticateWithGoogle(
+                user_service_pb2.AuthenticateWithGoogleRequest(
+                    user=user_pb2.UserMetadata(
+                        email=user_info.get("email"),
+                        firstName=user_info.get("given_name"),
+                        lastName=user_info.get("family_name"),
                     )
-                )
-            )
-        except grpc.RpcError as e:
-            return RedirectResponse(
-                f"{FRONTEND_URL}/error?error={e.code()} - {e.details()}"
+                ),
+                timeout=USER_SERVICE_TIMEOUT,
             )
+        )
+    except grpc.RpcError as e:
+        return RedirectResponse(
+            f"{FRONTEND_URL}/error?error={e.code()} - {e.details()}"
+        )
 
     user = user_p2p.User(**MessageToDict(response.user))
+    user_cache.set(user.email, user)
     access_token = create_access_token(
         user.email, user.role, "#TODO ID", timedelta(days=7)
     )
@@ -113,14 +107,14 @@ async def auth_google(request: Request):
 )
 async def create_user(user_in: user_p2p.User):
     """Creates a new user by forwarding the user data to a gRPC user service."""
-    async with grpc.aio.insecure_channel(USER_SERVICE_URL) as channel:
-        stub = user_service_pb2_grpc.UserServiceStub(channel)
-        try:
-            response: user_service_pb2.CreateUserResponse = await stub.Create(
-                user_pb2.User(**user_in.model_dump())
-            )
-        except grpc.RpcError as e:
-            return HTTPException("Could not create user", status_code=e.code())
+    try:
+        response: user_service_pb2.CreateUserResponse = await get_stub().Create(
+            user_pb2.User(**user_in.model_dump()), timeout=USER_SERVICE_TIMEOUT
+        )
+    except grpc.RpcError as e:
+        return HTTPException("Could not create user", status_code=e.code())
+    if response.success:
+        user_cache.set(user_in.email, user_in)
     return MessageToDict(response)
 
 
@@ -130,14 +124,15 @@ async def create_user(user_in: user_p2p.User):
 )
 async def delete_user(email: str):
     """Deletes user by forwarding the user ID to a gRPC user service."""
-    async with grpc.aio.insecure_channel(USER_SERVICE_URL) as channel:
-        stub = user_service_pb2_grpc.UserServiceStub(channel)
-        try:
-            response: user_service_pb2.DeleteUserResponse = await stub.Delete(
-                user_service_pb2.DeleteUserRequest(email=email)
-            )
-        except grpc.RpcError as e:
-            return HTTPException("Could not delete user", status_code=e.code())
+    try:
+        response: user_service_pb2.DeleteUserResponse = await get_stub().Delete(
+            user_service_pb2.DeleteUserRequest(email=email),
+            timeout=USER_SERVICE_TIMEOUT,
+        )
+    except grpc.RpcError as e:
+        return HTTPException("Could not delete user", status_code=e.code())
+    user_cache.invalidate(email)
+    revocations.revoke(email)
     return MessageToDict(response)
 
 
@@ -146,7 +141,7 @@ async def delete_user(email: str):
     status_code=status.HTTP_201_CREATED,
     response_model=user_p2p.User,
 )
-async def get_user(user: UserDep):
+async def get_user(user: VerifiedUserDep):
     """Retrieve the current authenticated user's information."""
     return user
 
@@ -174,12 +169,18 @@ async def get_user(user: UserDep):
 
 @router.post("/refresh")
 async def refresh_access_token(token: Annotated[str, Depends(oauth_bearer)]):
-    if token_expired(token):
+    # Jedna weryfikacja tokenu: wygaśnięcie wykrywa już dekodowanie
+    try:
+        user = decode_token(token)
+    except jwt.ExpiredSignatureError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Refresh token is expired."
         )
+    except jwt.PyJWTError:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate user."
+        )
 
-    user = decode_token(token)
     if not user.get("refresh"):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
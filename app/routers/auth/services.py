@@ -1,48 +1,35 @@
-import os
+import asyncio
+import functools
+import time
 from datetime import UTC, datetime, timedelta
 from typing import Annotated
 
 import grpc
 import jwt
-from authlib.integrations.starlette_client import OAuth
 from fastapi import Depends, HTTPException
 from fastapi.security import OAuth2PasswordBearer
 from google.protobuf.json_format import (
     MessageToDict,
 )
-from passlib.context import CryptContext
 from starlette import status
-from starlette.config import Config
 
-from app.config import (
-    ALGORITHM,
-    GOOGLE_CLIENT_ID,
-    GOOGLE_CLIENT_SECRET,
-    USER_SERVICE_URL,
-)
+from app.access_log import note
+from app.config import AUTH_CLAIMS_ONLY, USER_SERVICE_TIMEOUT
+from app.metrics import AUTH_DURATION
+from app.singleflight import SingleFlight
 
+from .batcher import user_batcher
+from .cache import user_cache
+from .channel import get_stub
 from .proto_gen import (
     user_p2p,
     user_pb2,
     user_service_pb2,
-    user_service_pb2_grpc,
 )
+from .revocation import revocations
+from .tokens import key_ring, verify_token
 
-bcrypt_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth_bearer = OAuth2PasswordBearer(tokenUrl="auth/token")
-if GOOGLE_CLIENT_ID is None or GOOGLE_CLIENT_SECRET is None:
-    raise Exception("Missing env variables")
-config_data = {
-    "GOOGLE_CLIENT_ID": GOOGLE_CLIENT_ID,
-    "GOOGLE_CLIENT_SECRET": GOOGLE_CLIENT_SECRET,
-}
-starlette_config = Config(environ=config_data)
-oauth = OAuth(starlette_config)
-oauth.register(
-    name="google",
-    server_metadata_url="https://accounts.google.com/.well-known/openid-configuration",
-    client_kwargs={"scope": "openid email profile"},
-)
 
 TokenDep = Annotated[str, Depends(oauth_bearer)]
 
@@ -53,7 +40,7 @@ def create_access_token(
     encode = {"email": email, "id": user_id, "role": role, "refresh": refresh}
     expires = datetime.now(UTC) + expires_delta
     encode.update({"exp": expires})
-    return jwt.encode(encode, os.getenv("SECRET_KEY"), algorithm=ALGORITHM)
+    return key_ring.encode(encode)
 
 
 def create_refresh_token(email: str, role: str, user_id: int, expires_delta: timedelta):
@@ -61,10 +48,110 @@ def create_refresh_token(email: str, role: str, user_id: int, expires_delta: tim
 
 
 def decode_token(token):
-    return jwt.decode(token, os.getenv("SECRET_KEY"), algorithms=ALGORITHM)
+    return verify_token(token)
+
+
+async def fetch_user(email: str) -> user_p2p.User:
+    """Loads a user from the user service, bypassing the cache."""
+    if user_batcher.enabled:
+        try:
+            return await user_batcher.get(email)
+        except grpc.RpcError as e:
+            # User service bez BatchGetUsersByEmail: batcher już się wyłączył
+            if e.code() != grpc.StatusCode.UNIMPLEMENTED:
+                raise
+    response: user_pb2.User = await get_stub().GetUserByEmail(
+        user_service_pb2.GetUserByEmailRequest(email=email),
+        timeout=USER_SERVICE_TIMEOUT,
+    )
+    return user_p2p.User(**MessageToDict(response))
+
+
+# Równoległe zapytania o tego samego użytkownika dzielą jedno wywołanie gRPC
+user_lookups = SingleFlight()
+_revalidating: set[str] = set()
+_background_tasks: set[asyncio.Task] = set()
 
 
-def get_current_user(token: Annotated[str, Depends(oauth_bearer)]) -> user_p2p.User:
+async def _fetch_and_cache(email: str) -> user_p2p.User:
+    user = await fetch_user(email)
+    user_cache.set(email, user)
+    return user
+
+
+async def _revalidate(email: str) -> None:
+    try:
+        await user_lookups.do(email, lambda: _fetch_and_cache(email))
+    except grpc.RpcError as e:
+        # Przy chwilowym błędzie zostawiamy stary wpis, usuniętego użytkownika wyrzucamy
+        if e.code() == grpc.StatusCode.NOT_FOUND:
+            user_cache.invalidate(email)
+            revocations.revoke(email)
+    finally:
+        _revalidating.discard(email)
+
+
+async def resolve_user(email: str) -> user_p2p.User:
+    """
+    Returns the user from the cache, falling back to the user service on a miss.
+    Stale entries are served immediately while a single background refresh runs,
+    and concurrent misses for the same email share one user service call.
+    \nRaises:
+        grpc.RpcError: If the user service lookup fails on a cache miss.
+    """
+    user, stale = user_cache.get(email)
+    if user is not None:
+        if stale and email not in _revalidating:
+            _revalidating.add(email)
+            task = asyncio.create_task(_revalidate(email))
+            _background_tasks.add(task)
+            task.add_done_callback(_background_tasks.discard)
+        return user
+
+    return await user_lookups.do(email, lambda: _fetch_and_cache(email))
+
+
+# Ten sam obiekt dla powtarzających się claims, jak przy trafieniu w user_cache
+@functools.lru_cache(maxsize=65536)
+def _claims_user(email: str, role: str) -> user_p2p.User:
+    return user_p2p.User(email=email, role=role)
+
+
+async def get_current_user(
+    token: Annotated[str, Depends(oauth_bearer)],
+) -> user_p2p.User:
+    """
+    The token's user. In claims-only mode (AUTH_CLAIMS_ONLY) the email and
+    role come straight from the signed token unless the user was revoked.
+    """
+    return await _observe(token, AUTH_CLAIMS_ONLY)
+
+
+async def get_verified_user(
+    token: Annotated[str, Depends(oauth_bearer)],
+) -> user_p2p.User:
+    """The token's user as the user service has it, whatever the auth mode."""
+    return await _observe(token, False)
+
+
+async def _observe(token: str, trust_claims: bool) -> user_p2p.User:
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        user = await _authenticate(token, trust_claims)
+        outcome = "ok"
+        note(role=user.role)
+        return user
+    except HTTPException as e:
+        outcome = "unavailable" if e.status_code == 503 else "rejected"
+        raise
+    finally:
+        duration = time.perf_counter() - started
+        AUTH_DURATION.observe(duration, outcome)
+        note(auth_ms=round(duration * 1000, 3), auth=outcome)
+
+
+async def _authenticate(token: str, trust_claims: bool) -> user_p2p.User:
     try:
         payload = decode_token(token)
         email: str = payload.get("email")
@@ -82,32 +169,26 @@ def get_current_user(token: Annotated[str, Depends(oauth_bearer)]) -> user_p2p.U
                 detail="Could not validate user.",
             )
 
-        with grpc.insecure_channel(USER_SERVICE_URL) as channel:
-            stub = user_service_pb2_grpc.UserServiceStub(channel)
-            try:
-                response: user_pb2.User = stub.GetUserByEmail(
-                    user_service_pb2.GetUserByEmailRequest(email=email)
-                )
-            except grpc.RpcError:
+        role = payload.get("role")
+        if trust_claims and role and email not in revocations:
+            note(claims=True)
+            return _claims_user(email, role)
+
+        try:
+            return await resolve_user(email)
+        except grpc.RpcError as e:
+            if e.code() in (
+                grpc.StatusCode.UNAVAILABLE,
+                grpc.StatusCode.DEADLINE_EXCEEDED,
+            ):
                 raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail="Could not validate user.",
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="User service is unavailable.",
                 )
-        current_user = user_p2p.User(**MessageToDict(response))
-        return current_user
-    except jwt.PyJWTError:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate user."
-        )
-
-
-def token_expired(token: Annotated[str, Depends(oauth_bearer)]):
-    try:
-        payload = decode_token(token)
-        if not datetime.fromtimestamp(payload.get("exp"), UTC) > datetime.now(UTC):
-            return True
-        return False
-
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Could not validate user.",
+            )
     except jwt.PyJWTError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate user."
@@ -115,3 +196,4 @@ def token_expired(token: Annotated[str, Depends(oauth_bearer)]):
 
 
 UserDep = Annotated[user_p2p.User, Depends(get_current_user)]
+VerifiedUserDep = Annotated[user_p2p.User, Depends(get_verified_user)]
@@ -0,0 +1,121 @@
+import hashlib
+import time
+from collections import OrderedDict
+from collections.abc import Sequence
+from typing import Any
+
+import jwt
+
+from app.config import ALGORITHM, PREVIOUS_SECRET_KEYS, SECRET_KEY, TOKEN_CACHE_SIZE
+
+
+def key_id(key: bytes) -> str:
+    return hashlib.sha256(key).hexdigest()[:16]
+
+
+class KeyRing:
+    """
+    Signing keys loaded once at startup: tokens are signed with the current key,
+    and previous keys are still accepted for verification during a rotation.
+    """
+
+    def __init__(self, current: str, previous: Sequence[str] = ()):
+        self.current = current.encode()
+        self.current_kid = key_id(self.current)
+        self._keys = [self.current, *(key.encode() for key in previous)]
+        self._by_kid = {key_id(key): key for key in self._keys}
+
+    def encode(self, payload: dict[str, Any]) -> str:
+        return jwt.encode(
+            payload,
+            self.current,
+            algorithm=ALGORITHM,
+            headers={"kid": self.current_kid},
+        )
+
+    def decode(self, token: str) -> dict[str, Any]:
+        # Zwykle token jest podpisany bieżącym kluczem, więc nie parsujemy nagłówka
+        try:
+            return jwt.decode(token, self.current, algorithms=[ALGORITHM])
+        except jwt.InvalidSignatureError as e:
+            if len(self._keys) == 1:
+                raise
+            error = e
+
+        kid = jwt.get_unverified_header(token).get("kid")
+        key = self._by_kid.get(kid)
+        if key is not None and key != self.current:
+            return jwt.decode(token, key, algorithms=[ALGORITHM])
+
+        for key in self._keys[1:]:
+            try:
+                return jwt.decode(token, key, algorithms=[ALGORITHM])
+            except jwt.InvalidSignatureError as e:
+                error = e
+        raise error
+
+
+class TokenCache:
+    """
+    LRU cache of verified token claims keyed by the token's SHA-256 digest.
+    An entry is only served until the token's own `exp`.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._entries: OrderedDict[bytes, tuple[float, dict[str, Any]]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, digest: bytes) -> dict[str, Any] | None:
+        entry = self._entries.get(digest)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, claims = entry
+        if expires_at <= time.time():
+            del self._entries[digest]
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(digest)
+        return claims
+
+    def set(self, digest: bytes, claims: dict[str, Any]) -> None:
+        expires_at = claims.get("exp")
+        if self.max_size <= 0 or not isinstance(expires_at, int | float):
+            return
+        self._entries[digest] = (expires_at, claims)
+        self._entries.move_to_end(digest)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> dict[str, int]:
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+if SECRET_KEY is None:
+    raise RuntimeError("Missing env variables")
+key_ring = KeyRing(SECRET_KEY, PREVIOUS_SECRET_KEYS)
+token_cache = TokenCache(TOKEN_CACHE_SIZE)
+
+
+def verify_token(token: str) -> dict[str, Any]:
+    """
+    Returns the token's claims, verifying the signature only on the first use
+    of a given token.
+    \nRaises:
+        jwt.PyJWTError: If the token is invalid or expired.
+    """
+    digest = hashlib.sha256(token.encode()).digest()
+    claims = token_cache.get(digest)
+    if claims is None:
+        claims = key_ring.decode(token)
+        token_cache.set(digest, claims)
+    return claims
@@ -0,0 +1,210 @@
+import importlib.util
+import logging
+import math
+import multiprocessing
+import os
+import signal
+import socket
+import time
+
+import uvicorn
+
+from app.config import (
+    SERVER_BACKLOG,
+    SERVER_DRAIN_DELAY,
+    SERVER_GRACEFUL_TIMEOUT,
+    SERVER_HOST,
+    SERVER_KEEPALIVE_TIMEOUT,
+    SERVER_PORT,
+    SERVER_REUSE_PORT,
+    SERVER_WORKERS,
+    SERVER_WS_PER_MESSAGE_DEFLATE,
+)
+from app.metrics import RUN_STARTED_ENV
+
+logger = logging.getLogger("uvicorn.error")
+
+APP = "app.main:app"
+
+
+def cpu_limit() -> int:
+    """
+    CPUs the process may actually use: the cgroup CPU quota when one is set
+    (a container limit), otherwise the CPUs in the affinity mask.
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    quota = _cgroup_quota()
+    if quota is not None:
+        cpus = min(cpus, math.ceil(quota))
+    return max(cpus, 1)
+
+
+def _cgroup_quota() -> float | None:
+    try:
+        # cgroup v2: "<quota> <period>" albo "max <period>"
+        with open("/sys/fs/cgroup/cpu.max") as file:
+            quota, period = file.read().split()
+        return None if quota == "max" else int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    try:
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as file:
+            quota = int(file.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as file:
+            period = int(file.read())
+    except (OSError, ValueError):
+        return None
+    return quota / period if quota > 0 and period > 0 else None
+
+
+def _available(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+
+def server_options() -> dict:
+    """Keyword arguments for uvicorn.Config shared by every worker."""
+    return {
+        "app": APP,
+        "host": SERVER_HOST,
+        "port": SERVER_PORT,
+        "loop": "uvloop" if _available("uvloop") else "asyncio",
+        "http": "httptools" if _available("httptools") else "h11",
+        "backlog": SERVER_BACKLOG,
+        "timeout_keep_alive": SERVER_KEEPALIVE_TIMEOUT,
+        "timeout_graceful_shutdown": SERVER_GRACEFUL_TIMEOUT,
+        "ws_per_message_deflate": SERVER_WS_PER_MESSAGE_DEFLATE,
+        # Zapytania loguje AccessLogMiddleware, log uvicorna byłby duplikatem
+        "access_log": False,
+        "proxy_headers": True,
+    }
+
+
+class DrainingServer(uvicorn.Server):
+    """
+    uvicorn server that keeps serving for `drain_delay` seconds after SIGTERM
+    so the load balancer can take the instance out of rotation first, then
+    shuts down as usual: it stops accepting connections, lets in-flight
+    requests finish within the graceful timeout and runs the app's shutdown
+    (which waits for in-flight user service calls).
+    """
+
+    def __init__(self, config: uvicorn.Config, drain_delay: float = SERVER_DRAIN_DELAY):
+        super().__init__(config)
+        self.drain_delay = drain_delay
+        self.drain_until: float | None = None
+
+    def handle_exit(self, sig: int, frame) -> None:
+        if sig == signal.SIGTERM and self.drain_delay > 0 and self.drain_until is None:
+            logger.info("Draining for %.1f s before shutting down", self.drain_delay)
+            self.drain_until = time.monotonic() + self.drain_delay
+            return
+        super().handle_exit(sig, frame)
+
+    async def on_tick(self, counter: int) -> bool:
+        if self.drain_until is not None and time.monotonic() >= self.drain_until:
+            return True
+        return await super().on_tick(counter)
+
+
+def _reuse_port_socket(host: str, port: int) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    return sock
+
+
+def _run_worker(options: dict, sock: socket.socket | None) -> None:
+    if sock is None:
+        # Każdy worker ma własne gniazdo; jądro rozkłada połączenia między nimi równo
+        sock = _reuse_port_socket(options["host"], options["port"])
+    DrainingServer(uvicorn.Config(**options)).run(sockets=[sock])
+
+
+class Supervisor:
+    """
+    Runs `workers` server processes, restarts any that die, and on
+    SIGTERM/SIGINT passes the signal on and waits for them to drain. Without
+    a shared `sock` each worker listens on its own SO_REUSEPORT socket.
+    """
+
+    def __init__(self, options: dict, workers: int, sock: socket.socket | None = None):
+        self.options = options
+        self.workers = workers
+        self.sock = sock
+        self.processes: list[multiprocessing.process.BaseProcess] = []
+        self.should_exit = False
+        self._context = multiprocessing.get_context("spawn")
+
+    def _spawn(self) -> multiprocessing.process.BaseProcess:
+        process = self._context.Process(
+            target=_run_worker, args=(self.options, self.sock)
+        )
+        process.start()
+        return process
+
+    def _handle_exit(self, sig: int, frame) -> None:
+        self.should_exit = True
+        for process in self.processes:
+            if process.is_alive():
+                os.kill(process.pid, sig)
+
+    def run(self) -> None:
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(sig, self._handle_exit)
+        logger.info("Started supervisor process [%d]", os.getpid())
+        self.processes = [self._spawn() for _ in range(self.workers)]
+        while not self.should_exit:
+            for index, process in enumerate(self.processes):
+                if not process.is_alive() and not self.should_exit:
+                    logger.warning(
+                        "Worker [%d] exited with %s, restarting",
+                        process.pid,
+                        process.exitcode,
+                    )
+                    self.processes[index] = self._spawn()
+            time.sleep(0.5)
+
+        deadline = time.monotonic() + SERVER_DRAIN_DELAY + SERVER_GRACEFUL_TIMEOUT + 10
+        for process in self.processes:
+            process.join(max(deadline - time.monotonic(), 0))
+            if process.is_alive():
+                logger.error(
+                    "Worker [%d] did not stop in time, killing it", process.pid
+                )
+                process.kill()
+                process.join()
+        logger.info("Stopped supervisor process [%d]", os.getpid())
+
+
+def main() -> None:
+    # Snapshoty metryk sprzed tej chwili są z poprzedniego uruchomienia
+    os.environ[RUN_STARTED_ENV] = str(time.time())
+    options = server_options()
+    workers = SERVER_WORKERS or cpu_limit()
+    # Config konfiguruje też logowanie uvicorna, więc tworzymy go przed pierwszym logiem
+    config = uvicorn.Config(**options, workers=workers)
+    reuse_port = SERVER_REUSE_PORT and workers > 1
+    logger.info(
+        "Serving with %d worker(s), loop=%s, http=%s, reuse_port=%s",
+        workers,
+        options["loop"],
+        options["http"],
+        reuse_port,
+    )
+    if workers == 1:
+        DrainingServer(config).run()
+    elif reuse_port:
+        # Zajęty port ma zatrzymać start od razu, a nie restartować workery w kółko
+        _reuse_port_socket(SERVER_HOST, SERVER_PORT).close()
+        Supervisor(options, workers).run()
+    else:
+        Supervisor(options, workers, config.bind_socket()).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+import asyncio
+from collections.abc import Awaitable, Callable, Hashable
+from typing import TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key into a single in-flight call.
+    The call runs in its own task, so cancelling any one waiter (including the
+    one that started it) does not affect the others; the call itself is only
+    cancelled once every waiter has gone away.
+    """
+
+    def __init__(self):
+        self._calls: dict[Hashable, asyncio.Task] = {}
+        self._waiters: dict[Hashable, int] = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._calls
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        task = self._calls.get(key)
+        if task is None:
+            self.calls += 1
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            self._waiters[key] = 0
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            self.coalesced += 1
+
+        self._waiters[key] += 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if not task.done() and self._waiters.get(key) == 1:
+                task.cancel()
+            raise
+        finally:
+            if self._calls.get(key) is task:
+                self._waiters[key] -= 1
+
+    def _forget(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+            del self._waiters[key]
+        # Odbieramy wyjątek, żeby asyncio nie zgłaszał go jako nieobsłużonego
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._calls),
+        }
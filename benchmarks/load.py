@@ -0,0 +1,160 @@
+import asyncio
+import itertools
+import math
+import time
+from collections import Counter
+from collections.abc import Awaitable, Callable
+
+import httpx
+
+# Fabryka zapytania: (klient, numer zapytania) -> odpowiedź
+RequestFactory = Callable[[httpx.AsyncClient, int], Awaitable[httpx.Response]]
+
+
+class Recorder:
+    """Latencies and status codes of one measured run."""
+
+    def __init__(self):
+        self.latencies: list[float] = []
+        self.statuses: Counter[str] = Counter()
+        self.started = 0.0
+        self.finished = 0.0
+
+    def record(self, latency: float, status: str) -> None:
+        self.latencies.append(latency)
+        self.statuses[status] += 1
+
+    def summary(self) -> dict:
+        latencies = sorted(self.latencies)
+        elapsed = max(self.finished - self.started, 1e-9)
+        errors = sum(
+            count
+            for status, count in self.statuses.items()
+            if not status.isdigit() or int(status) >= 400
+        )
+        return {
+            "requests": len(latencies),
+            "errors": errors,
+            "duration_s": round(elapsed, 3),
+            "throughput_rps": round(len(latencies) / elapsed, 1),
+            "latency_ms": {
+                "mean": _ms(sum(latencies) / len(latencies)) if latencies else None,
+                "p50": _ms(percentile(latencies, 50)),
+                "p95": _ms(percentile(latencies, 95)),
+                "p99": _ms(percentile(latencies, 99)),
+                "max": _ms(latencies[-1]) if latencies else None,
+            },
+            "status_codes": dict(sorted(self.statuses.items())),
+        }
+
+
+def percentile(ordered: list[float], p: float) -> float | None:
+    """Nearest-rank percentile of an already sorted list."""
+    if not ordered:
+        return None
+    rank = max(math.ceil(p / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def _ms(seconds: float | None) -> float | None:
+    return None if seconds is None else round(seconds * 1000, 3)
+
+
+async def _send(
+    client: httpx.AsyncClient,
+    make_request: RequestFactory,
+    number: int,
+    scheduled: float,
+    recorder: Recorder | None,
+) -> None:
+    try:
+        response = await make_request(client, number)
+        status = str(response.status_code)
+    except httpx.HTTPError as e:
+        status = type(e).__name__
+    if recorder is not None:
+        recorder.record(time.perf_counter() - scheduled, status)
+
+
+async def fixed_concurrency(
+    client: httpx.AsyncClient,
+    make_request: RequestFactory,
+    concurrency: int,
+    duration: float,
+    warmup: float = 0.0,
+) -> Recorder:
+    """
+    Closed loop: `concurrency` workers each send the next request as soon as
+    the previous one completes. Requests finished during `warmup` are not
+    recorded.
+    """
+    recorder = Recorder()
+    numbers = itertools.count()
+    start = time.perf_counter()
+    measure_from = start + warmup
+    deadline = measure_from + duration
+
+    async def worker() -> None:
+        while (now := time.perf_counter()) < deadline:
+            await _send(
+                client,
+                make_request,
+                next(numbers),
+                now,
+                recorder if now >= measure_from else None,
+            )
+
+    recorder.started = measure_from
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    recorder.finished = time.perf_counter()
+    return recorder
+
+
+async def fixed_rate(
+    client: httpx.AsyncClient,
+    make_request: RequestFactory,
+    rate: float,
+    duration: float,
+    warmup: float = 0.0,
+    max_in_flight: int = 10000,
+) -> Recorder:
+    """
+    Open loop: requests start on a fixed schedule of `rate` per second whether
+    or not earlier ones have finished. Latency is measured from the scheduled
+    start, so a stalled gateway shows up as queueing delay instead of being
+    hidden by a slower send rate (coordinated omission).
+    """
+    recorder = Recorder()
+    interval = 1 / rate
+    start = time.perf_counter()
+    measure_from = start + warmup
+    deadline = measure_from + duration
+    in_flight: set[asyncio.Task] = set()
+
+    for number in itertools.count():
+        scheduled = start + number * interval
+        if scheduled >= deadline:
+            break
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if len(in_flight) >= max_in_flight:
+            if scheduled >= measure_from:
+                recorder.record(time.perf_counter() - scheduled, "dropped")
+            continue
+        task = asyncio.create_task(
+            _send(
+                client,
+                make_request,
+                number,
+                scheduled,
+                recorder if scheduled >= measure_from else None,
+            )
+        )
+        in_flight.add(task)
+        task.add_done_callback(in_flight.discard)
+
+    recorder.started = measure_from
+    await asyncio.gather(*in_flight)
+    recorder.finished = time.perf_counter()
+    return recorder
@@ -0,0 +1,447 @@
+"""
+End-to-end gateway benchmark against local stubs.
+
+Starts a stub backend, a stub user service and the gateway (uvicorn or the
+production runner, see --server), drives the chosen scenarios and prints a
+JSON report. Settings of the gateway itself
+(PROXY_STREAMING, USER_CACHE_SIZE, ...) are taken from the environment.
+
+    python -m benchmarks.run --mode concurrency --concurrency 64 --duration 20
+    python -m benchmarks.run --mode rate --rate 2000 --output current.json \\
+        --baseline baseline.json --max-regression 10
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import resource
+import secrets
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import UTC, datetime, timedelta
+
+import grpc
+import httpx
+import jwt
+
+from benchmarks.load import fixed_concurrency, fixed_rate
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCENARIOS = ("api", "get-user", "refresh")
+ALGORITHM = "HS256"
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _children(pid: int) -> list[int]:
+    children = []
+    for task in os.listdir(f"/proc/{pid}/task"):
+        with open(f"/proc/{pid}/task/{task}/children") as file:
+            children.extend(int(child) for child in file.read().split())
+    return children
+
+
+def _process_tree(pid: int) -> list[int]:
+    pids, pending = [], [pid]
+    while pending:
+        current = pending.pop()
+        with contextlib.suppress(OSError):
+            pending.extend(_children(current))
+            pids.append(current)
+    return pids
+
+
+def _usage(pid: int) -> tuple[int, float]:
+    """RSS in bytes and CPU seconds (user + system) of a single process."""
+    with open(f"/proc/{pid}/statm") as file:
+        rss = int(file.read().split()[1]) * PAGE_SIZE
+    with open(f"/proc/{pid}/stat") as file:
+        # Nazwa procesu może zawierać spacje, więc liczymy pola od nawiasu
+        fields = file.read().rsplit(")", 1)[1].split()
+    return rss, (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+
+
+class ResourceSampler:
+    """Samples RSS and CPU of the gateway master process and all its workers."""
+
+    def __init__(self, pid: int, interval: float = 0.25):
+        self.pid = pid
+        self.interval = interval
+        self.rss: list[int] = []
+        self._cpu: dict[int, float] = {}
+        self._task: asyncio.Task | None = None
+
+    def _sample(self) -> float:
+        total_rss = 0
+        for pid in _process_tree(self.pid):
+            with contextlib.suppress(OSError):
+                rss, cpu = _usage(pid)
+                total_rss += rss
+                self._cpu[pid] = cpu
+        self.rss.append(total_rss)
+        return sum(self._cpu.values())
+
+    async def _loop(self) -> None:
+        while True:
+            self._sample()
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        self._cpu_started = self._sample()
+        self._started = time.perf_counter()
+        self.rss.clear()
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> dict:
+        self._task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await self._task
+        cpu = self._sample() - self._cpu_started
+        elapsed = time.perf_counter() - self._started
+        return {
+            "rss_mb_peak": round(max(self.rss) / 2**20, 1),
+            "rss_mb_mean": round(sum(self.rss) / len(self.rss) / 2**20, 1),
+            "cpu_seconds": round(cpu, 2),
+            "cpu_percent": round(cpu / elapsed * 100, 1),
+        }
+
+
+def make_tokens(secret: str, users: int) -> list[tuple[str, str]]:
+    """(access, refresh) token pairs shaped like the gateway's own tokens."""
+    tokens = []
+    expires = datetime.now(UTC) + timedelta(hours=1)
+    for number in range(users):
+        claims = {
+            "email": f"bench{number}@example.com",
+            "id": number,
+            "role": "user",
+            "exp": expires,
+        }
+        tokens.append(
+            (
+                jwt.encode({**claims, "refresh": False}, secret, ALGORITHM),
+                jwt.encode({**claims, "refresh": True}, secret, ALGORITHM),
+            )
+        )
+    return tokens
+
+
+def scenario_request(name: str, tokens: list[tuple[str, str]]):
+    def bearer(number: int, refresh: bool = False) -> dict[str, str]:
+        token = tokens[number % len(tokens)][1 if refresh else 0]
+        return {"Authorization": f"Bearer {token}"}
+
+    if name == "api":
+        return lambda client, number: client.get(
+            f"/api/bench/items/{number % 100}", headers=bearer(number)
+        )
+    if name == "get-user":
+        return lambda client, number: client.get(
+            "/auth/get-user", headers=bearer(number)
+        )
+    if name == "refresh":
+        return lambda client, number: client.post(
+            "/auth/refresh", headers=bearer(number, refresh=True)
+        )
+    raise ValueError(f"Unknown scenario: {name}")
+
+
+def _spawn(args: list[str], env: dict[str, str], log: str) -> subprocess.Popen:
+    with open(log, "w") as file:
+        return subprocess.Popen(
+            [sys.executable, *args],
+            cwd=ROOT,
+            env=env,
+            stdout=file,
+            stderr=subprocess.STDOUT,
+        )
+
+
+async def _wait_http(url: str, process: subprocess.Popen, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"{process.args} exited with {process.returncode}")
+            with contextlib.suppress(httpx.HTTPError):
+                await client.get(url)
+                return
+            await asyncio.sleep(0.1)
+    raise TimeoutError(f"{url} did not come up within {timeout}s")
+
+
+async def _wait_grpc(target: str, timeout: float) -> None:
+    async with grpc.aio.insecure_channel(target) as channel:
+        await asyncio.wait_for(channel.channel_ready(), timeout)
+
+
+def compare(current: dict, baseline: dict, max_regression: float) -> dict:
+    """Relative change per scenario; flags throughput drops and p99 increases."""
+    comparison = {}
+    for name, result in current["scenarios"].items():
+        before = baseline.get("scenarios", {}).get(name)
+        if before is None:
+            continue
+        entry = {}
+        for metric, now, then, worse_when_higher in (
+            (
+                "throughput_rps",
+                result["throughput_rps"],
+                before["throughput_rps"],
+                False,
+            ),
+            ("p50_ms", result["latency_ms"]["p50"], before["latency_ms"]["p50"], True),
+            ("p99_ms", result["latency_ms"]["p99"], before["latency_ms"]["p99"], True),
+        ):
+            if not now or not then:
+                continue
+            change = (now - then) / then * 100
+            regression = (
+                change > max_regression
+                if worse_when_higher
+                else (-change > max_regression)
+            )
+            entry[metric] = {
+                "baseline": then,
+                "current": now,
+                "change_pct": round(change, 1),
+                "regression": regression,
+            }
+        comparison[name] = entry
+    return comparison
+
+
+async def run(args: argparse.Namespace) -> dict:
+    backend_port, user_service_port, gateway_port = (free_port() for _ in range(3))
+    secret = secrets.token_hex(32)
+    state_dir = tempfile.mkdtemp(prefix="gateway-bench-")
+    env = {
+        **os.environ,
+        "SECRET_KEY": secret,
+        "GOOGLE_CLIENT_ID": os.environ.get("GOOGLE_CLIENT_ID", "bench"),
+        "GOOGLE_CLIENT_SECRET": os.environ.get("GOOGLE_CLIENT_SECRET", "bench"),
+        "BACKEND_URL": f"http://127.0.0.1:{backend_port}",
+        "USER_SERVICE_URL": f"127.0.0.1:{user_service_port}",
+        # Stan współdzielony przez workery nie może mieszać się z innymi uruchomieniami
+        "RATE_LIMIT_PATH": os.path.join(state_dir, "ratelimit"),
+        "METRICS_DIR": os.path.join(state_dir, "metrics"),
+    }
+    env.pop("SERVICE_INSTANCES", None)
+
+    processes = [
+        _spawn(
+            [
+                "-m",
+                "benchmarks.stubs",
+                "backend",
+                "--port",
+                str(backend_port),
+                "--latency-ms",
+                str(args.backend_latency_ms),
+                "--payload-bytes",
+                str(args.payload_bytes),
+            ],
+            env,
+            os.path.join(state_dir, "backend.log"),
+        ),
+        _spawn(
+            [
+                "-m",
+                "benchmarks.stubs",
+                "user-service",
+                "--port",
+                str(user_service_port),
+                "--latency-ms",
+                str(args.user_service_latency_ms),
+            ],
+            env,
+            os.path.join(state_dir, "user-service.log"),
+        ),
+    ]
+    if args.server == "runner":
+        gateway_args = ["-m", "app.server"]
+        env.update(
+            SERVER_HOST="127.0.0.1",
+            SERVER_PORT=str(gateway_port),
+            SERVER_WORKERS=str(args.workers),
+        )
+    else:
+        gateway_args = [
+            "-m",
+            "uvicorn",
+            "app.main:app",
+            "--host",
+            "127.0.0.1",
+            "--port",
+            str(gateway_port),
+            "--workers",
+            str(args.workers),
+            "--log-level",
+            "warning",
+            "--no-access-log",
+        ]
+    gateway = _spawn(gateway_args, env, os.path.join(state_dir, "gateway.log"))
+    processes.append(gateway)
+
+    base_url = f"http://127.0.0.1:{gateway_port}"
+    try:
+        await _wait_http(f"http://127.0.0.1:{backend_port}/", processes[0], 30)
+        await _wait_grpc(f"127.0.0.1:{user_service_port}", 30)
+        await _wait_http(f"{base_url}/test", gateway, 60)
+
+        tokens = make_tokens(secret, args.users)
+        limits = httpx.Limits(
+            max_connections=args.concurrency if args.mode == "concurrency" else None,
+            max_keepalive_connections=args.concurrency,
+        )
+        scenarios = {}
+        async with httpx.AsyncClient(
+            base_url=base_url, limits=limits, timeout=args.timeout
+        ) as client:
+            for name in args.scenarios:
+                make_request = scenario_request(name, tokens)
+                sampler = ResourceSampler(gateway.pid)
+                cpu_before = resource.getrusage(resource.RUSAGE_SELF)
+                sampler.start()
+                if args.mode == "concurrency":
+                    recorder = await fixed_concurrency(
+                        client,
+                        make_request,
+                        args.concurrency,
+                        args.duration,
+                        args.warmup,
+                    )
+                else:
+                    recorder = await fixed_rate(
+                        client, make_request, args.rate, args.duration, args.warmup
+                    )
+                result = recorder.summary()
+                result["gateway"] = await sampler.stop()
+                cpu_after = resource.getrusage(resource.RUSAGE_SELF)
+                # Nasycony generator zaniża wyniki, więc raportujemy też jego CPU
+                result["load_generator_cpu_percent"] = round(
+                    (
+                        cpu_after.ru_utime
+                        + cpu_after.ru_stime
+                        - cpu_before.ru_utime
+                        - cpu_before.ru_stime
+                    )
+                    / (args.duration + args.warmup)
+                    * 100,
+                    1,
+                )
+                scenarios[name] = result
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        if args.keep_logs:
+            print(f"Logs kept in {state_dir}", file=sys.stderr)
+        else:
+            shutil.rmtree(state_dir, ignore_errors=True)
+
+    return {
+        "timestamp": datetime.now(UTC).isoformat(timespec="seconds"),
+        "host": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "config": {
+            "mode": args.mode,
+            "concurrency": args.concurrency if args.mode == "concurrency" else None,
+            "rate": args.rate if args.mode == "rate" else None,
+            "duration_s": args.duration,
+            "warmup_s": args.warmup,
+            "server": args.server,
+            "workers": args.workers,
+            "users": args.users,
+            "backend_latency_ms": args.backend_latency_ms,
+            "user_service_latency_ms": args.user_service_latency_ms,
+            "payload_bytes": args.payload_bytes,
+        },
+        "scenarios": scenarios,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS)
+    )
+    parser.add_argument(
+        "--mode", choices=["concurrency", "rate"], default="concurrency"
+    )
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--rate", type=float, default=500.0, help="requests per second")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--warmup", type=float, default=2.0)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument(
+        "--server",
+        choices=["uvicorn", "runner"],
+        default="uvicorn",
+        help="plain `uvicorn --workers` or the production runner (python -m app.server)",
+    )
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--backend-latency-ms", type=float, default=0.0)
+    parser.add_argument("--user-service-latency-ms", type=float, default=0.0)
+    parser.add_argument("--payload-bytes", type=int, default=1024)
+    parser.add_argument(
+        "--keep-logs", action="store_true", help="keep stub and gateway logs"
+    )
+    parser.add_argument("--output", help="write the report here instead of stdout")
+    parser.add_argument("--baseline", help="report of an earlier run to compare with")
+    parser.add_argument(
+        "--max-regression",
+        type=float,
+        default=10.0,
+        help="percent; exit with status 1 if throughput or p50/p99 get worse by more",
+    )
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    failed = False
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        report["comparison"] = compare(report, baseline, args.max_regression)
+        # Porównanie z innym obciążeniem jest mało warte, więc zaznaczamy to w raporcie
+        report["baseline_config_differs"] = report["config"] != baseline.get("config")
+        failed = any(
+            metric["regression"]
+            for scenario in report["comparison"].values()
+            for metric in scenario.values()
+        )
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output + "\n")
+    else:
+        print(output)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
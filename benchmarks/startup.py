@@ -0,0 +1,200 @@
+"""
+Gateway cold start benchmark against a local stub user service.
+
+Measures how long `import app.main` takes in a fresh interpreter and how long
+uvicorn takes from launch until the first response and until every worker
+has finished its startup. Gateway settings are taken from the environment.
+
+    python -m benchmarks.startup --workers 4 --runs 5
+    python -m benchmarks.startup --import-runs 20 --runs 0 --output startup.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import secrets
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import UTC, datetime
+
+import httpx
+
+from benchmarks.run import ROOT, _spawn, _wait_grpc, free_port
+
+IMPORT_SNIPPET = (
+    "import time; started = time.perf_counter(); import app.main; "
+    "print(time.perf_counter() - started)"
+)
+# Każdy worker uvicorna loguje to po zakończeniu lifespan
+STARTUP_COMPLETE = "Application startup complete."
+
+
+def _summary(samples: list[float]) -> dict:
+    if not samples:
+        return {}
+    return {
+        "runs": len(samples),
+        "median_ms": round(statistics.median(samples) * 1000, 1),
+        "min_ms": round(min(samples) * 1000, 1),
+        "max_ms": round(max(samples) * 1000, 1),
+    }
+
+
+def _workers_ready(log: str) -> int:
+    with open(log) as file:
+        return file.read().count(STARTUP_COMPLETE)
+
+
+def measure_import(env: dict[str, str], runs: int) -> list[float]:
+    """Seconds `import app.main` takes, each run in a new interpreter."""
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", IMPORT_SNIPPET],
+            cwd=ROOT,
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        samples.append(float(output.split()[-1]))
+    return samples
+
+
+async def measure_ready(
+    env: dict[str, str], workers: int, log: str, timeout: float
+) -> tuple[float, float]:
+    """Seconds from launching uvicorn to the first response and to all workers ready."""
+    port = free_port()
+    started = time.perf_counter()
+    gateway = _spawn(
+        [
+            "-m",
+            "uvicorn",
+            "app.main:app",
+            "--host",
+            "127.0.0.1",
+            "--port",
+            str(port),
+            "--workers",
+            str(workers),
+            "--log-level",
+            "info",
+            "--no-access-log",
+        ],
+        env,
+        log,
+    )
+    first_response = all_ready = None
+    deadline = started + timeout
+    try:
+        async with httpx.AsyncClient(timeout=1.0) as client:
+            while first_response is None or all_ready is None:
+                if gateway.poll() is not None:
+                    raise RuntimeError(f"Gateway exited with {gateway.returncode}")
+                if time.perf_counter() > deadline:
+                    raise TimeoutError(f"Gateway was not ready within {timeout}s")
+                if first_response is None:
+                    try:
+                        await client.get(f"http://127.0.0.1:{port}/test")
+                        first_response = time.perf_counter() - started
+                    except httpx.HTTPError:
+                        pass
+                if all_ready is None and _workers_ready(log) >= workers:
+                    all_ready = time.perf_counter() - started
+                await asyncio.sleep(0.01)
+    finally:
+        gateway.terminate()
+        try:
+            gateway.wait(10)
+        except subprocess.TimeoutExpired:
+            gateway.kill()
+    return first_response, all_ready
+
+
+async def run(args: argparse.Namespace) -> dict:
+    state_dir = tempfile.mkdtemp(prefix="gateway-startup-")
+    user_service_port = free_port()
+    env = {
+        **os.environ,
+        "SECRET_KEY": os.environ.get("SECRET_KEY", secrets.token_hex(32)),
+        "GOOGLE_CLIENT_ID": os.environ.get("GOOGLE_CLIENT_ID", "bench"),
+        "GOOGLE_CLIENT_SECRET": os.environ.get("GOOGLE_CLIENT_SECRET", "bench"),
+        "BACKEND_URL": os.environ.get("BACKEND_URL", "http://127.0.0.1:9"),
+        "USER_SERVICE_URL": f"127.0.0.1:{user_service_port}",
+        "RATE_LIMIT_PATH": os.path.join(state_dir, "ratelimit"),
+        "METRICS_DIR": os.path.join(state_dir, "metrics"),
+        # Prefetch idzie w tle i wymaga dostępu do Google, więc domyślnie go pomijamy
+        "OIDC_PREFETCH": os.environ.get("OIDC_PREFETCH", "false"),
+    }
+    env.pop("SERVICE_INSTANCES", None)
+
+    user_service = _spawn(
+        ["-m", "benchmarks.stubs", "user-service", "--port", str(user_service_port)],
+        env,
+        os.path.join(state_dir, "user-service.log"),
+    )
+    first_response, all_ready = [], []
+    try:
+        await _wait_grpc(f"127.0.0.1:{user_service_port}", 30)
+        imports = measure_import(env, args.import_runs)
+        for number in range(args.runs):
+            log = os.path.join(state_dir, f"gateway-{number}.log")
+            first, ready = await measure_ready(env, args.workers, log, args.timeout)
+            first_response.append(first)
+            all_ready.append(ready)
+    finally:
+        user_service.terminate()
+        try:
+            user_service.wait(10)
+        except subprocess.TimeoutExpired:
+            user_service.kill()
+        if args.keep_logs:
+            print(f"Logs kept in {state_dir}", file=sys.stderr)
+        else:
+            shutil.rmtree(state_dir, ignore_errors=True)
+
+    return {
+        "timestamp": datetime.now(UTC).isoformat(timespec="seconds"),
+        "host": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "config": {"workers": args.workers},
+        "import": _summary(imports),
+        "first_response": _summary(first_response),
+        "all_workers_ready": _summary(all_ready),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--runs", type=int, default=5, help="gateway launches")
+    parser.add_argument("--import-runs", type=int, default=10)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument(
+        "--keep-logs", action="store_true", help="keep stub and gateway logs"
+    )
+    parser.add_argument("--output", help="write the report here instead of stdout")
+    args = parser.parse_args()
+
+    output = json.dumps(asyncio.run(run(args)), indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Local stand-ins for the gateway's dependencies.
+
+    python -m benchmarks.stubs backend --port 9001 --latency-ms 5 --payload-bytes 2048
+    python -m benchmarks.stubs user-service --port 9002 --latency-ms 1
+"""
+
+import argparse
+import asyncio
+
+import grpc
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.routing import Route
+
+from app.routers.auth.proto_gen import (
+    user_pb2,
+    user_service_pb2,
+    user_service_pb2_grpc,
+)
+
+
+def create_backend(latency: float, payload_bytes: int) -> Starlette:
+    """HTTP backend answering every path after `latency` seconds with a fixed body."""
+    payload = b"x" * payload_bytes
+
+    async def handle(request: Request) -> Response:
+        await request.body()
+        if latency:
+            await asyncio.sleep(latency)
+        return Response(payload, media_type="application/octet-stream")
+
+    return Starlette(
+        routes=[
+            Route(
+                "/{path:path}",
+                handle,
+                methods=["GET", "HEAD", "POST", "PUT", "DELETE", "PATCH"],
+            )
+        ]
+    )
+
+
+class UserService(user_service_pb2_grpc.UserServiceServicer):
+    """Answers every lookup with an existing user after `latency` seconds."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    async def _wait(self) -> None:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    async def GetUserByEmail(self, request, context):
+        await self._wait()
+        return user_pb2.User(
+            email=request.email, role="user", firstName="Bench", lastName="User"
+        )
+
+    async def BatchGetUsersByEmail(self, request, context):
+        await self._wait()
+        return user_service_pb2.BatchGetUsersByEmailResponse(
+            users=[
+                user_pb2.User(
+                    email=email, role="user", firstName="Bench", lastName="User"
+                )
+                for email in request.emails
+            ]
+        )
+
+    async def AuthenticateWithGoogle(self, request, context):
+        await self._wait()
+        return user_service_pb2.AuthenticateWithGoogleResponse(
+            user=user_pb2.User(
+                email=request.user.email,
+                role="user",
+                firstName=request.user.firstName,
+                lastName=request.user.lastName,
+            ),
+            is_new_user=False,
+        )
+
+    async def Create(self, request, context):
+        await self._wait()
+        return user_service_pb2.CreateUserResponse(success=True)
+
+    async def Delete(self, request, context):
+        await self._wait()
+        return user_service_pb2.DeleteUserResponse(success=True)
+
+
+async def serve_user_service(port: int, latency: float) -> None:
+    server = grpc.aio.server()
+    user_service_pb2_grpc.add_UserServiceServicer_to_server(
+        UserService(latency), server
+    )
+    server.add_insecure_port(f"127.0.0.1:{port}")
+    await server.start()
+    await server.wait_for_termination()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("stub", choices=["backend", "user-service"])
+    parser.add_argument("--port", type=int, required=True)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--payload-bytes", type=int, default=1024)
+    args = parser.parse_args()
+
+    latency = args.latency_ms / 1000
+    if args.stub == "backend":
+        uvicorn.run(
+            create_backend(latency, args.payload_bytes),
+            host="127.0.0.1",
+            port=args.port,
+            log_level="warning",
+            access_log=False,
+        )
+    else:
+        asyncio.run(serve_user_service(args.port, latency))
+
+
+if __name__ == "__main__":
+    main()
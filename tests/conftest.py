@@ -0,0 +1,22 @@
+import os
+import tempfile
+
+import pytest
+
+# app.config czyta środowisko przy imporcie, więc ustawiamy je przed importem aplikacji
+_state = tempfile.mkdtemp(prefix="api-gateway-tests-")
+os.environ.setdefault("SECRET_KEY", "test-secret-key-0123456789abcdef0123")
+os.environ.setdefault("GOOGLE_CLIENT_ID", "test")
+os.environ.setdefault("GOOGLE_CLIENT_SECRET", "test")
+os.environ.setdefault("GOOGLE_REDIRECT_URI", "http://testserver/auth/callback")
+os.environ.setdefault("FRONTEND_URL", "http://testserver")
+os.environ.setdefault("BACKEND_URL", "http://backend.test")
+os.environ.setdefault("OIDC_PREFETCH", "false")
+os.environ.setdefault("RATE_LIMIT_PATH", os.path.join(_state, "ratelimit"))
+os.environ.setdefault("METRICS_DIR", os.path.join(_state, "metrics"))
+os.environ.setdefault("AUTH_REVOCATION_PATH", os.path.join(_state, "revocations"))
+
+
+@pytest.fixture
+def anyio_backend() -> str:
+    return "asyncio"
@@ -0,0 +1,281 @@
+import httpx
+import pytest
+from starlette.requests import Request
+
+from app.proxy import client as upstream
+from app.proxy import handler
+from app.proxy.cache import (
+    CachedResponse,
+    ResponseCache,
+    conditional_headers,
+    is_storable,
+)
+from app.routers.auth.proto_gen import user_p2p
+
+USER = user_p2p.User(email="a@example.com", role="user")
+
+
+@pytest.fixture
+def cache() -> ResponseCache:
+    return ResponseCache(max_bytes=1 << 20, max_entry_bytes=1 << 10)
+
+
+@pytest.mark.parametrize(
+    ("response_headers", "request_headers", "storable"),
+    [
+        ({"cache-control": "max-age=60"}, {}, True),
+        ({"etag": '"v1"'}, {}, True),
+        ({}, {}, False),
+        ({"cache-control": "private, max-age=60"}, {}, False),
+        ({"cache-control": "no-store"}, {}, False),
+        ({"cache-control": "max-age=60"}, {"Authorization": "Bearer x"}, False),
+        (
+            {"cache-control": "public, no-cache", "etag": '"v1"'},
+            {"Authorization": "x"},
+            True,
+        ),
+        ({"cache-control": "max-age=60", "vary": "*"}, {}, False),
+        ({"cache-control": "max-age=60", "content-encoding": "gzip"}, {}, False),
+        (
+            {
+                "cache-control": "max-age=60",
+                "content-encoding": "gzip",
+                "vary": "Accept-Encoding",
+            },
+            {},
+            True,
+        ),
+    ],
+)
+def test_is_storable(response_headers, request_headers, storable):
+    assert is_storable(200, response_headers, request_headers) is storable
+
+
+@pytest.mark.anyio
+async def test_vary_variants(cache):
+    headers = {"cache-control": "max-age=60", "vary": "Accept-Language"}
+    await cache.store("k", {"Accept-Language": "pl"}, 200, headers, b"pl")
+    await cache.store("k", {"Accept-Language": "en"}, 200, headers, b"en")
+
+    assert cache.lookup("k", {"accept-language": "pl"}).body == b"pl"
+    assert cache.lookup("k", {"accept-language": "en"}).body == b"en"
+    assert cache.lookup("k", {"accept-language": "de"}) is None
+    assert cache.stats()["entries"] == 2
+
+
+@pytest.mark.anyio
+async def test_vary_change_drops_old_variants(cache):
+    headers = {"cache-control": "max-age=60", "vary": "Accept-Language"}
+    await cache.store("k", {"accept-language": "pl"}, 200, headers, b"pl")
+    await cache.store("k", {"accept-language": "pl"}, 200, {"etag": '"b"'}, b"any")
+
+    assert cache.stats()["entries"] == 1
+    assert cache.memory_bytes == 3
+    assert cache.lookup("k", {"accept-language": "en"}).body == b"any"
+
+
+@pytest.mark.anyio
+async def test_store_replaces_entry(cache):
+    headers = {"cache-control": "max-age=60"}
+    await cache.store("k", {}, 200, headers, b"old")
+    await cache.store("k", {}, 200, headers, b"newer")
+
+    assert cache.lookup("k", {}).body == b"newer"
+    assert cache.stats()["entries"] == 1
+    assert cache.memory_bytes == 5
+
+
+@pytest.mark.anyio
+async def test_lru_eviction():
+    cache = ResponseCache(max_bytes=10)
+    headers = {"cache-control": "max-age=60"}
+    await cache.store("a", {}, 200, headers, b"aaaa")
+    await cache.store("b", {}, 200, headers, b"bbbb")
+    cache.lookup("a", {})
+    await cache.store("c", {}, 200, headers, b"cccc")
+
+    assert cache.lookup("b", {}) is None
+    assert cache.lookup("a", {}) is not None
+    assert cache.stats()["evictions"] == 1
+
+
+@pytest.mark.anyio
+async def test_freshen_matching_etag(cache):
+    await cache.store("k", {}, 200, {"cache-control": "no-cache", "etag": '"v1"'}, b"x")
+    entry = cache.lookup("k", {})
+    assert not entry.is_fresh()
+
+    assert cache.freshen(entry, {"ETag": '"v1"', "Cache-Control": "max-age=60"})
+    assert entry.is_fresh()
+    assert cache.lookup("k", {}) is entry
+
+
+@pytest.mark.anyio
+async def test_freshen_other_etag_drops_entry(cache):
+    await cache.store("k", {}, 200, {"cache-control": "no-cache", "etag": '"v1"'}, b"x")
+    entry = cache.lookup("k", {})
+
+    assert not cache.freshen(entry, {"ETag": '"v2"', "Cache-Control": "max-age=60"})
+    assert entry.etag == '"v1"'
+    assert cache.lookup("k", {}) is None
+    assert cache.memory_bytes == 0
+
+
+def test_conditional_headers_replace_client_validators():
+    entry = CachedResponse(
+        200, {"etag": '"v1"', "last-modified": "Mon, 01 Jan 2024 00:00:00 GMT"}, 0
+    )
+    headers = conditional_headers(
+        entry,
+        {"If-None-Match": '"v0"', "if-modified-since": "x", "Accept": "*/*"},
+    )
+    assert headers == {
+        "Accept": "*/*",
+        "If-None-Match": '"v1"',
+        "If-Modified-Since": "Mon, 01 Jan 2024 00:00:00 GMT",
+    }
+
+
+@pytest.mark.anyio
+async def test_spilled_body_gone(tmp_path):
+    cache = ResponseCache(max_bytes=1 << 20, max_entry_bytes=1, spill_dir=str(tmp_path))
+    await cache.store("k", {}, 200, {"cache-control": "max-age=60"}, b"spilled")
+    entry = cache.lookup("k", {})
+    assert await cache.read_body(entry) == b"spilled"
+
+    (tmp_path / entry.path.rsplit("/", 1)[1]).unlink()
+    assert await cache.read_body(entry) is None
+    assert cache.lookup("k", {}) is None
+    assert cache.disk_bytes == 0
+
+
+@pytest.mark.anyio
+async def test_spill_write_error_skips_store(tmp_path):
+    missing = str(tmp_path / "missing")
+    cache = ResponseCache(max_bytes=1 << 20, max_entry_bytes=1, spill_dir=missing)
+    await cache.store("k", {}, 200, {"cache-control": "max-age=60"}, b"spilled")
+
+    assert cache.lookup("k", {}) is None
+    assert cache.disk_bytes == 0
+
+
+class Body(httpx.AsyncByteStream):
+    """Body streamed like a real transport's (a `content=` body arrives already read)."""
+
+    def __init__(self, body: bytes):
+        self.body = body
+
+    async def __aiter__(self):
+        yield self.body
+
+
+class Backend:
+    """
+    Backend with one resource. Conditional requests for an ETag in `current`
+    get a 304 carrying the resource's present ETag.
+    """
+
+    def __init__(self):
+        self.etag = '"v1"'
+        self.body = b"version 1"
+        self.current = {'"v1"'}
+        self.requests: list[httpx.Request] = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        headers = {"cache-control": "public, no-cache", "etag": self.etag}
+        if request.headers.get("if-none-match") in self.current:
+            return httpx.Response(304, headers=headers, stream=Body(b""))
+        return httpx.Response(200, headers=headers, stream=Body(self.body))
+
+    def update(self, etag: str, body: bytes, current: set[str]) -> None:
+        self.etag, self.body, self.current = etag, body, current
+
+
+@pytest.fixture
+def backend(monkeypatch, cache):
+    backend = Backend()
+    monkeypatch.setattr(handler, "response_cache", cache)
+    monkeypatch.setattr(
+        upstream, "_client", httpx.AsyncClient(transport=httpx.MockTransport(backend))
+    )
+    return backend
+
+
+async def get(headers: dict[str, str] | None = None):
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "scheme": "http",
+        "server": ("gateway.test", 80),
+        "root_path": "",
+        "path": "/api/items",
+        "query_string": b"",
+        "headers": [
+            (name.lower().encode(), value.encode())
+            for name, value in {"Authorization": "Bearer x", **(headers or {})}.items()
+        ],
+    }
+    return await handler.forward("items", Request(scope, receive), USER)
+
+
+@pytest.mark.anyio
+async def test_revalidation_without_client_validators(backend):
+    assert (await get()).body == b"version 1"
+    response = await get()
+
+    assert response.status_code == 200
+    assert response.body == b"version 1"
+    assert backend.requests[1].headers.get_list("if-none-match") == ['"v1"']
+    assert len(backend.requests) == 2
+
+
+@pytest.mark.anyio
+async def test_revalidation_client_holds_current(backend):
+    await get()
+    response = await get({"If-None-Match": '"v1"'})
+
+    assert response.status_code == 304
+    assert backend.requests[1].headers.get_list("if-none-match") == ['"v1"']
+
+
+@pytest.mark.anyio
+async def test_revalidation_client_holds_older(backend):
+    await get()
+    response = await get({"If-None-Match": '"v0"'})
+
+    assert response.status_code == 200
+    assert response.body == b"version 1"
+    assert backend.requests[1].headers.get_list("if-none-match") == ['"v1"']
+
+
+@pytest.mark.anyio
+async def test_revalidation_other_etag_refetches(backend, cache):
+    await get()
+    backend.update('"v2"', b"version 2", {'"v1"', '"v2"'})
+    response = await get()
+
+    # 304 z innym ETagiem nie opisuje zapisanego ciała: pełne zapytanie bez walidatorów
+    assert response.status_code == 200
+    assert response.body == b"version 2"
+    assert backend.requests[1].headers.get_list("if-none-match") == ['"v1"']
+    assert "if-none-match" not in backend.requests[2].headers
+    assert cache.stats()["entries"] == 1
+
+    response = await get()
+    assert response.body == b"version 2"
+    assert backend.requests[3].headers.get_list("if-none-match") == ['"v2"']
+
+
+@pytest.mark.anyio
+async def test_revalidation_other_etag_client_validator_passes_through(backend):
+    await get()
+    backend.update('"v2"', b"version 2", {'"v1"', '"v2"'})
+    response = await get({"If-None-Match": '"v2"'})
+
+    assert response.status_code == 304
+    assert response.headers["etag"] == '"v2"'
+    assert backend.requests[2].headers.get_list("if-none-match") == ['"v2"']
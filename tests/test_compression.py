@@ -0,0 +1,132 @@
+import asyncio
+import gzip
+import json
+
+import pytest
+
+from app.proxy.compression import CODECS, CompressionMiddleware, negotiate
+
+BODY = json.dumps({"items": ["x" * 40] * 100}).encode()
+
+
+def buffered_app(body: bytes = BODY, content_type: bytes = b"application/json"):
+    async def app(scope, receive, send):
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [
+                    (b"content-type", content_type),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"etag", b'"v1"'),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
+
+    return app
+
+
+async def call(app, accept_encoding: str, encodings: tuple[str, ...]) -> list[dict]:
+    middleware = CompressionMiddleware(app)
+    middleware.encodings = encodings
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "headers": [(b"accept-encoding", accept_encoding.encode())],
+    }
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        messages.append(message)
+
+    await middleware(scope, receive, send)
+    return messages
+
+
+def headers_of(start: dict) -> dict[str, str]:
+    return {key.decode(): value.decode() for key, value in start["headers"]}
+
+
+def test_negotiate_prefers_server_order_among_equal_q():
+    assert negotiate("gzip, br, zstd", ("zstd", "br", "gzip")) == "zstd"
+    assert negotiate("gzip;q=1, br;q=0.5", ("br", "gzip")) == "gzip"
+    assert negotiate("br;q=0, *", ("br", "gzip")) == "gzip"
+    assert negotiate("identity", ("br", "gzip")) is None
+
+
+@pytest.mark.anyio
+async def test_gzip_round_trip():
+    start, body = await call(buffered_app(), "gzip", ("gzip",))
+    headers = headers_of(start)
+    assert headers["content-encoding"] == "gzip"
+    assert headers["vary"] == "Accept-Encoding"
+    assert headers["etag"] == 'W/"v1"'
+    assert int(headers["content-length"]) == len(body["body"])
+    assert gzip.decompress(body["body"]) == BODY
+
+
+@pytest.mark.anyio
+async def test_brotli_negotiated_when_installed():
+    brotli = pytest.importorskip("brotli")
+    assert "br" in CODECS
+    start, body = await call(buffered_app(), "gzip, br", ("br", "gzip"))
+    assert headers_of(start)["content-encoding"] == "br"
+    assert brotli.decompress(body["body"]) == BODY
+
+
+@pytest.mark.anyio
+async def test_zstd_negotiated_when_installed():
+    zstandard = pytest.importorskip("zstandard")
+    assert "zstd" in CODECS
+    start, body = await call(buffered_app(), "zstd, gzip", ("zstd", "br", "gzip"))
+    assert headers_of(start)["content-encoding"] == "zstd"
+    assert zstandard.ZstdDecompressor().decompress(body["body"]) == BODY
+
+
+@pytest.mark.anyio
+async def test_small_and_binary_bodies_pass_through():
+    for body, content_type in ((b"{}", b"application/json"), (BODY, b"image/png")):
+        start, message = await call(buffered_app(body, content_type), "gzip", ("gzip",))
+        assert "content-encoding" not in headers_of(start)
+        assert message["body"] == body
+
+
+@pytest.mark.anyio
+async def test_streamed_response_start_is_not_held():
+    first_byte = asyncio.Event()
+    messages = []
+
+    async def app(scope, receive, send):
+        # Bez Content-Length, jak SSE przekazywane z backendu
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [(b"content-type", b"text/event-stream")],
+            }
+        )
+        await first_byte.wait()
+        await send({"type": "http.response.body", "body": b"data: 1\n\n"})
+
+    async def send(message):
+        messages.append(message)
+
+    middleware = CompressionMiddleware(app)
+    middleware.encodings = ("gzip",)
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "headers": [(b"accept-encoding", b"gzip")],
+    }
+    task = asyncio.ensure_future(middleware(scope, None, send))
+    await asyncio.sleep(0.01)
+    # Status i nagłówki wychodzą, zanim backend wyśle pierwszy bajt
+    assert [message["type"] for message in messages] == ["http.response.start"]
+    first_byte.set()
+    await task
+    assert "content-encoding" not in headers_of(messages[0])
+    assert messages[1]["body"] == b"data: 1\n\n"
@@ -0,0 +1,22 @@
+import httpx
+import pytest
+
+from app.routers.auth import oidc
+from app.routers.auth.oidc import GoogleOAuth
+
+
+@pytest.mark.anyio
+async def test_one_shot_fetch_retries_until_success(monkeypatch):
+    monkeypatch.setattr(oidc, "RETRY_DELAY", 0)
+    google = GoogleOAuth(refresh_interval=0)
+    calls = []
+
+    async def refresh():
+        calls.append(None)
+        if len(calls) < 3:
+            raise httpx.ConnectError("down")
+
+    monkeypatch.setattr(google, "refresh", refresh)
+    await google._run()
+    assert len(calls) == 3
+    assert google.failures == 2
@@ -0,0 +1,70 @@
+import pytest
+
+from app.ratelimit import RateLimiter, SharedBuckets
+
+
+@pytest.fixture
+def store(tmp_path):
+    buckets = SharedBuckets(str(tmp_path / "ratelimit"), buckets=64)
+    buckets.open()
+    yield buckets
+    buckets.close()
+
+
+def test_burst_then_reject(store):
+    limiter = RateLimiter(store, user_rate=1, user_burst=3, role_rate=0)
+    decisions = [limiter.check("a@example.com", "user") for _ in range(4)]
+    assert [d.allowed for d in decisions] == [True, True, True, False]
+    assert [d.remaining for d in decisions[:3]] == [2, 1, 0]
+    assert decisions[3].retry_after > 0
+    assert limiter.rejected == 1
+
+
+def test_role_rejection_does_not_charge_user(store):
+    limiter = RateLimiter(store, user_rate=1, user_burst=2, role_rate=1, role_burst=1)
+    assert limiter.check("a@example.com", "user").allowed
+    # Rola wyczerpana: kolejne żądania są odrzucane bez zużywania limitu użytkownika
+    for _ in range(5):
+        decision = limiter.check("a@example.com", "user")
+        assert not decision.allowed
+        assert decision.limit == 1
+    assert limiter.rejected == 5
+
+    other = RateLimiter(store, user_rate=1, user_burst=2, role_rate=0)
+    assert other.check("a@example.com", "user").remaining == 0
+
+
+def test_user_rejection_does_not_charge_role(store):
+    limiter = RateLimiter(store, user_rate=1, user_burst=1, role_rate=1, role_burst=3)
+    assert limiter.check("a@example.com", "user").allowed
+    assert not limiter.check("a@example.com", "user").allowed
+
+    other = RateLimiter(store, user_rate=0, role_rate=1, role_burst=3)
+    assert other.check("b@example.com", "user").remaining == 1
+
+
+def test_most_restrictive_decision(store):
+    limiter = RateLimiter(store, user_rate=1, user_burst=5, role_rate=1, role_burst=2)
+    decision = limiter.check("a@example.com", "user")
+    assert decision.allowed
+    assert (decision.limit, decision.remaining) == (2, 1)
+
+
+def test_shared_bucket_keys(tmp_path):
+    # Jeden kubełek: oba klucze dzielą blokadę i sloty
+    store = SharedBuckets(str(tmp_path / "ratelimit"), buckets=1)
+    store.open()
+    try:
+        first, second = store.acquire(("user:a", 1, 1), ("role:user", 1, 1))
+        assert first.allowed and second.allowed
+        first, second = store.acquire(("user:b", 1, 1), ("role:user", 1, 1))
+        assert first.allowed and not second.allowed
+        assert store.acquire(("user:b", 1, 1))[0].allowed
+    finally:
+        store.close()
+
+
+def test_disabled(store):
+    limiter = RateLimiter(store, user_rate=0, role_rate=0)
+    assert not limiter.enabled
+    assert limiter.check("a@example.com", "user") is None
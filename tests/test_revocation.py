@@ -0,0 +1,79 @@
+import time
+
+from app.routers.auth.revocation import RevocationList
+
+
+def revocation_list(tmp_path, ttl: float = 3600) -> RevocationList:
+    return RevocationList(
+        enabled=True, path=str(tmp_path / "revocations"), capacity=1000, ttl=ttl
+    )
+
+
+def test_revoke_reaches_other_workers(tmp_path):
+    first, second = revocation_list(tmp_path), revocation_list(tmp_path)
+    first.refresh()
+    second.refresh()
+
+    first.revoke("A@Example.com")
+    assert "a@example.com" in first
+    assert "a@example.com" not in second
+
+    second.refresh()
+    assert "a@example.com" in second
+    assert "b@example.com" not in second
+
+
+def test_partial_line_read_on_next_refresh(tmp_path):
+    revocations = revocation_list(tmp_path)
+    path = tmp_path / "revocations"
+    path.write_bytes(b"a@example.com\nb@exa")
+    revocations.refresh()
+    assert "a@example.com" in revocations
+    assert "b@exa" not in revocations
+
+    with open(path, "ab") as file:
+        file.write(b"mple.com\n")
+    revocations.refresh()
+    assert "b@example.com" in revocations
+
+
+def test_compact_drops_expired_and_malformed_lines(tmp_path):
+    revocations = revocation_list(tmp_path, ttl=60)
+    path = tmp_path / "revocations"
+    now = time.time()
+    path.write_bytes(
+        f"{int(now) - 120} old@example.com\n"
+        f"{int(now)} new@example.com\n"
+        "x y z\n"
+        "forever@example.com\n"
+        f"{int(now)} tail@exa".encode()
+    )
+    revocations.compact(now)
+
+    assert (
+        path.read_bytes()
+        == (
+            f"{int(now)} new@example.com\nforever@example.com\n{int(now)} tail@exa"
+        ).encode()
+    )
+
+
+def test_refresh_rebuilds_after_replacement(tmp_path):
+    revocations = revocation_list(tmp_path)
+    path = tmp_path / "revocations"
+    path.write_bytes(b"a@example.com\n")
+    revocations.refresh()
+
+    replacement = tmp_path / "replacement"
+    replacement.write_bytes(b"b@example.com\n")
+    replacement.replace(path)
+    revocations.refresh()
+    assert "b@example.com" in revocations
+    assert "a@example.com" not in revocations
+
+
+def test_disabled(tmp_path):
+    revocations = RevocationList(enabled=False, path=str(tmp_path / "revocations"))
+    revocations.revoke("a@example.com")
+    assert "a@example.com" not in revocations
+    assert not (tmp_path / "revocations").exists()
@@ -0,0 +1,141 @@
+import os
+import tomllib
+
+import pytest
+
+from app.proxy.balancer import upstream_pool
+from app.proxy.routes import DEFAULT_CLUSTER, RadixTree, Route, Router, parse
+
+ROUTES = """
+[clusters.orders]
+instances = ["http://orders-1:8000", "http://orders-2:8000"]
+
+[clusters.search]
+instances = ["http://search:8000"]
+strategy = "round_robin"
+
+[[routes]]
+prefix = "/orders"
+cluster = "orders"
+methods = ["GET"]
+timeout = 2
+
+[[routes]]
+prefix = "/orders"
+cluster = "search"
+
+[[routes]]
+prefix = "/orders/archive"
+cluster = "search"
+rewrite = "/archive"
+
+[[routes]]
+prefix = "/"
+host = "*.example.com"
+cluster = "search"
+"""
+
+
+def route(prefix: str) -> Route:
+    return Route(prefix, DEFAULT_CLUSTER, upstream_pool)
+
+
+def test_radix_tree_longest_prefix_first():
+    tree = RadixTree()
+    routes = {prefix: route(prefix) for prefix in ("/", "/ord", "/orders", "/orgs")}
+    for prefix, value in routes.items():
+        tree.insert(prefix, value)
+
+    found = [matches[0].prefix for matches in tree.lookup("/orders/1")]
+    assert found == ["/orders", "/ord", "/"]
+    assert [matches[0].prefix for matches in tree.lookup("/orgs")] == ["/orgs", "/"]
+    assert [matches[0].prefix for matches in tree.lookup("/other")] == ["/"]
+
+
+def test_match():
+    table = parse(tomllib.loads(ROUTES), {})
+
+    get = table.match("/orders/1", "GET")
+    assert get.cluster == "orders"
+    assert get.timeout.read == 2
+    # GET dopuszcza też HEAD
+    assert table.match("/orders/1", "HEAD").cluster == "orders"
+    assert table.match("/orders/1", "POST").cluster == "search"
+
+    archive = table.match("/orders/archive/7", "GET")
+    assert archive.cluster == "search"
+    assert archive.upstream_path("/orders/archive/7") == "/archive/7"
+
+    assert table.match("/users", "GET", "api.example.com:443").cluster == "search"
+    assert table.match("/users", "GET", "example.org") is None
+    assert table.match("/users", "GET") is None
+
+
+def test_parse_reuses_pools():
+    pools = {}
+    first = parse(tomllib.loads(ROUTES), pools)
+    second = parse(tomllib.loads(ROUTES), pools)
+    assert first.match("/orders", "GET").pool is second.match("/orders", "GET").pool
+    assert len(pools) == 2
+
+
+@pytest.mark.parametrize(
+    ("document", "message"),
+    [
+        ({"routes": [{"prefix": "orders"}]}, "prefix must start with /"),
+        ({"routes": [{"prefix": "/a", "cluster": "nope"}]}, "unknown cluster"),
+        ({"routes": [{"prefix": "/a", "weight": 1}]}, "unknown keys"),
+        ({"routes": [{"prefix": "/a", "rewrite": "b"}]}, "rewrite must start with /"),
+        ({"routes": [{"prefix": "/a", "timeout": 0}]}, "timeout must be a positive"),
+        ({"clusters": {"a": {"instances": []}}}, "needs a list of instance URLs"),
+    ],
+)
+def test_parse_errors(document, message):
+    with pytest.raises(ValueError, match=message):
+        parse(document, {})
+
+
+def write(path, text: str) -> None:
+    path.write_text(text)
+    # Ten sam rozmiar i czas modyfikacji wyglądałyby jak niezmieniony plik
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+@pytest.mark.anyio
+async def test_router_reload(tmp_path):
+    path = tmp_path / "routes.toml"
+    write(path, ROUTES)
+    router = Router(str(path), reload_interval=0)
+    orders = router.match("/orders", "GET").pool
+
+    write(path, ROUTES.replace('prefix = "/orders/archive"', 'prefix = "/old"'))
+    await router.reload()
+    assert router.match("/old/1", "GET").cluster == "search"
+    assert router.match("/orders", "GET").pool is orders
+
+    # Błędny plik zostawia poprzednią tabelę
+    write(path, ROUTES + "\n[[routes]]\nprefix = 1\n")
+    with pytest.raises(ValueError):
+        await router.reload()
+    assert router.match("/old/1", "GET").cluster == "search"
+
+
+@pytest.mark.anyio
+async def test_router_reload_drops_unused_pools(tmp_path):
+    path = tmp_path / "routes.toml"
+    write(path, ROUTES)
+    router = Router(str(path), reload_interval=0)
+
+    write(path, '[[routes]]\nprefix = "/"\n')
+    await router.reload()
+    assert router.match("/orders", "GET").cluster == DEFAULT_CLUSTER
+    assert router.table.pools() == [upstream_pool]
+    assert list(router._pools.values()) == [upstream_pool]
+
+
+def test_router_without_file():
+    router = Router("")
+    matched = router.match("/anything", "DELETE")
+    assert matched.cluster == DEFAULT_CLUSTER
+    assert matched.upstream_path("/anything") == "/anything"